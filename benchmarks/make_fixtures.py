@@ -0,0 +1,250 @@
+"""
+Generate synthetic, deterministic fixtures for the offline benchmarks.
+
+Everything is produced from a seeded RNG with NumPy and the standard library
+(no network, no GPU); WebM copies are only encoded when --webm is given and
+ffmpeg is on PATH.
+
+Layout written to OUT_DIR:
+    crawler/output/<channel>/audio/<video>.wav              16 kHz mono int16 "speech-like" audio
+    crawler/output/<channel>/audio_webm/<video>.webm        (--webm only)
+    crawler/output/<channel>/subs/<video>.id.vtt            plain cues (one block per segment)
+    crawler/output/<channel>/subs_rolling/<video>.id.vtt    YouTube auto-caption style rolling cues
+    crawler/output/<channel>/info/video_metadata.jsonl      metadata records as written by extract_channels.py
+    crawler/config.yaml                                     crawler config with every filter enabled
+    work/mono/<channel>/batch_001/corpus/<video>.txt                    Whisper-style transcript
+    work/mono/<channel>/batch_001/output_force_align/<video>_manifest.jsonl
+    work/mono/<channel>/batch_001/output_filter/filtered_<video>_manifest.jsonl   GigaSpeech2 style
+    granary/manifest.jsonl                                  Granary style (offset / duration)
+    fixtures.json                                           generation parameters
+
+Example usage:
+python benchmarks/make_fixtures.py --out /tmp/asr_fixtures --scale small
+python benchmarks/make_fixtures.py --out /tmp/asr_fixtures --channels 4 --videos 50 --min-minutes 5 --max-minutes 30
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import wave
+from pathlib import Path
+
+import numpy as np
+
+SR = 16000
+
+SCALES = {
+    "small": {"channels": 2, "videos": 5, "min_minutes": 1, "max_minutes": 3},
+    "medium": {"channels": 3, "videos": 20, "min_minutes": 2, "max_minutes": 10},
+    "large": {"channels": 4, "videos": 50, "min_minutes": 5, "max_minutes": 30},
+}
+
+SYLLABLES = ["ba", "ka", "la", "ma", "na", "pa", "ra", "sa", "ta", "ya", "di", "ke", "me", "ng", "an", "in", "un", "er"]
+
+
+def make_vocabulary(rng, size=400):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(1, 4))))
+    return sorted(words)
+
+
+def make_sentence(rng, vocab, min_words=4, max_words=14):
+    words = list(rng.choice(vocab, size=rng.integers(min_words, max_words + 1)))
+    if rng.random() < 0.15:
+        words.insert(rng.integers(0, len(words)), str(rng.integers(1, 2025)))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def synth_audio(rng, seconds):
+    """Noise shaped by a ~4 Hz syllable envelope with pauses, so it has speech-like energy structure."""
+    n = int(seconds * SR)
+    t = np.arange(n, dtype=np.float32) / SR
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4.0 * t + rng.uniform(0, np.pi)).astype(np.float32)
+    pauses = np.repeat(rng.random(n // SR + 1) < 0.8, SR)[:n].astype(np.float32)
+    carrier = rng.standard_normal(n).astype(np.float32)
+    tone = np.sin(2 * np.pi * rng.uniform(120, 220) * t).astype(np.float32)
+    signal = (0.6 * carrier + 0.4 * tone) * envelope * pauses
+    return (signal / (np.abs(signal).max() + 1e-9) * 12000).astype(np.int16)
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes(memoryview(samples))
+
+
+def vtt_time(seconds):
+    ms = int(round(seconds * 1000))
+    s, ms = divmod(ms, 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def make_segments(rng, vocab, seconds):
+    """Consecutive (start, end, sentence) segments of 1.5-8 s with small gaps."""
+    segments = []
+    t = rng.uniform(0.0, 1.0)
+    while True:
+        duration = rng.uniform(1.5, 8.0)
+        if t + duration > seconds:
+            break
+        segments.append((round(t, 3), round(t + duration, 3), make_sentence(rng, vocab)))
+        t += duration + rng.uniform(0.05, 0.6)
+    return segments
+
+
+def write_plain_vtt(path, segments):
+    lines = ["WEBVTT", "Kind: captions", "Language: id", ""]
+    for start, end, text in segments:
+        lines += [f"{vtt_time(start)} --> {vtt_time(end)}", text, ""]
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def write_rolling_vtt(path, segments):
+    """Two-line rolling cues with inline word timings and 10 ms transition cues, like YouTube ASR captions."""
+    lines = ["WEBVTT", "Kind: captions", "Language: id", ""]
+    previous = " "
+    for start, end, text in segments:
+        words = text.split()
+        step = (end - start) / len(words)
+        timed = words[0] + "".join(
+            f"<{vtt_time(start + i * step)}><c> {word}</c>" for i, word in enumerate(words[1:], 1)
+        )
+        lines += [f"{vtt_time(start)} --> {vtt_time(end - 0.01)} align:start position:0%", previous, timed, ""]
+        lines += [f"{vtt_time(end - 0.01)} --> {vtt_time(end)} align:start position:0%", text, " ", ""]
+        previous = text
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def asr_noise(rng, vocab, text, rate=0.1):
+    """Corrupt ~rate of the words (substitution / deletion / insertion) to mimic an ASR transcript."""
+    out = []
+    for word in text.split():
+        r = rng.random()
+        if r < rate / 3:
+            out.append(str(rng.choice(vocab)))
+        elif r < 2 * rate / 3:
+            continue
+        elif r < rate:
+            out += [word, str(rng.choice(vocab))]
+        else:
+            out.append(word)
+    return " ".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic audio / subtitle / manifest fixtures for benchmarks.")
+    parser.add_argument("--out", required=True, help="Output directory (replaced if it exists)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Preset sizes, overridable below")
+    parser.add_argument("--channels", type=int, default=None)
+    parser.add_argument("--videos", type=int, default=None, help="Videos per channel")
+    parser.add_argument("--min-minutes", type=float, default=None)
+    parser.add_argument("--max-minutes", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--webm", action="store_true", help="Also encode Opus/WebM copies (needs ffmpeg)")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    params.update(scale=args.scale, seed=args.seed, webm=args.webm)
+
+    out = Path(args.out).resolve()
+    if out.exists():
+        shutil.rmtree(out)
+    rng = np.random.default_rng(args.seed)
+    vocab = make_vocabulary(rng)
+
+    crawler_root = out / "crawler" / "output"
+    granary_lines = []
+    total_seconds = 0.0
+    total_segments = 0
+
+    for c in range(params["channels"]):
+        channel = f"channel{c:02d}"
+        channel_dir = crawler_root / channel
+        batch_dir = out / "work" / "mono" / channel / "batch_001"
+        for sub in ("audio", "subs", "subs_rolling", "info"):
+            (channel_dir / sub).mkdir(parents=True, exist_ok=True)
+        for sub in ("corpus", "output_force_align", "output_filter"):
+            (batch_dir / sub).mkdir(parents=True, exist_ok=True)
+
+        with open(channel_dir / "info" / "video_metadata.jsonl", "w", encoding="utf-8") as meta:
+            for v in range(params["videos"]):
+                video_id = f"{channel[-2:]}vid{v:05d}"
+                seconds = float(rng.uniform(params["min_minutes"], params["max_minutes"]) * 60)
+                segments = make_segments(rng, vocab, seconds)
+                total_seconds += seconds
+                total_segments += len(segments)
+
+                audio_file = channel_dir / "audio" / f"{video_id}.wav"
+                write_wav(audio_file, synth_audio(rng, seconds))
+                if args.webm:
+                    (channel_dir / "audio_webm").mkdir(exist_ok=True)
+                    subprocess.run([
+                        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                        "-i", str(audio_file), "-c:a", "libopus", str(channel_dir / "audio_webm" / f"{video_id}.webm")
+                    ], check=True)
+
+                write_plain_vtt(channel_dir / "subs" / f"{video_id}.id.vtt", segments)
+                write_rolling_vtt(channel_dir / "subs_rolling" / f"{video_id}.id.vtt", segments)
+
+                subtitles = [{"lang": "id", "type": "auto"}]
+                if rng.random() < 0.5:
+                    subtitles.insert(0, {"lang": "id", "type": "manual"})
+                meta.write(json.dumps({
+                    "id": video_id, "channel_id": channel, "language": str(rng.choice(["id", "id", "en", None])),
+                    "title": make_sentence(rng, vocab), "description": make_sentence(rng, vocab, 10, 40),
+                    "tags": [], "categories": ["People & Blogs"], "media_type": "video",
+                    "live_status": "not_live", "duration": int(seconds), "upload_date": "2024%02d%02d" % (
+                        rng.integers(1, 13), rng.integers(1, 29)),
+                    "view_count": int(rng.integers(0, 100000)), "like_count": int(rng.integers(0, 500)),
+                    "subtitles": subtitles,
+                }, ensure_ascii=False) + "\n")
+
+                # GigaSpeech2 work dir: transcript, alignment and filtered manifest
+                reference = " ".join(text for _, _, text in segments)
+                (batch_dir / "corpus" / f"{video_id}.txt").write_text(asr_noise(rng, vocab, reference) + "\n", encoding="utf-8")
+                with open(batch_dir / "output_force_align" / f"{video_id}_manifest.jsonl", "w", encoding="utf-8") as f:
+                    for start, end, text in segments:
+                        f.write(json.dumps({"audio_filepath": str(audio_file), "audio_start_sec": start,
+                                            "duration": round(end - start, 3), "text": text}, ensure_ascii=False) + "\n")
+                with open(batch_dir / "output_filter" / f"filtered_{video_id}_manifest.jsonl", "w", encoding="utf-8") as f:
+                    for start, end, text in segments:
+                        if rng.random() < 0.85:
+                            f.write(json.dumps({"audio_filepath": str(audio_file), "audio_start_sec": start,
+                                                "duration": round(end - start, 3), "text": text}, ensure_ascii=False) + "\n")
+
+                for i, (start, end, text) in enumerate(segments):
+                    granary_lines.append(json.dumps({"audio_filepath": str(audio_file), "offset": start,
+                                                     "duration": round(end - start, 3), "text": text,
+                                                     "segment_id": i}, ensure_ascii=False))
+
+    (out / "granary").mkdir(parents=True, exist_ok=True)
+    (out / "granary" / "manifest.jsonl").write_text("\n".join(granary_lines) + "\n", encoding="utf-8")
+
+    (out / "crawler" / "config.yaml").write_text(json.dumps({
+        "output_dir": str(crawler_root),
+        "subtitle_lang": "id",
+        "filter": {
+            "enable_language_filter": True, "target_language_abbr": ["id", "ind", "indonesian"],
+            "enable_duration_filter": True, "min_duration": 90, "max_duration": 18000,
+            "enable_like_count_filter": True, "min_like_count": 10,
+            "filter_no_subtitle": True, "filter_no_manual_subtitle": False,
+        },
+    }, indent=2), encoding="utf-8")  # JSON is valid YAML
+
+    params.update(audio_hours=round(total_seconds / 3600, 3), segments=total_segments)
+    (out / "fixtures.json").write_text(json.dumps(params, indent=2), encoding="utf-8")
+    print(f"Wrote {params['channels'] * params['videos']} videos ({params['audio_hours']} h, "
+          f"{total_segments} segments) to {out}")
+
+
+if __name__ == "__main__":
+    main()
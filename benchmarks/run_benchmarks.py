@@ -0,0 +1,342 @@
+"""
+Offline benchmarks for the pipeline's Python hot paths.
+
+Runs every benchmark on fixtures from make_fixtures.py, each in a fresh
+subprocess so peak memory is measured per benchmark, and reports best-of-N
+wall time, throughput and peak RSS. Results can be stored as a baseline and
+later runs are compared against it; a throughput drop or memory growth
+beyond --tolerance is flagged and makes the run exit with status 1.
+
+Benchmarks that need ffmpeg are skipped when it is not on PATH. Nothing
+touches the network or a GPU. Benchmarks that rewrite files work on a fresh
+copy of the fixtures for every repetition (the copy is not timed).
+
+Example usage:
+python benchmarks/make_fixtures.py --out /tmp/asr_fixtures --scale small
+python benchmarks/run_benchmarks.py --fixtures /tmp/asr_fixtures --save-baseline benchmarks/baseline.json
+python benchmarks/run_benchmarks.py --fixtures /tmp/asr_fixtures --baseline benchmarks/baseline.json
+python benchmarks/run_benchmarks.py --fixtures /tmp/asr_fixtures --only parse_vtt_rolling,compute_wer
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+for path in (REPO / "crawler" / "Youtube-Download" / "scripts", REPO / "granary", REPO / "utils", REPO / "utils" / "export"):
+    sys.path.insert(0, str(path))
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit, needs_ffmpeg=False):
+    """Register fn(fixtures, scratch, workers) -> (run, prepare|None); run() returns the number of units done."""
+    def register(fn):
+        BENCHMARKS[name] = {"fn": fn, "unit": unit, "needs_ffmpeg": needs_ffmpeg}
+        return fn
+    return register
+
+
+def crawler_channels(output_root):
+    return sorted(p for p in output_root.iterdir() if p.is_dir())
+
+
+def copy_tree(src, dst):
+    if dst.exists():
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst)
+
+
+# ========= slice.py =========
+@benchmark("parse_vtt_plain", "segments")
+def bench_parse_vtt_plain(fx, scratch, workers):
+    import slice as crawler_slice
+    files = [f for ch in crawler_channels(fx / "crawler" / "output") for f in sorted((ch / "subs").glob("*.vtt"))]
+    return (lambda: sum(len(crawler_slice.parse_vtt_file(f)) for f in files)), None
+
+
+@benchmark("parse_vtt_rolling", "segments")
+def bench_parse_vtt_rolling(fx, scratch, workers):
+    import slice as crawler_slice
+    files = [f for ch in crawler_channels(fx / "crawler" / "output") for f in sorted((ch / "subs_rolling").glob("*.vtt"))]
+    return (lambda: sum(len(crawler_slice.parse_rolling_vtt_file(f)) for f in files)), None
+
+
+def slice_jobs(fx, scratch):
+    jobs = []
+    for ch in crawler_channels(fx / "crawler" / "output"):
+        for audio in sorted((ch / "audio").glob("*.wav")):
+            jobs.append((audio, ch / "subs" / f"{audio.stem}.id.vtt", scratch / "segments" / audio.stem))
+    return jobs
+
+
+@benchmark("slice_pydub", "audio_seconds")
+def bench_slice_pydub(fx, scratch, workers):
+    import slice as crawler_slice
+
+    def run():
+        seconds = 0.0
+        for audio, vtt, out_dir in slice_jobs(fx, scratch):
+            segs = crawler_slice.process_audio_with_vtt(audio, vtt, out_dir, 16000, True)
+            seconds += sum(s["end_ms"] - s["start_ms"] for s in segs) / 1000
+        return seconds
+    return run, lambda: shutil.rmtree(scratch / "segments", ignore_errors=True)
+
+
+@benchmark("slice_stream", "audio_seconds", needs_ffmpeg=True)
+def bench_slice_stream(fx, scratch, workers):
+    import slice as crawler_slice
+
+    def run():
+        seconds = 0.0
+        for audio, vtt, out_dir in slice_jobs(fx, scratch):
+            segs = crawler_slice.process_audio_with_vtt_stream(audio, vtt, out_dir, 16000, True)
+            seconds += sum(s["end_ms"] - s["start_ms"] for s in segs) / 1000
+        return seconds
+    return run, lambda: shutil.rmtree(scratch / "segments", ignore_errors=True)
+
+
+# ========= filter.py =========
+def metadata_lines(fx):
+    return sum(1 for ch in crawler_channels(fx / "crawler" / "output") for _ in open(ch / "info" / "video_metadata.jsonl", encoding="utf-8"))
+
+
+@benchmark("filter_info_file", "records")
+def bench_filter_info_file(fx, scratch, workers):
+    import filter as crawler_filter
+    import logging
+    logging.disable(logging.WARNING)
+    config = fx / "crawler" / "config.yaml"
+    n = metadata_lines(fx)
+
+    def run():
+        for ch in crawler_channels(scratch / "output"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                crawler_filter.filter_info_file(config, ch / "info" / "video_metadata.jsonl")
+        return n
+    return run, lambda: copy_tree(fx / "crawler" / "output", scratch / "output")
+
+
+@benchmark("filter_all_channels", "records")
+def bench_filter_all_channels(fx, scratch, workers):
+    import filter as crawler_filter
+    config = fx / "crawler" / "config.yaml"
+    n = metadata_lines(fx)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            crawler_filter.filter_output_root(config, scratch / "output")
+        return n
+    return run, lambda: copy_tree(fx / "crawler" / "output", scratch / "output")
+
+
+# ========= granary/slice_granary.py =========
+@benchmark("granary_cut_decode_once", "segments", needs_ffmpeg=True)
+def bench_granary_cut(fx, scratch, workers):
+    import slice_granary
+    from collections import defaultdict
+    by_src = defaultdict(list)
+    for line in open(fx / "granary" / "manifest.jsonl", encoding="utf-8"):
+        ex = json.loads(line)
+        by_src[Path(ex["audio_filepath"])].append(ex)
+
+    def prepare():
+        shutil.rmtree(scratch / "clips", ignore_errors=True)
+        (scratch / "clips").mkdir(parents=True)
+
+    return (lambda: sum(slice_granary.cut_source(src, entries, scratch / "clips") for src, entries in by_src.items())), prepare
+
+
+# ========= utils/export/compile_segments.py =========
+@benchmark("compile_segments", "segments")
+def bench_compile_segments(fx, scratch, workers):
+    import compile_segments
+    n = sum(1 for m in (fx / "work").glob("**/output_filter/filtered_*_manifest.jsonl") for _ in open(m, encoding="utf-8"))
+
+    def run():
+        argv = ["compile_segments.py", "--work-root", str(fx / "work"), "--out-root", str(scratch / "txt"),
+                "--workers", str(workers), "--full"]
+        with patched_argv(argv), contextlib.redirect_stdout(io.StringIO()):
+            compile_segments.main()
+        return n
+    return run, lambda: shutil.rmtree(scratch / "txt", ignore_errors=True)
+
+
+# ========= utils/compute_wer.py =========
+@benchmark("compute_wer", "words")
+def bench_compute_wer(fx, scratch, workers):
+    import compute_wer
+    pairs = list(compute_wer.find_pairs(fx / "work"))
+    return (lambda: sum(compute_wer.score_pair(txt, manifest)[3] for _, _, txt, manifest in pairs)), None
+
+
+# ========= normalisation scripts =========
+def corpus_dirs(root):
+    return sorted(root.glob("**/corpus"))
+
+
+@benchmark("split_manifest", "files")
+def bench_split_manifest(fx, scratch, workers):
+    import split_manifest
+
+    def run():
+        dirs = corpus_dirs(scratch / "work")
+        with contextlib.redirect_stdout(io.StringIO()):
+            for d in dirs:
+                split_manifest.split_on_punctuation(d)
+        return sum(len(list(d.glob("*.txt"))) for d in dirs)
+    return run, lambda: copy_tree(fx / "work", scratch / "work")
+
+
+@benchmark("normalise_digits", "files")
+def bench_normalise_digits(fx, scratch, workers):
+    import normalise_digits
+
+    def run():
+        dirs = corpus_dirs(scratch / "work")
+        with contextlib.redirect_stdout(io.StringIO()):
+            for d in dirs:
+                normalise_digits.remove_number_lines(d)
+        return sum(len(list(d.glob("*.txt"))) for d in dirs)
+    return run, lambda: copy_tree(fx / "work", scratch / "work")
+
+
+@benchmark("rewrite_transcripts", "files")
+def bench_rewrite_transcripts(fx, scratch, workers):
+    import rewrite_transcripts
+    rules = ["split_punctuation", "remove_digit_lines"]
+
+    def run():
+        files = [f for d in corpus_dirs(scratch / "work") for f in d.glob("*.txt")]
+        for f in files:
+            rewrite_transcripts.rewrite_file(f, rules)
+        return len(files)
+    return run, lambda: copy_tree(fx / "work", scratch / "work")
+
+
+@contextlib.contextmanager
+def patched_argv(argv):
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)  # ru_maxrss is in KiB on Linux
+
+
+def run_child(name, fixtures, repeat, workers):
+    """Run one benchmark in this process and print its result as JSON."""
+    spec = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as scratch:
+        run, prepare = spec["fn"](fixtures, Path(scratch), workers)
+        times = []
+        units = 0
+        for _ in range(repeat):
+            if prepare:
+                prepare()
+            start = time.perf_counter()
+            units = run()
+            times.append(time.perf_counter() - start)
+    best = min(times)
+    print(json.dumps({
+        "name": name, "unit": spec["unit"], "units": round(units, 3),
+        "seconds": round(best, 4), "throughput": round(units / best, 2) if best else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for r in results:
+        base = baseline.get("results", {}).get(r["name"])
+        if not base:
+            r["vs_baseline"] = "new"
+            continue
+        speed = r["throughput"] / base["throughput"] if base["throughput"] else 1.0
+        memory = r["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else 1.0
+        r["vs_baseline"] = f"x{speed:.2f} speed, x{memory:.2f} memory"
+        if speed < 1 - tolerance or memory > 1 + tolerance:
+            regressions.append(r["name"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the pipeline's Python hot paths.")
+    parser.add_argument("--fixtures", required=True, help="Directory written by make_fixtures.py")
+    parser.add_argument("--only", default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark (best time is kept)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for benchmarks that use a pool")
+    parser.add_argument("--baseline", default=None, help="Compare against this baseline JSON")
+    parser.add_argument("--save-baseline", default=None, help="Write results as a new baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown / memory growth")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    fixtures = Path(args.fixtures).resolve()
+    if args.child:
+        run_child(args.child, fixtures, args.repeat, args.workers)
+        return
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {unknown}; available: {list(BENCHMARKS)}")
+    fixture_params = json.loads((fixtures / "fixtures.json").read_text(encoding="utf-8"))
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+
+    results = []
+    for name in names:
+        if BENCHMARKS[name]["needs_ffmpeg"] and not has_ffmpeg:
+            print(f"{name:<26} skipped (ffmpeg not found)")
+            continue
+        proc = subprocess.run(
+            [sys.executable, __file__, "--fixtures", str(fixtures), "--child", name,
+             "--repeat", str(args.repeat), "--workers", str(args.workers)],
+            stdout=subprocess.PIPE, text=True, check=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{name:<26} {result['seconds']:>9.3f} s  {result['throughput']:>12.1f} {result['unit']}/s"
+              f"  peak {result['peak_rss_mb']:>7.1f} MB")
+
+    status = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("fixtures") != fixture_params:
+            print("Warning: baseline was recorded on different fixtures; comparison is not like-for-like")
+        regressions = compare(results, baseline, args.tolerance)
+        for r in results:
+            print(f"{r['name']:<26} {r['vs_baseline']}")
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            status = 1
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps({
+            "fixtures": fixture_params,
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "results": {r["name"]: r for r in results},
+        }, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -75,4 +75,10 @@ if [ "$stage" == 4 ]; then
   python scripts/slice.py --config "$CONFIG_PATH"
 fi
 
+# ========= 🔁 Stage 5: 流水线（元数据 → 过滤 → 下载 → 切分 按视频重叠执行）=========
+if [ "$stage" == 5 ]; then
+  echo "🔁 流水线处理频道..."
+  python scripts/pipeline.py --config "$CONFIG_PATH" --channels "$CHANNEL_ID"
+fi
+
 echo "✅ 阶段 $stage 执行完毕"
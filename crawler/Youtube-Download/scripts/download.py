@@ -1,8 +1,69 @@
 import json
 import yaml
+import random
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from urllib.parse import urlparse
 import argparse
+import sys
+
+from state_db import open_state_db
+
+# 指标模块在仓库根目录 utils/metrics.py（与 GigaSpeech2 / Granary 脚本共用）
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "utils"))
+from metrics import get_metrics, setup as setup_metrics  # noqa: E402
+
+
+def choose_subtitle(subtitles, subtitle_lang):
+    """
+    选择目标语言字幕：优先人工字幕，其次自动字幕；没有则返回 None
+    """
+    for sub_type in ("manual", "auto"):
+        for sub in subtitles or []:
+            if sub.get("lang") == subtitle_lang and sub.get("type") == sub_type:
+                return sub
+    return None
+
+
+def resume_offset(audio_file):
+    """
+    下载前已在磁盘上的字节数：成品已存在（yt-dlp 会跳过）返回 None，否则为续传的 .part 大小
+    """
+    if audio_file.exists():
+        return None
+    part_file = audio_file.with_name(audio_file.name + ".part")
+    return part_file.stat().st_size if part_file.exists() else 0
+
+
+def count_downloaded_bytes(audio_file, offset):
+    """只统计本次运行实际下载的字节（跳过的文件与续传前已有的部分不计）"""
+    if offset is not None:
+        get_metrics().count("bytes_downloaded", max(audio_file.stat().st_size - offset, 0))
+
+
+def load_pending_infos(state_db, channel, channel_info_dir):
+    """
+    待下载视频的元数据：启用状态库时只查询通过过滤且未下载的行，否则读取已过滤文件
+    """
+    filtered_info_file = channel_info_dir / "video_metadata-filtered.jsonl"
+    if state_db:
+        infos = state_db.pending_downloads(channel)
+        if not infos and filtered_info_file.exists() and not state_db.has_filter_verdicts(channel):
+            print(f"⚠️ 状态库中没有 {channel} 的过滤结果，但存在 {filtered_info_file}；"
+                  f"请先运行 state_db.py import 或重新运行过滤")
+        return infos
+
+    infos = []
+    with open(filtered_info_file, encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            try:
+                infos.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"❌ 跳过：第 {line_num} 行不是合法 JSON")
+    return infos
 
 
 def download_audio_and_subtitles(config_path):
@@ -32,18 +93,11 @@ def download_audio_and_subtitles(config_path):
     else:
         downloaded_ids = set()
 
-    # === 4️⃣ 已过滤文件 ===
-    filtered_info_file = channel_info_dir / "video_metadata-filtered.jsonl"
-    with open(filtered_info_file, encoding="utf-8") as f:
-        lines = f.readlines()
-
-    for line_num, line in enumerate(lines, 1):
-        try:
-            info = json.loads(line)
-        except json.JSONDecodeError:
-            print(f"❌ 跳过：第 {line_num} 行不是合法 JSON")
-            continue
+    # === 4️⃣ 待下载视频 ===
+    state_db = open_state_db(config)
+    infos = load_pending_infos(state_db, channel, channel_info_dir)
 
+    for info in infos:
         video_id = info["id"]
         if video_id in downloaded_ids:
             print(f"⏭️ 已下载，跳过：{video_id}")
@@ -54,32 +108,24 @@ def download_audio_and_subtitles(config_path):
         # === 5️⃣ 下载音频 ===
         audio_output = channel_audio_dir / f"{video_id}.webm"
         print(f"🎵 正在下载音频：{video_id}")
+        metrics = get_metrics()
+        offset = resume_offset(audio_output)
         try:
-            subprocess.run([
-                "yt-dlp",
-                "-f", "ba",
-                "--cookies", COOKIE_FILE,
-                "-o", str(audio_output),
-                video_url
-            ], check=True)
+            with metrics.item("download", video_id):
+                subprocess.run([
+                    "yt-dlp",
+                    "-f", "ba",
+                    "--cookies", COOKIE_FILE,
+                    "-o", str(audio_output),
+                    video_url
+                ], check=True)
+                count_downloaded_bytes(audio_output, offset)
         except subprocess.CalledProcessError:
             print(f"⚠️ 音频下载失败：{video_id}")
             continue  # 音频没下成功，整个跳过，不写记录
 
         # === 6️⃣ 下载字幕（最多 1 个） ===
-        subtitles = info.get("subtitles", [])
-        target_sub = None
-
-        for sub in subtitles:
-            if sub.get("lang") == subtitle_lang and sub.get("type") == "manual":
-                target_sub = sub
-                break
-
-        if not target_sub:
-            for sub in subtitles:
-                if sub.get("lang") == subtitle_lang and sub.get("type") == "auto":
-                    target_sub = sub
-                    break
+        target_sub = choose_subtitle(info.get("subtitles", []), subtitle_lang)
 
         if target_sub:
             lang = target_sub["lang"]
@@ -104,15 +150,213 @@ def download_audio_and_subtitles(config_path):
         with open(downloaded_list_file, "a", encoding="utf-8") as f:
             f.write(f"{video_id}\n")
         downloaded_ids.add(video_id)
+        if state_db:
+            state_db.mark_downloaded(channel, video_id, "done", audio_output.stat().st_size)
         print(f"✅ 已记录下载完成：{video_id}")
 
+    if state_db:
+        state_db.close()
     print("🎉 所有音频与字幕下载任务已完成")
 
 
+class HostRateLimiter:
+    """
+    按 host 限制请求启动频率（线程安全）：
+    同一 host 的两次请求之间至少间隔 1 / requests_per_second 秒
+    """
+
+    def __init__(self, requests_per_second):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if not self.min_interval:
+            return
+        host = urlparse(url).hostname
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def is_subtitle_error(err):
+    """yt-dlp 在只有字幕下载失败时抛出 "Unable to download video subtitles ..."（此时音频尚未开始下载）"""
+    return "Unable to download video subtitles" in str(err)
+
+
+def download_one_video(video_id, target_sub, audio_dir, subs_dir, cookie_file,
+                       limiter, max_retries=3, backoff_base=5.0):
+    """
+    单次提取同时下载音频（-f ba）和选中的 VTT 字幕
+    - 音频 / 网络错误按指数退避重试（backoff_base * 2^n 秒 + 随机抖动）
+    - yt-dlp 会续传残留的 .part 文件，已下完的文件直接跳过
+    - 字幕失败时立即退回只下载音频，不退避、不重复请求（与串行模式一致：字幕失败不影响记录）
+    返回 (是否成功, 说明)
+    yt_dlp 只在并发模式下导入，串行模式只需要 yt-dlp 命令行
+    """
+    import yt_dlp
+    from yt_dlp.utils import DownloadError, ExtractorError
+
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
+    ydl_opts = {
+        "format": "ba",
+        "cookiefile": cookie_file,
+        "outtmpl": {
+            "default": str(audio_dir / f"{video_id}.webm"),
+            "subtitle": str(subs_dir / video_id),
+        },
+        "continuedl": True,
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+    }
+    if target_sub:
+        ydl_opts.update({
+            "writesubtitles": target_sub["type"] == "manual",
+            "writeautomaticsub": target_sub["type"] == "auto",
+            "subtitleslangs": [target_sub["lang"]],
+            "subtitlesformat": "vtt",
+        })
+
+    audio_file = audio_dir / f"{video_id}.webm"
+    offset = resume_offset(audio_file)   # 在首次尝试前测量：失败重试续传的部分也算本次下载
+    metrics = get_metrics()
+    with metrics.item("download", video_id) as record:
+        opts = ydl_opts
+        retries = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            record["attempts"] = attempt
+            limiter.wait(video_url)
+            try:
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    ydl.download([video_url])
+                count_downloaded_bytes(audio_file, offset)
+                if opts is not ydl_opts:
+                    return True, "字幕下载失败，仅下载音频"
+                return True, "ok"
+            except DownloadError as err:
+                error = err
+                cause = err.exc_info[1] if err.exc_info else None
+                if isinstance(cause, ExtractorError) and cause.expected:
+                    # 私有 / 已删除等不可恢复错误，不再重试
+                    break
+                if opts is ydl_opts and target_sub and is_subtitle_error(err):
+                    opts = dict(ydl_opts, writesubtitles=False, writeautomaticsub=False)
+                    continue
+                if retries >= max_retries:
+                    break
+                retries += 1
+                time.sleep(backoff_base * 2 ** (retries - 1) + random.uniform(0, backoff_base))
+
+        record["failed"] = 1
+        return False, str(error)
+
+
+def download_parallel(config_path):
+    """
+    并发下载引擎：
+    - download_workers 个视频同时下载
+    - download_requests_per_second 限制对同一 host 的请求频率
+    - download_max_retries / download_backoff_base 控制指数退避重试
+    downloaded.txt 语义保持不变：音频下载成功后才记录 ID
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    channel = config.get("channel")
+    COOKIE_FILE = config.get("COOKIE_FILE", "./config/cookies.txt")
+    subtitle_lang = config.get("subtitle_lang")
+    max_workers = config.get("download_workers", 4)
+    max_retries = config.get("download_max_retries", 3)
+    backoff_base = config.get("download_backoff_base", 5.0)
+    limiter = HostRateLimiter(config.get("download_requests_per_second", 0.5))
+
+    base_output_dir = Path(config.get("output_dir", "./output"))
+    channel_dir = base_output_dir / channel
+    channel_audio_dir = channel_dir / "audio"
+    channel_subs_dir = channel_dir / "subs"
+    channel_info_dir = channel_dir / "info"
+
+    channel_audio_dir.mkdir(parents=True, exist_ok=True)
+    channel_subs_dir.mkdir(parents=True, exist_ok=True)
+
+    downloaded_list_file = channel_dir / "downloaded.txt"
+    if downloaded_list_file.exists():
+        with open(downloaded_list_file, "r", encoding="utf-8") as f:
+            downloaded_ids = set(line.strip() for line in f if line.strip())
+    else:
+        downloaded_ids = set()
+
+    # === 收集待下载视频（启用状态库时只查询未下载的行） ===
+    state_db = open_state_db(config)
+    infos = load_pending_infos(state_db, channel, channel_info_dir)
+
+    pending = []
+    for info in infos:
+        video_id = info["id"]
+        if video_id in downloaded_ids:
+            continue
+        downloaded_ids.add(video_id)
+        pending.append((video_id, choose_subtitle(info.get("subtitles", []), subtitle_lang)))
+
+    print(f"⬇️ 待下载 {len(pending)} 个视频（并发 {max_workers}）")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            open(downloaded_list_file, "a", encoding="utf-8") as ledger:
+        futures = {
+            pool.submit(
+                download_one_video, video_id, target_sub,
+                channel_audio_dir, channel_subs_dir, COOKIE_FILE,
+                limiter, max_retries, backoff_base
+            ): video_id
+            for video_id, target_sub in pending
+        }
+
+        for fut in as_completed(futures):
+            video_id = futures[fut]
+            ok, message = fut.result()
+            if not ok:
+                failed += 1
+                print(f"⚠️ 下载失败：{video_id} ({message})")
+                if state_db:
+                    state_db.mark_downloaded(channel, video_id, "failed")
+                continue
+
+            # === 下载成功，记录 ID（逐行 flush，断线不会丢失已完成记录） ===
+            ledger.write(f"{video_id}\n")
+            ledger.flush()
+            if state_db:
+                audio_file = channel_audio_dir / f"{video_id}.webm"
+                state_db.mark_downloaded(channel, video_id, "done", audio_file.stat().st_size)
+            print(f"✅ 已记录下载完成：{video_id}" + ("" if message == "ok" else f" ({message})"))
+
+    if state_db:
+        state_db.close()
+    print(f"🎉 并发下载完成：成功 {len(pending) - failed}，失败 {failed}")
+
+
 # ========= 🚀 入口一致 =========
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="下载音频 + 字幕 (记录已下载)")
     parser.add_argument("--config", type=str, required=True, help="YAML 配置文件路径")
+    parser.add_argument("--mode", type=str, choices=["cli", "api"], default=None,
+                        help="下载模式：cli = 串行调用 yt-dlp；api = 并发下载引擎（默认读取配置 download_mode）")
     args = parser.parse_args()
 
-    download_audio_and_subtitles(config_path=args.config)
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    mode = args.mode or config.get("download_mode", "cli")
+
+    metrics = setup_metrics("download", path=config.get("metrics_file"), profile=config.get("metrics_profile"))
+    with metrics.stage("download", mode=mode):
+        if mode == "api":
+            download_parallel(config_path=args.config)
+        else:
+            download_audio_and_subtitles(config_path=args.config)
+    metrics.close(prometheus=config.get("metrics_prometheus"))
@@ -5,57 +5,57 @@ import sys
 from pathlib import Path
 import json
 import argparse
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from state_db import open_state_db
 
-def get_subtitle_language(result: str):
+# 指标模块在仓库根目录 utils/metrics.py（与 GigaSpeech2 / Granary 脚本共用）
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "utils"))
+from metrics import get_metrics, setup as setup_metrics  # noqa: E402
+
+
+def get_subtitles_from_info(info: dict):
     """
-    解析 `yt-dlp --list-subs` 输出
-    返回字幕列表:
-      [{"lang": "en", "type": "auto"}, {"lang": "ch-Hans", "type": "manual"}]
+    直接从 yt-dlp 的 info dict 读取字幕列表（无需再调用 `--list-subs`）
+    返回格式:
+      [{"lang": "en", "type": "manual"}, {"lang": "id", "type": "auto"}]
     """
     subtitles = []
-
-    auto_flag = False
-    manu_flag = False
-    fallback_plain_table = False
-
-    for line in result.splitlines():
-        line = line.strip()
-        if not line:
+    for lang in (info.get("subtitles") or {}):
+        if lang == "live_chat":
             continue
+        subtitles.append({"lang": lang, "type": "manual"})
+    for lang in (info.get("automatic_captions") or {}):
+        subtitles.append({"lang": lang, "type": "auto"})
+    return subtitles
 
-        if "auto-generated:" in line:
-            auto_flag = True
-            manu_flag = False
-            fallback_plain_table = False
-
-        elif "manually provided:" in line:
-            auto_flag = False
-            manu_flag = True
-            fallback_plain_table = False
-
-        elif line.lower().startswith("language name"):
-            fallback_plain_table = True
-            auto_flag = False
-            manu_flag = False
-
-        elif fallback_plain_table:
-            parts = line.split()
-            if parts:
-                lang = parts[0]
-                subtitles.append({"lang": lang, "type": "manual"})
-
-        elif re.match(r"^\w+", line):
-            parts = line.split()
-            if parts:
-                lang = parts[0]
-                if auto_flag:
-                    subtitles.append({"lang": lang, "type": "auto"})
-                elif manu_flag:
-                    subtitles.append({"lang": lang, "type": "manual"})
 
-    return subtitles
+def build_metadata_record(data: dict, sub_lang=None):
+    """
+    从完整的 info dict 中抽取 video_metadata.jsonl 需要的字段
+    """
+    filtered = {
+        "id": data.get("id"),
+        "channel_id": data.get("channel_id"),
+        "language": data.get("language"),
+        "title": data.get("title"),
+        "description": data.get("description"),
+        "tags": data.get("tags"),
+        "categories": data.get("categories"),
+        "media_type": data.get("media_type"),
+        "live_status": data.get("live_status"),
+        "duration": data.get("duration"),
+        "upload_date": data.get("upload_date"),
+        "view_count": data.get("view_count"),
+        "like_count": data.get("like_count")
+    }
+
+    # ========= 检测字幕（-j 输出已包含 subtitles / automatic_captions） =========
+    if sub_lang:
+        filtered["subtitles"] = get_subtitles_from_info(data)
+
+    return filtered
 
 
 def process_channel_videos(config_path="./config/config.yaml"):
@@ -110,60 +110,426 @@ def process_channel_videos(config_path="./config/config.yaml"):
     ]
 
     # ========= 4️⃣ 执行解析 =========
-    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc, \
+    state_db = open_state_db(config)
+    metrics = get_metrics()
+    with metrics.stage("extract", channel=channel), \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc, \
             open(json_output_path, "a", encoding="utf-8") as outfile:
 
         for line in proc.stdout:
             try:
                 data = json.loads(line)
 
-                filtered = {
-                    "id": data.get("id"),
-                    "channel_id": data.get("channel_id"),
-                    "language": data.get("language"),
-                    "title": data.get("title"),
-                    "description": data.get("description"),
-                    "tags": data.get("tags"),
-                    "categories": data.get("categories"),
-                    "media_type": data.get("media_type"),
-                    "live_status": data.get("live_status"),
-                    "duration": data.get("duration"),
-                    "upload_date": data.get("upload_date"),
-                    "view_count": data.get("view_count"),
-                    "like_count": data.get("like_count")
-                }
-
-                # ========= 检测字幕 =========
-                if sub_lang:
-                    video_url = f"https://www.youtube.com/watch?v={filtered['id']}"
-                    try:
-                        result = subprocess.check_output(
-                            f"yt-dlp --list-subs --cookies {COOKIE_FILE} --skip-download {video_url}",
-                            shell=True,
-                            universal_newlines=True
-                        )
-
-                        subtitles = get_subtitle_language(result)
-                        filtered["subtitles"] = subtitles
-
-                    except subprocess.CalledProcessError:
-                        filtered["subtitles"] = []
+                filtered = build_metadata_record(data, sub_lang)
 
                 # ========= 写到 JSONL =========
                 json.dump(filtered, outfile, ensure_ascii=False)
                 outfile.write("\n")
 
+                if state_db:
+                    state_db.upsert_metadata(channel, [filtered])
+                metrics.count("videos")
+
                 print(f"✅ 已保存视频 ID: {filtered['id']}")
 
             except json.JSONDecodeError:
                 print("⚠️ 跳过一条无效 JSON")
                 continue
 
+    if state_db:
+        state_db.close()
+
+
+def split_index_range(start_index, end_index, chunk_size):
+    """
+    把 yt-dlp 的 `-I start:end` 拆成若干不重叠的子区间
+    （yt-dlp 的 playlist 索引从 1 开始，两端都包含）
+    """
+    start = max(int(start_index), 1)
+    end = int(end_index)
+    chunk_size = max(int(chunk_size), 1)
+
+    ranges = []
+    while start <= end:
+        stop = min(start + chunk_size - 1, end)
+        ranges.append(f"{start}:{stop}")
+        start = stop + 1
+    return ranges
+
+
+def load_channel_tasks(config):
+    """
+    从配置读取频道列表，支持两种写法：
+      channels:
+        - "worldofxtra"
+        - {channel: "Idntimes", start_index: 0, end_index: 200}
+    未配置 channels 时退回单个 `channel` 字段
+    """
+    default_start = config.get("start_index", 0)
+    default_end = config.get("end_index", 1)
+
+    tasks = []
+    for item in config.get("channels") or [config.get("channel")]:
+        if not item:
+            continue
+        if isinstance(item, dict):
+            tasks.append((
+                item["channel"],
+                item.get("start_index", default_start),
+                item.get("end_index", default_end),
+            ))
+        else:
+            tasks.append((item, default_start, default_end))
+    return tasks
+
+
+_thread_local = threading.local()
+_ydl_instances = []
+_ydl_lock = threading.Lock()
+
+
+def _get_ydl(ydl_opts):
+    """
+    每个工作线程复用一个 YoutubeDL 实例（YoutubeDL 不是线程安全的）
+    yt_dlp 只在 api / incremental 模式下导入，cli 模式只需要 yt-dlp 命令行
+    """
+    import yt_dlp
+
+    ydl = getattr(_thread_local, "ydl", None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        _thread_local.ydl = ydl
+        with _ydl_lock:
+            _ydl_instances.append(ydl)
+    return ydl
+
+
+def close_thread_ydls():
+    """
+    关闭各工作线程创建的 YoutubeDL 实例（线程池结束后调用）
+    """
+    with _ydl_lock:
+        while _ydl_instances:
+            _ydl_instances.pop().close()
+
+
+def list_channel_video_ids(channel, index_range, ydl_opts, archive_path):
+    """
+    扁平列出频道某个索引区间内的视频 ID（只请求列表页，不请求视频页）
+    已记录在 download archive 中的 ID 会被 yt-dlp 自动跳过
+    """
+    import yt_dlp
+
+    opts = dict(
+        ydl_opts,
+        extract_flat="in_playlist",
+        playlist_items=index_range,
+        download_archive=str(archive_path),
+    )
+    with get_metrics().item("list", f"{channel}:{index_range}"), yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/@{channel}/videos", download=False)
+
+    if not info:
+        return []
+    return [entry["id"] for entry in info.get("entries") or [] if entry and entry.get("id")]
+
+
+def extract_video_metadata(video_id, ydl_opts, sub_lang):
+    """
+    单次请求获取视频完整元数据，字幕信息直接取自 info dict
+    """
+    ydl = _get_ydl(ydl_opts)
+    with get_metrics().item("metadata", video_id):
+        data = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+    if not data:
+        return None
+    return build_metadata_record(data, sub_lang)
+
+
+def load_channel_checkpoint(info_dir, checkpoint_name, metadata_json_name, download_archive_name):
+    """
+    读取频道增量检查点 {"latest_upload_date": ..., "seen_ids": [...]}
+    首次运行没有检查点时，用已有的 video_metadata.jsonl 和 download archive 初始化已知 ID
+    """
+    checkpoint_path = info_dir / checkpoint_name
+    if checkpoint_path.exists():
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        checkpoint["seen_ids"] = set(checkpoint.get("seen_ids") or [])
+        return checkpoint
+
+    seen_ids = set()
+    latest_upload_date = None
+    metadata_path = info_dir / metadata_json_name
+    if metadata_path.exists():
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("id"):
+                    seen_ids.add(record["id"])
+                upload_date = record.get("upload_date")
+                if upload_date and (latest_upload_date is None or upload_date > latest_upload_date):
+                    latest_upload_date = upload_date
+
+    archive_path = info_dir / download_archive_name
+    if archive_path.exists():
+        with open(archive_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()  # "youtube <video_id>"
+                if len(parts) == 2:
+                    seen_ids.add(parts[1])
+
+    return {"latest_upload_date": latest_upload_date, "seen_ids": seen_ids}
+
+
+def save_channel_checkpoint(info_dir, checkpoint_name, checkpoint):
+    """
+    先写临时文件再替换，中断时不会留下半个检查点
+    """
+    checkpoint_path = info_dir / checkpoint_name
+    tmp_path = checkpoint_path.with_name(checkpoint_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(checkpoint, seen_ids=sorted(checkpoint["seen_ids"])), f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def list_new_video_ids(channel, ydl_opts, known_ids, stop_after_known=30):
+    """
+    扁平列出频道上传列表（从最新开始），只返回不在 known_ids 中的视频 ID
+    列表是按页懒加载的：连续遇到 stop_after_known 个已知 ID 后就停止翻页（0 = 列完整个频道）
+    """
+    import yt_dlp
+
+    new_ids = []
+    known_streak = 0
+    with get_metrics().item("list", channel), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/@{channel}/videos", download=False, process=False)
+        for entry in (info or {}).get("entries") or []:
+            video_id = entry.get("id") if entry else None
+            if not video_id:
+                continue
+            if video_id in known_ids:
+                known_streak += 1
+                if stop_after_known and known_streak >= stop_after_known:
+                    break
+                continue
+            known_streak = 0
+            if video_id not in new_ids:
+                new_ids.append(video_id)
+    return new_ids
+
+
+def process_channels_incremental(config_path="./config/config.yaml"):
+    """
+    增量抓取模式（只抓新上传的视频）：
+    1. 读取每个频道的检查点（info/channel_checkpoint.json：最新上传日期 + 已见过的视频 ID）
+    2. 每个频道只做一次轻量的扁平列表请求，与已见 ID 做差集
+    3. 只对新视频请求完整元数据，追加到 video_metadata.jsonl 并更新检查点
+    不使用 start_index / end_index
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    COOKIE_FILE = config.get("COOKIE_FILE", "./config/cookies.txt")
+    sub_lang = config.get("subtitle_lang", None)
+    max_workers = config.get("extract_workers", 4)
+    stop_after_known = config.get("incremental_stop_after_known", 30)
+
+    tasks = load_channel_tasks(config)
+    if not tasks:
+        print("❌ 配置文件缺少 `channel` / `channels` 字段，无法继续")
+        sys.exit(1)
+
+    base_output_dir = Path(config.get("output_dir", "./output"))
+    download_archive_name = config.get("download_archive_name", "downloaded_ids.txt")
+    metadata_json_name = config.get("metadata_json_name", "video_metadata.jsonl")
+    checkpoint_name = config.get("checkpoint_name", "channel_checkpoint.json")
+
+    ydl_opts = {
+        "cookiefile": COOKIE_FILE,
+        "ignoreerrors": True,
+        "quiet": True,
+        "no_warnings": True,
+        "skip_download": True,
+    }
+
+    info_dirs = {}
+    checkpoints = {}
+    outfiles = {}
+    state_db = open_state_db(config)
+    try:
+        with get_metrics().stage("extract"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # ========= 1️⃣ 每个频道一次扁平列表，与检查点求差集 =========
+            listing_futures = {}
+            for channel, _, _ in tasks:
+                if channel in info_dirs:
+                    continue
+                info_dir = base_output_dir / channel / "info"
+                info_dir.mkdir(parents=True, exist_ok=True)
+                info_dirs[channel] = info_dir
+                checkpoints[channel] = load_channel_checkpoint(
+                    info_dir, checkpoint_name, metadata_json_name, download_archive_name
+                )
+                print(f"📥 正在列出频道新视频: {channel} (已知 {len(checkpoints[channel]['seen_ids'])} 个, "
+                      f"最新上传日期 {checkpoints[channel].get('latest_upload_date')})")
+                fut = pool.submit(list_new_video_ids, channel, ydl_opts, checkpoints[channel]["seen_ids"], stop_after_known)
+                listing_futures[fut] = channel
+
+            # ========= 2️⃣ 只对新视频抓取完整元数据 =========
+            video_futures = {}
+            for fut in as_completed(listing_futures):
+                channel = listing_futures[fut]
+                new_ids = fut.result()
+                print(f"🆕 {channel}: {len(new_ids)} 个新视频")
+                for video_id in new_ids:
+                    video_futures[pool.submit(extract_video_metadata, video_id, ydl_opts, sub_lang)] = channel
+
+            # ========= 3️⃣ 写到 JSONL，更新检查点 =========
+            for fut in as_completed(video_futures):
+                filtered = fut.result()
+                if not filtered:
+                    print("⚠️ 跳过一个无法获取元数据的视频（下次运行会重试）")
+                    continue
+
+                channel = video_futures[fut]
+                if channel not in outfiles:
+                    outfiles[channel] = open(info_dirs[channel] / metadata_json_name, "a", encoding="utf-8")
+                outfile = outfiles[channel]
+                json.dump(filtered, outfile, ensure_ascii=False)
+                outfile.write("\n")
+                outfile.flush()
+
+                if state_db:
+                    state_db.upsert_metadata(channel, [filtered])
+                get_metrics().count("videos")
+
+                checkpoint = checkpoints[channel]
+                checkpoint["seen_ids"].add(filtered["id"])
+                upload_date = filtered.get("upload_date")
+                if upload_date and (not checkpoint.get("latest_upload_date") or upload_date > checkpoint["latest_upload_date"]):
+                    checkpoint["latest_upload_date"] = upload_date
+
+                print(f"✅ 已保存视频 ID: {filtered['id']}")
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+        # 只记录成功写入元数据的 ID，失败的视频下次运行仍会被列为新视频
+        for channel, checkpoint in checkpoints.items():
+            save_channel_checkpoint(info_dirs[channel], checkpoint_name, checkpoint)
+        if state_db:
+            state_db.close()
+        close_thread_ydls()
+
+
+def process_channels_api(config_path="./config/config.yaml"):
+    """
+    进程内抓取模式（基于 yt-dlp Python API）：
+    1. 并发扁平列出多个频道 / 多个索引区间的视频 ID
+    2. 用有界线程池逐个获取视频元数据，每个视频只请求一次
+    3. 按频道写入与 CLI 模式相同格式的 video_metadata.jsonl
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    COOKIE_FILE = config.get("COOKIE_FILE", "./config/cookies.txt")
+    sub_lang = config.get("subtitle_lang", None)
+    max_workers = config.get("extract_workers", 4)
+    chunk_size = config.get("extract_chunk_size", 100)
+
+    tasks = load_channel_tasks(config)
+    if not tasks:
+        print("❌ 配置文件缺少 `channel` / `channels` 字段，无法继续")
+        sys.exit(1)
+
+    base_output_dir = Path(config.get("output_dir", "./output"))
+    download_archive_name = config.get("download_archive_name", "downloaded_ids.txt")
+    metadata_json_name = config.get("metadata_json_name", "video_metadata.jsonl")
+
+    ydl_opts = {
+        "cookiefile": COOKIE_FILE,
+        "ignoreerrors": True,
+        "quiet": True,
+        "no_warnings": True,
+        "skip_download": True,
+    }
+
+    outfiles = {}
+    state_db = open_state_db(config)
+    try:
+        with get_metrics().stage("extract"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # ========= 1️⃣ 并发列出视频 ID =========
+            listing_futures = {}
+            for channel, start_index, end_index in tasks:
+                channel_output_dir = base_output_dir / channel / "info"
+                channel_output_dir.mkdir(parents=True, exist_ok=True)
+                archive_path = channel_output_dir / download_archive_name
+                outfiles[channel] = open(channel_output_dir / metadata_json_name, "a", encoding="utf-8")
+
+                print(f"📥 正在处理频道: {channel} (视频范围: {start_index}:{end_index})")
+                for index_range in split_index_range(start_index, end_index, chunk_size):
+                    fut = pool.submit(list_channel_video_ids, channel, index_range, ydl_opts, archive_path)
+                    listing_futures[fut] = channel
+
+            # ========= 2️⃣ 并发抓取视频元数据 =========
+            video_futures = {}
+            seen_ids = set()
+            for fut in as_completed(listing_futures):
+                channel = listing_futures[fut]
+                for video_id in fut.result():
+                    if video_id in seen_ids:
+                        continue
+                    seen_ids.add(video_id)
+                    video_futures[pool.submit(extract_video_metadata, video_id, ydl_opts, sub_lang)] = channel
+
+            print(f"🔎 共列出 {len(video_futures)} 个待抓取视频")
+
+            # ========= 3️⃣ 写到 JSONL =========
+            for fut in as_completed(video_futures):
+                filtered = fut.result()
+                if not filtered:
+                    print("⚠️ 跳过一个无法获取元数据的视频")
+                    continue
+
+                channel = video_futures[fut]
+                outfile = outfiles[channel]
+                json.dump(filtered, outfile, ensure_ascii=False)
+                outfile.write("\n")
+                outfile.flush()
+
+                if state_db:
+                    state_db.upsert_metadata(channel, [filtered])
+                get_metrics().count("videos")
+
+                print(f"✅ 已保存视频 ID: {filtered['id']}")
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+        if state_db:
+            state_db.close()
+        close_thread_ydls()
+
 
 # ========= 🚀 入口 =========
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="抓取频道元数据 & 记录字幕")
     parser.add_argument("--config", type=str, default="./config/config.yaml", help="配置文件路径")
+    parser.add_argument("--mode", type=str, choices=["cli", "api", "incremental"], default=None,
+                        help="抓取模式：cli = 调用 yt-dlp 子进程；api = 进程内并发抓取；"
+                             "incremental = 只抓各频道新上传的视频（默认读取配置 extract_mode）")
     args = parser.parse_args()
 
-    process_channel_videos(config_path=args.config)
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    mode = args.mode or config.get("extract_mode", "cli")
+
+    metrics = setup_metrics("extract_channels", path=config.get("metrics_file"), profile=config.get("metrics_profile"))
+    if mode == "api":
+        process_channels_api(config_path=args.config)
+    elif mode == "incremental":
+        process_channels_incremental(config_path=args.config)
+    else:
+        process_channel_videos(config_path=args.config)
+    metrics.close(prometheus=config.get("metrics_prometheus"))
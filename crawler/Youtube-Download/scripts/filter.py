@@ -4,6 +4,10 @@ import logging
 from pathlib import Path
 import argparse
 
+import numpy as np
+
+from state_db import FILTERED_FIELDS, open_state_db
+
 logging.basicConfig(level=logging.WARNING, format="%(message)s")
 
 
@@ -15,31 +19,58 @@ def is_any_a_in_b(list_a, list_b):
     return any(str(item).lower() in normalized_set_b for item in list_a)
 
 
-def filter_info_file(config_path, info_file):
-    # ==== 📄 加载配置 ====
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
+def filter_record(info, filter_cfg):
+    """
+    按 filter 配置依次检查单条元数据
+    返回 (原因, 日志)；通过时返回 (None, None)
+    """
+    if filter_cfg.get("enable_language_filter", False):
+        target_language_abbr = filter_cfg.get("target_language_abbr", [])
+        if not is_any_a_in_b([info.get("language")], target_language_abbr):
+            return "language", f"❌ 跳过：语言 '{info.get('language')}' 不在 {target_language_abbr}"
 
-    filter_cfg = config.get("filter", {})
+    if filter_cfg.get("enable_duration_filter", False):
+        min_duration = filter_cfg.get("min_duration", 0)
+        max_duration = filter_cfg.get("max_duration", 999999)
+        duration = info.get("duration", 0)
+        if not (min_duration <= duration <= max_duration):
+            return "duration", f"❌ 跳过：Duration {duration} 不在 [{min_duration}, {max_duration}]"
 
-    enable_language_filter = filter_cfg.get("enable_language_filter", False)
-    target_language_abbr = filter_cfg.get("target_language_abbr", [])
+    if filter_cfg.get("enable_like_count_filter", False):
+        min_like_count = filter_cfg.get("min_like_count", 0)
+        like_count = info.get("like_count")
+        if like_count is not None and like_count < min_like_count:
+            return "like_count", f"❌ 跳过：点赞数 {like_count} 小于 {min_like_count}"
 
-    enable_duration_filter = filter_cfg.get("enable_duration_filter", False)
-    min_duration = filter_cfg.get("min_duration", 0)
-    max_duration = filter_cfg.get("max_duration", 999999)
+    subtitles = info.get("subtitles", [])
+    if filter_cfg.get("filter_no_subtitle", False):
+        if not subtitles:
+            return "no_subtitle", "❌ 跳过：没有字幕（subtitles 列表为空）"
 
-    enable_like_count_filter = filter_cfg.get("enable_like_count_filter", False)
-    min_like_count = filter_cfg.get("min_like_count", 0)
+    if filter_cfg.get("filter_no_manual_subtitle", False):
+        has_manual = any(sub.get("type") == "manual" for sub in subtitles)
+        if not has_manual:
+            return "no_manual_subtitle", "❌ 跳过：无人工字幕（subtitles 中无 manual）"
 
-    filter_no_subtitle = filter_cfg.get("filter_no_subtitle", False)
-    filter_no_manual_subtitle = filter_cfg.get("filter_no_manual_subtitle", False)
+    return None, None
+
+
+def filter_info_file(config_path, info_file, state_db=None):
+    # ==== 📄 加载配置 ====
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    filter_cfg = config.get("filter", {})
 
     # === 输出新文件名 ===
     output_file = Path(info_file).with_name(
         Path(info_file).stem + "-filtered.jsonl"
     )
 
+    # 过滤结果 (频道, 元数据, 原因)，原因为 None 表示通过；启用状态库时一次性提交
+    channel = Path(info_file).parent.parent.name
+    verdicts = []
+
     with open(info_file, encoding="utf-8", errors="ignore") as f1, \
          open(output_file, "w", encoding="utf-8") as f2:
 
@@ -50,56 +81,177 @@ def filter_info_file(config_path, info_file):
                 logging.warning(f"❌ 跳过：第 {line_num} 行不是合法 JSON")
                 continue
 
-            if enable_language_filter:
-                if not is_any_a_in_b([info.get("language")], target_language_abbr):
-                    logging.warning(f"❌ 跳过：语言 '{info.get('language')}' 不在 {target_language_abbr}")
-                    continue
+            reason, message = filter_record(info, filter_cfg)
+            if reason:
+                logging.warning(message)
+                verdicts.append((channel, info, reason))
+                continue
 
-            if enable_duration_filter:
-                duration = info.get("duration", 0)
-                if not (min_duration <= duration <= max_duration):
-                    logging.warning(f"❌ 跳过：Duration {duration} 不在 [{min_duration}, {max_duration}]")
+            filtered_info = {field: info.get(field) for field in FILTERED_FIELDS}
+            f2.write(json.dumps(filtered_info, ensure_ascii=False) + "\n")
+            verdicts.append((channel, info, None))
+
+    if state_db:
+        state_db.set_filter_verdicts(verdicts)
+
+    print(f"✅ 过滤完成，新文件输出：{output_file}")
+
+
+FILTER_REASONS = ["language", "duration", "like_count", "no_subtitle", "no_manual_subtitle"]
+
+
+def load_metadata_table(output_root, metadata_json_name="video_metadata.jsonl"):
+    """
+    读取 output_root 下所有频道的元数据，组装成列式表（NumPy 数组）
+    返回 (table, records, invalid_lines)，records 与表的行一一对应，按频道连续排列
+    """
+    channels, languages, durations, like_counts = [], [], [], []
+    has_subtitle, has_manual = [], []
+    records = []
+    invalid_lines = 0
+
+    for info_file in sorted(Path(output_root).glob(f"*/info/{metadata_json_name}")):
+        channel = info_file.parent.parent.name
+        with open(info_file, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                try:
+                    info = json.loads(line)
+                except json.JSONDecodeError:
+                    invalid_lines += 1
                     continue
 
-            if enable_like_count_filter:
+                duration = info.get("duration", 0)
                 like_count = info.get("like_count")
-                if like_count is not None and like_count < min_like_count:
-                    logging.warning(f"❌ 跳过：点赞数 {like_count} 小于 {min_like_count}")
-                    continue
+                subtitles = info.get("subtitles") or []
 
-            subtitles = info.get("subtitles", [])
-            if filter_no_subtitle:
-                if not subtitles:
-                    logging.warning("❌ 跳过：没有字幕（subtitles 列表为空）")
-                    continue
+                channels.append(channel)
+                languages.append(str(info.get("language")).lower())
+                durations.append(np.nan if duration is None else duration)
+                like_counts.append(np.nan if like_count is None else like_count)
+                has_subtitle.append(bool(subtitles))
+                has_manual.append(any(sub.get("type") == "manual" for sub in subtitles))
+                records.append(info)
 
-            if filter_no_manual_subtitle:
-                has_manual = any(sub.get("type") == "manual" for sub in subtitles)
-                if not has_manual:
-                    logging.warning("❌ 跳过：无人工字幕（subtitles 中无 manual）")
-                    continue
+    table = {
+        "channel": np.array(channels, dtype=str),
+        "language": np.array(languages, dtype=str),
+        "duration": np.array(durations, dtype=np.float64),
+        "like_count": np.array(like_counts, dtype=np.float64),
+        "has_subtitle": np.array(has_subtitle, dtype=bool),
+        "has_manual": np.array(has_manual, dtype=bool),
+    }
+    return table, records, invalid_lines
 
-            fields_to_keep = [
-                "channel_id",
-                "id",
-                "title",
-                "description",
-                "duration",
-                "upload_date",
-                "like_count",
-                "language",
-                "subtitles"
-            ]
-            filtered_info = {field: info.get(field) for field in fields_to_keep}
-            f2.write(json.dumps(filtered_info, ensure_ascii=False) + "\n")
 
-    print(f"✅ 过滤完成，新文件输出：{output_file}")
+def evaluate_filters(table, filter_cfg):
+    """
+    对列式表按 filter 配置做向量化判断
+    返回每行第一个不满足的条件下标（对应 FILTER_REASONS），-1 表示通过
+    判定顺序与 filter_info_file 一致
+    """
+    n = len(table["channel"])
+    no_reject = np.zeros(n, dtype=bool)
+    masks = [no_reject] * len(FILTER_REASONS)
+
+    if filter_cfg.get("enable_language_filter", False):
+        targets = [str(item).lower() for item in filter_cfg.get("target_language_abbr", [])]
+        masks[0] = ~np.isin(table["language"], targets)
+
+    if filter_cfg.get("enable_duration_filter", False):
+        duration = table["duration"]
+        with np.errstate(invalid="ignore"):
+            in_range = (duration >= filter_cfg.get("min_duration", 0)) & \
+                       (duration <= filter_cfg.get("max_duration", 999999))
+        masks[1] = ~in_range
+
+    if filter_cfg.get("enable_like_count_filter", False):
+        with np.errstate(invalid="ignore"):
+            masks[2] = table["like_count"] < filter_cfg.get("min_like_count", 0)   # NaN（无点赞数）不过滤
+
+    if filter_cfg.get("filter_no_subtitle", False):
+        masks[3] = ~table["has_subtitle"]
+
+    if filter_cfg.get("filter_no_manual_subtitle", False):
+        masks[4] = ~table["has_manual"]
+
+    rejected_by = np.full(n, -1, dtype=np.int8)
+    for reason_idx in reversed(range(len(FILTER_REASONS))):
+        rejected_by[masks[reason_idx]] = reason_idx
+    return rejected_by
+
+
+def filter_output_root(config_path, output_root, state_db=None):
+    """
+    全频道列式过滤：
+    1. 一次性加载 output_root 下所有频道的 video_metadata.jsonl
+    2. 向量化计算 filter 配置中的各项条件
+    3. 每个频道写出 video_metadata-filtered.jsonl，并输出汇总的拒绝统计
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    filter_cfg = config.get("filter", {})
+    metadata_json_name = config.get("metadata_json_name", "video_metadata.jsonl")
+
+    table, records, invalid_lines = load_metadata_table(output_root, metadata_json_name)
+    rejected_by = evaluate_filters(table, filter_cfg)
+    keep = rejected_by < 0
+
+    channel_names, channel_codes = np.unique(table["channel"], return_inverse=True)
+    num_reasons = len(FILTER_REASONS) + 1   # 最后一列记录通过数
+    counts = np.bincount(
+        channel_codes * num_reasons + np.where(keep, num_reasons - 1, rejected_by),
+        minlength=len(channel_names) * num_reasons,
+    ).reshape(len(channel_names), num_reasons)
+
+    # === 按频道写出过滤结果（records 按频道连续排列） ===
+    for code, channel in enumerate(channel_names):
+        rows = np.flatnonzero((channel_codes == code) & keep)
+        output_file = Path(output_root) / channel / "info" / (Path(metadata_json_name).stem + "-filtered.jsonl")
+        with open(output_file, "w", encoding="utf-8") as f:
+            for row in rows:
+                info = records[row]
+                filtered_info = {field: info.get(field) for field in FILTERED_FIELDS}
+                f.write(json.dumps(filtered_info, ensure_ascii=False) + "\n")
+
+    if state_db:
+        state_db.set_filter_verdicts([
+            (str(channel), info, None if reason < 0 else FILTER_REASONS[reason])
+            for channel, info, reason in zip(table["channel"], records, rejected_by.tolist())
+        ])
+
+    # === 汇总统计 ===
+    report = {
+        "total": int(len(records)),
+        "kept": int(keep.sum()),
+        "invalid_json": invalid_lines,
+        "rejected": {reason: int(counts[:, i].sum()) for i, reason in enumerate(FILTER_REASONS)},
+        "channels": {
+            str(channel): {
+                "total": int(counts[code].sum()),
+                "kept": int(counts[code, -1]),
+                "rejected": {reason: int(counts[code, i]) for i, reason in enumerate(FILTER_REASONS)},
+            }
+            for code, channel in enumerate(channel_names)
+        },
+    }
+    report_file = Path(output_root) / "filter_report.json"
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for channel, stats in report["channels"].items():
+        rejected = "，".join(f"{k} {v}" for k, v in stats["rejected"].items() if v)
+        print(f"📺 {channel}: 保留 {stats['kept']}/{stats['total']}" + (f"（拒绝：{rejected}）" if rejected else ""))
+    print(f"✅ 过滤完成：{len(channel_names)} 个频道，保留 {report['kept']}/{report['total']}，"
+          f"无效 JSON {invalid_lines} 行，统计已保存 -> {report_file}")
 
 
 # ========= 🚀 入口 =========
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="过滤 JSONL 元数据文件")
     parser.add_argument("--config", type=str, required=True, help="YAML 配置文件路径")
+    parser.add_argument("--all-channels", action="store_true",
+                        help="对 output_dir 下所有频道做列式过滤，并输出汇总拒绝统计")
     args = parser.parse_args()
 
     config_path = args.config
@@ -107,10 +259,18 @@ if __name__ == "__main__":
     with open(config_path, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
 
-    channel = config.get("channel")
-    if not channel:
-        raise ValueError("❌ 配置中缺少 `channel` 字段")
+    state_db = open_state_db(config)
+
+    if args.all_channels:
+        filter_output_root(config_path, config.get("output_dir", "./output"), state_db=state_db)
+    else:
+        channel = config.get("channel")
+        if not channel:
+            raise ValueError("❌ 配置中缺少 `channel` 字段")
+
+        info_file = f"/content/drive/MyDrive/GigaSpeech2/id/raw_audio/Mono/{channel}/info/video_metadata.jsonl"
 
-    info_file = f"/content/drive/MyDrive/GigaSpeech2/id/raw_audio/Mono/{channel}/info/video_metadata.jsonl"
+        filter_info_file(config_path=config_path, info_file=info_file, state_db=state_db)
 
-    filter_info_file(config_path=config_path, info_file=info_file)
+    if state_db:
+        state_db.close()
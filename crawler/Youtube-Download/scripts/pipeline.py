@@ -0,0 +1,394 @@
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import yaml
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from download import HostRateLimiter, choose_subtitle, download_one_video
+from extract_channels import (close_thread_ydls, extract_video_metadata, list_channel_video_ids, load_channel_tasks,
+                              split_index_range)
+from filter import filter_record
+from slice import slice_one_video
+from state_db import FILTERED_FIELDS, CrawlStateDB
+
+# 指标模块在仓库根目录 utils/metrics.py（与 GigaSpeech2 / Granary 脚本共用）
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "utils"))
+from metrics import setup as setup_metrics  # noqa: E402
+
+# 阶段依赖（DAG）：每个阶段只在上游阶段的完成标记存在后执行
+STAGE_DEPS = {
+    "metadata": [],
+    "filter": ["metadata"],
+    "download": ["filter"],
+    "slice": ["download"],
+}
+STAGE_ORDER = ["metadata", "filter", "download", "slice"]
+
+
+def required_stages(target):
+    """
+    target 及其全部上游阶段，按 STAGE_ORDER 排序
+    """
+    needed, todo = set(), [target]
+    while todo:
+        stage = todo.pop()
+        if stage not in needed:
+            needed.add(stage)
+            todo.extend(STAGE_DEPS[stage])
+    return [stage for stage in STAGE_ORDER if stage in needed]
+
+
+def load_jsonl_by_id(path):
+    """
+    读取 JSONL 为 {video_id: record}；文件不存在时为空，跳过中断时写坏的行
+    """
+    records = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("id"):
+                    records[record["id"]] = record
+    return records
+
+
+class StageMarkers:
+    """
+    每个视频每个阶段一个完成标记：{output_dir}/{channel}/pipeline/{stage}/{video_id}.json
+    标记内容就是该阶段的结果（元数据 / 过滤原因 / 文件大小 / 段数），先写临时文件再 rename，
+    中断后重新运行时已完成的阶段直接跳过
+    """
+
+    def __init__(self, output_root):
+        self.root = Path(output_root)
+
+    def path(self, channel, stage, video_id):
+        return self.root / channel / "pipeline" / stage / f"{video_id}.json"
+
+    def get(self, channel, stage, video_id):
+        path = self.path(channel, stage, video_id)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def done(self, channel, stage, video_id, result):
+        path = self.path(channel, stage, video_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def video_ids(self, channel, stage):
+        return [p.stem for p in sorted((self.root / channel / "pipeline" / stage).glob("*.json"))]
+
+
+def run_stage(name, fn, workers, inbox, outbox, counters):
+    """
+    启动 workers 个线程：从 inbox 取视频执行 fn，返回值非 None 时放入 outbox（有界队列，满了会阻塞 = 背压）
+    inbox 收到 None 表示上游已结束；最后一个退出的线程再向 outbox 传递 None
+    """
+    state = {"alive": workers}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is None:
+                inbox.put(None)  # 让同阶段其它线程也能收到结束信号
+                break
+            try:
+                result = fn(item)
+            except Exception as e:  # 单个视频失败不影响其它视频，下次运行会重试
+                print(f"⚠️ [{name}] 失败：{item['channel']}/{item['id']} ({e})")
+                result = None
+            with lock:
+                counters[name] += 1
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+        with lock:
+            state["alive"] -= 1
+            last = state["alive"] == 0
+        if last and outbox is not None:
+            outbox.put(None)
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+class Pipeline:
+    """
+    流水线编排：多个频道的视频逐个流过 元数据 → 过滤 → 下载 → 切分，
+    阶段之间用有界队列连接，第 N 个视频切分时第 N+1 个视频正在下载
+    输出文件与分阶段运行（run.sh --stage 1..4）相同，启用 state_db 时同步写入状态库
+    """
+
+    def __init__(self, config, channels=None, stop_after="slice"):
+        self.config = config
+        self.stop_after = stop_after
+        self.output_root = Path(config.get("output_dir", "./output"))
+        self.markers = StageMarkers(self.output_root)
+
+        self.cookie_file = config.get("COOKIE_FILE", "./config/cookies.txt")
+        self.sub_lang = config.get("subtitle_lang", None)
+        self.filter_cfg = config.get("filter", {})
+        self.metadata_json_name = config.get("metadata_json_name", "video_metadata.jsonl")
+        self.filtered_json_name = Path(self.metadata_json_name).stem + "-filtered.jsonl"
+        self.download_archive_name = config.get("download_archive_name", "downloaded_ids.txt")
+        self.queue_size = config.get("pipeline_queue_size", 8)
+
+        self.extract_workers = config.get("extract_workers", 4)
+        self.chunk_size = config.get("extract_chunk_size", 100)
+        self.download_workers = config.get("download_workers", 4)
+        self.max_retries = config.get("download_max_retries", 3)
+        self.backoff_base = config.get("download_backoff_base", 5.0)
+        self.limiter = HostRateLimiter(config.get("download_requests_per_second", 0.5))
+        self.slice_workers = config.get("slice_workers", os.cpu_count() or 1)
+        self.slice_mode = config.get("slice_mode", "pydub")
+        self.target_sr = config.get("slice_sample_rate", 16000)
+        self.save_audio = config.get("slice_save_audio", True)
+        self.vtt_options = {
+            "mode": config.get("slice_vtt_mode", "plain"),
+            "max_gap_ms": config.get("slice_merge_max_gap_ms", 200),
+            "max_segment_ms": config.get("slice_merge_max_segment_ms", 10000),
+        }
+
+        self.ydl_opts = {
+            "cookiefile": self.cookie_file,
+            "ignoreerrors": True,
+            "quiet": True,
+            "no_warnings": True,
+            "skip_download": True,
+        }
+
+        tasks = load_channel_tasks(config)
+        if channels:
+            known = {task[0]: task for task in tasks}
+            start_index, end_index = config.get("start_index", 0), config.get("end_index", 1)
+            tasks = [known.get(channel, (channel, start_index, end_index)) for channel in channels]
+        self.tasks = tasks
+
+        # 追加写 JSONL / downloaded.txt 与状态库都在这把锁下进行
+        self.lock = threading.Lock()
+        self.state_db = CrawlStateDB(self.output_root, check_same_thread=False) if config.get("state_db", False) else None
+
+        # 分阶段运行（extract_channels + filter.py + download.py）已写出的视频：
+        # 直接复用已有元数据和过滤结果，不再重复请求，也不重复追加到 JSONL
+        self.downloaded, self.known_infos, self.known_passed = {}, {}, {}
+        for channel, _, _ in self.tasks:
+            channel_dir = self.output_root / channel
+            for sub in ("info", "audio", "subs", "segments"):
+                (channel_dir / sub).mkdir(parents=True, exist_ok=True)
+            ledger = channel_dir / "downloaded.txt"
+            self.downloaded[channel] = set(ledger.read_text(encoding="utf-8").split()) if ledger.exists() else set()
+            self.known_infos[channel] = load_jsonl_by_id(channel_dir / "info" / self.metadata_json_name)
+            self.known_passed[channel] = set(load_jsonl_by_id(channel_dir / "info" / self.filtered_json_name))
+
+    def close(self):
+        if self.state_db:
+            self.state_db.close()
+        close_thread_ydls()
+
+    def _append_line(self, path, line):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def is_finished(self, channel, video_id):
+        verdict = self.markers.get(channel, "filter", video_id)
+        if verdict and verdict["reason"]:
+            return True
+        return self.markers.get(channel, self.stop_after, video_id) is not None
+
+    # ========= 📥 元数据 + 🎯 过滤 =========
+    def stage_metadata(self, item):
+        channel, video_id = item["channel"], item["id"]
+        info_dir = self.output_root / channel / "info"
+
+        info = self.markers.get(channel, "metadata", video_id)
+        if info is None:
+            info = self.known_infos[channel].pop(video_id, None)
+            if info is None:
+                info = extract_video_metadata(video_id, self.ydl_opts, self.sub_lang)
+                if not info:
+                    print(f"⚠️ 跳过一个无法获取元数据的视频：{video_id}")
+                    return None
+                with self.lock:
+                    self._append_line(info_dir / self.metadata_json_name, json.dumps(info, ensure_ascii=False))
+                    if self.state_db:
+                        self.state_db.upsert_metadata(channel, [info])
+            self.markers.done(channel, "metadata", video_id, info)
+
+        if self.stop_after == "metadata":
+            return None
+
+        verdict = self.markers.get(channel, "filter", video_id)
+        if verdict is None:
+            already_passed = video_id in self.known_passed[channel]
+            reason, message = (None, None) if already_passed else filter_record(info, self.filter_cfg)
+            with self.lock:
+                if reason:
+                    print(message)
+                elif not already_passed:
+                    filtered_info = {field: info.get(field) for field in FILTERED_FIELDS}
+                    self._append_line(info_dir / self.filtered_json_name, json.dumps(filtered_info, ensure_ascii=False))
+                if self.state_db:
+                    self.state_db.set_filter_verdicts([(channel, info, reason)])
+            verdict = {"reason": reason}
+            self.markers.done(channel, "filter", video_id, verdict)
+
+        if verdict["reason"] or self.stop_after == "filter":
+            return None
+        return dict(item, info=info)
+
+    # ========= 🎧 下载 =========
+    def stage_download(self, item):
+        channel, video_id = item["channel"], item["id"]
+        channel_dir = self.output_root / channel
+        audio_file = channel_dir / "audio" / f"{video_id}.webm"
+
+        if self.markers.get(channel, "download", video_id) is None:
+            if video_id in self.downloaded[channel] and audio_file.exists():
+                message = "已在 downloaded.txt 中"
+            else:
+                target_sub = choose_subtitle(item["info"].get("subtitles", []), self.sub_lang)
+                ok, message = download_one_video(
+                    video_id, target_sub, channel_dir / "audio", channel_dir / "subs", self.cookie_file,
+                    self.limiter, self.max_retries, self.backoff_base
+                )
+                if not ok:
+                    print(f"⚠️ 下载失败：{video_id} ({message})")
+                    if self.state_db:
+                        with self.lock:
+                            self.state_db.mark_downloaded(channel, video_id, "failed")
+                    return None
+                with self.lock:
+                    self._append_line(channel_dir / "downloaded.txt", video_id)
+                    self.downloaded[channel].add(video_id)
+
+            file_size = audio_file.stat().st_size
+            if self.state_db:
+                with self.lock:
+                    self.state_db.mark_downloaded(channel, video_id, "done", file_size)
+            self.markers.done(channel, "download", video_id, {"file_size": file_size, "message": message})
+            print(f"✅ 已下载：{channel}/{video_id}")
+
+        if self.stop_after == "download":
+            return None
+        return item
+
+    # ========= ✂️ 切分 =========
+    def stage_slice(self, item):
+        channel, video_id = item["channel"], item["id"]
+        if self.markers.get(channel, "slice", video_id) is not None:
+            return None
+
+        channel_dir = self.output_root / channel
+        vtt_files = sorted((channel_dir / "subs").glob(f"{video_id}.*.vtt"))
+        if not vtt_files:
+            print(f"❌ 找不到字幕：{video_id}")
+            return None
+
+        seg_output_dir = channel_dir / "segments" / video_id
+        # 线程阻塞等待子进程结果，切分并发度 = slice_workers
+        num_segments = self.slice_pool.submit(
+            slice_one_video, channel_dir / "audio" / f"{video_id}.webm", vtt_files[0], seg_output_dir,
+            self.target_sr, self.save_audio, self.slice_mode, self.vtt_options
+        ).result()
+
+        if self.state_db:
+            with self.lock:
+                self.state_db.mark_sliced(video_id, "done", num_segments)
+        self.markers.done(channel, "slice", video_id, {"num_segments": num_segments})
+        print(f"🎉 已切分：{channel}/{video_id} {num_segments} 段")
+        return None
+
+    # ========= 📜 视频来源 =========
+    def feed(self, inbox, skip_listing=False):
+        """
+        先放入上次中断时未完成的视频（已有元数据标记），再并发列出各频道的视频 ID
+        """
+        seen = set()
+
+        def put(channel, video_id):
+            if (channel, video_id) in seen or self.is_finished(channel, video_id):
+                return
+            seen.add((channel, video_id))
+            inbox.put({"channel": channel, "id": video_id})
+
+        for channel, _, _ in self.tasks:
+            for video_id in self.markers.video_ids(channel, "metadata"):
+                put(channel, video_id)
+        print(f"♻️ 续跑 {len(seen)} 个未完成的视频")
+
+        if not skip_listing:
+            with ThreadPoolExecutor(max_workers=self.extract_workers) as pool:
+                futures = {}
+                for channel, start_index, end_index in self.tasks:
+                    archive_path = self.output_root / channel / "info" / self.download_archive_name
+                    print(f"📥 正在列出频道: {channel} (视频范围: {start_index}:{end_index})")
+                    for index_range in split_index_range(start_index, end_index, self.chunk_size):
+                        fut = pool.submit(list_channel_video_ids, channel, index_range, self.ydl_opts, archive_path)
+                        futures[fut] = channel
+                for fut in as_completed(futures):
+                    for video_id in fut.result():
+                        put(futures[fut], video_id)
+
+        inbox.put(None)
+        return len(seen)
+
+    def run(self, skip_listing=False):
+        stages = required_stages(self.stop_after)
+        counters = {name: 0 for name in ("metadata", "download", "slice")}
+
+        metadata_q = queue.Queue(maxsize=self.queue_size)
+        download_q = queue.Queue(maxsize=self.queue_size) if "download" in stages else None
+        slice_q = queue.Queue(maxsize=self.queue_size) if "slice" in stages else None
+
+        threads = run_stage("metadata", self.stage_metadata, self.extract_workers, metadata_q, download_q, counters)
+        if download_q is not None:
+            threads += run_stage("download", self.stage_download, self.download_workers, download_q, slice_q, counters)
+
+        # 线程已在运行，子进程用 spawn 启动，避免 fork 时复制到被其它线程持有的锁
+        spawn = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.slice_workers, mp_context=spawn) as self.slice_pool:
+            if slice_q is not None:
+                threads += run_stage("slice", self.stage_slice, self.slice_workers, slice_q, None, counters)
+
+            total = self.feed(metadata_q, skip_listing=skip_listing)
+            for t in threads:
+                t.join()
+
+        print(f"🎉 流水线完成：{total} 个视频，各阶段处理数 {counters}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流水线编排：多频道并发，元数据 / 过滤 / 下载 / 切分 按视频重叠执行，可断点续跑")
+    parser.add_argument("--config", type=str, required=True, help="YAML 配置文件路径")
+    parser.add_argument("--channels", nargs="*", default=None, help="要处理的频道（默认读取配置 channels / channel）")
+    parser.add_argument("--stop-after", type=str, choices=STAGE_ORDER, default="slice", help="执行到该阶段为止")
+    parser.add_argument("--skip-listing", action="store_true", help="不重新列出频道，只续跑已有元数据标记的视频")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    metrics = setup_metrics("pipeline", path=config.get("metrics_file"), profile=config.get("metrics_profile"))
+    pipeline = Pipeline(config, channels=args.channels, stop_after=args.stop_after)
+    try:
+        with metrics.stage("pipeline"):
+            pipeline.run(skip_listing=args.skip_listing)
+    finally:
+        pipeline.close()
+    metrics.close(prometheus=config.get("metrics_prometheus"))
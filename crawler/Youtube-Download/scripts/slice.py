@@ -1,11 +1,22 @@
 import os
 import json
 import re
+import subprocess
+import sys
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+import numpy as np
 from pydub import AudioSegment
 import yaml
 import argparse
 
+from state_db import open_state_db
+
+# 指标模块在仓库根目录 utils/metrics.py（与 GigaSpeech2 / Granary 脚本共用）
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "utils"))
+from metrics import get_metrics, setup as setup_metrics  # noqa: E402
+
 
 def parse_vtt_file(vtt_path):
     """
@@ -57,10 +68,127 @@ def vtt_time_to_millis(time_str):
     return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(ms)
 
 
-def process_audio_with_vtt(audio_path, vtt_path, output_dir, target_sr, save_audio):
+def millis_to_vtt_time(millis):
+    """
+    毫秒 → HH:MM:SS.MS
+    """
+    s, ms = divmod(int(millis), 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+VTT_TIME_PATTERN = re.compile(r"(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})")
+INLINE_TIME_PATTERN = re.compile(r"<(\d{2}:\d{2}:\d{2}\.\d{3})>")
+INLINE_TAG_PATTERN = re.compile(r"<[^>]*>")
+
+
+def caption_word_times(line, cue_start_ms):
+    """
+    行内逐词时间：YouTube 滚动字幕的格式为 word<00:00:01.234><c> next</c>...
+    第一个时间标签之前的词从 cue 起点开始，其余词取各自前面的时间标签
+    返回 [(毫秒, 词)]
+    """
+    parts = INLINE_TIME_PATTERN.split(line)
+    words = [(cue_start_ms, w) for w in clean_caption_line(parts[0]).split()]
+    for time_str, chunk in zip(parts[1::2], parts[2::2]):
+        words += [(vtt_time_to_millis(time_str), w) for w in clean_caption_line(chunk).split()]
+    return words
+
+
+def clean_caption_line(line):
+    """
+    去掉 <c>、<00:00:01.234> 等行内标签并合并空白
+    """
+    return " ".join(INLINE_TAG_PATTERN.sub("", line).split())
+
+
+def parse_rolling_vtt_file(vtt_path, max_gap_ms=200, max_segment_ms=10000):
+    """
+    解析 YouTube 自动字幕的滚动式 VTT：
+    - 去掉行内时间 / <c> 标签
+    - 每个 cue 只保留相对上一个 cue 新出现的行，滚动重复的行与 10ms 过渡 cue 被丢弃
+    - 有逐词时间戳时，行的起点取第一个词的时间
+    - 结果裁剪为互不重叠的段，相邻段在间隔 ≤ max_gap_ms 且总长 ≤ max_segment_ms 时合并
+    返回格式与 parse_vtt_file 相同
+    """
+    with open(vtt_path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    # === 1️⃣ 按空行切块（只含空格的行属于 cue 内容，不作为分隔） ===
+    cues = []
+    current = None
+    for line in lines + [""]:
+        if line == "":
+            if current and current[2]:
+                cues.append(current)
+            current = None
+            continue
+
+        match = VTT_TIME_PATTERN.match(line.strip())
+        if match:
+            current = (vtt_time_to_millis(match.group(1)), vtt_time_to_millis(match.group(2)), [])
+        elif current is not None:
+            current[2].append(line)
+
+    # === 2️⃣ 只保留每个 cue 中新出现的行 ===
+    caption_lines = []
+    prev_texts = []
+    for start_ms, end_ms, raw_lines in cues:
+        texts = [clean_caption_line(line) for line in raw_lines]
+        for raw, text in zip(raw_lines, texts):
+            if not text or text in prev_texts:
+                continue
+            line_start = start_ms
+            if INLINE_TIME_PATTERN.search(raw):
+                # 时间标签可出现在行内任意位置；行起点取第一个词的时间
+                line_start = caption_word_times(raw, start_ms)[0][0]
+            caption_lines.append([line_start, end_ms, text])
+        prev_texts = [text for text in texts if text]
+
+    caption_lines.sort(key=lambda item: item[0])
+
+    # === 3️⃣ 裁剪重叠 + 合并相邻短段 ===
+    segments = []
+    for i, (start_ms, end_ms, text) in enumerate(caption_lines):
+        if i + 1 < len(caption_lines):
+            end_ms = min(end_ms, caption_lines[i + 1][0])
+        if end_ms <= start_ms:
+            end_ms = start_ms + 1
+
+        if segments:
+            last = segments[-1]
+            if start_ms - last[1] <= max_gap_ms and end_ms - last[0] <= max_segment_ms:
+                last[1] = end_ms
+                last[2] = f"{last[2]} {text}"
+                continue
+        segments.append([start_ms, end_ms, text])
+
+    return [
+        {"start": millis_to_vtt_time(start_ms), "end": millis_to_vtt_time(end_ms), "text": text}
+        for start_ms, end_ms, text in segments
+    ]
+
+
+def parse_vtt_segments(vtt_path, vtt_options=None):
+    """
+    按 vtt_options["mode"] 选择解析方式：plain = parse_vtt_file；rolling = parse_rolling_vtt_file
+    """
+    vtt_options = vtt_options or {}
+    if vtt_options.get("mode", "plain") == "rolling":
+        return parse_rolling_vtt_file(
+            vtt_path,
+            max_gap_ms=vtt_options.get("max_gap_ms", 200),
+            max_segment_ms=vtt_options.get("max_segment_ms", 10000),
+        )
+    return parse_vtt_file(vtt_path)
+
+
+def process_audio_with_vtt(audio_path, vtt_path, output_dir, target_sr, save_audio, vtt_options=None):
     audio = AudioSegment.from_file(audio_path)
     if audio.frame_rate != target_sr:
         audio = audio.set_frame_rate(target_sr)
+    get_metrics().count("audio_seconds_decoded", len(audio) / 1000)
 
     wav_dir = output_dir / "wav"
     if save_audio:
@@ -68,7 +196,7 @@ def process_audio_with_vtt(audio_path, vtt_path, output_dir, target_sr, save_aud
 
     output_json = []
 
-    segments = parse_vtt_file(vtt_path)
+    segments = parse_vtt_segments(vtt_path, vtt_options)
 
     for idx, seg in enumerate(segments):
         start_ms = vtt_time_to_millis(seg["start"])
@@ -91,13 +219,123 @@ def process_audio_with_vtt(audio_path, vtt_path, output_dir, target_sr, save_aud
     return output_json
 
 
-def main(config_path):
+def decode_audio_to_array(audio_path, target_sr):
+    """
+    通过 ffmpeg 管道解码为 target_sr 单声道 int16 NumPy 数组（只解码一次，不经过 pydub）
+    """
+    proc = subprocess.run([
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", str(audio_path),
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", "1", "-ar", str(target_sr),
+        "-"
+    ], stdout=subprocess.PIPE, check=True)
+    samples = np.frombuffer(proc.stdout, dtype=np.int16)
+    get_metrics().count("audio_seconds_decoded", len(samples) / target_sr)
+    return samples
+
+
+def write_wav(path, samples, sample_rate):
+    """
+    直接把 int16 数组切片写成 WAV（memoryview，不复制数据）
+    """
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(memoryview(samples))
+
+
+def process_audio_with_vtt_stream(audio_path, vtt_path, output_dir, target_sr, save_audio, vtt_options=None):
+    """
+    与 process_audio_with_vtt 输出相同的 segments 列表：
+    - 只有需要保存音频时才解码
+    - 每段是整段 PCM 数组的切片，不重新编码
+    """
+    segments = parse_vtt_segments(vtt_path, vtt_options)
+
+    wav_dir = output_dir / "wav"
+    samples = None
+    if save_audio:
+        wav_dir.mkdir(parents=True, exist_ok=True)
+        samples = decode_audio_to_array(audio_path, target_sr)
+
+    output_json = []
+    for idx, seg in enumerate(segments):
+        start_ms = vtt_time_to_millis(seg["start"])
+        end_ms = vtt_time_to_millis(seg["end"])
+
+        seg_name = f"{idx+1:04d}.wav"
+        seg_path = wav_dir / seg_name if save_audio else f"{seg_name}"
+
+        if save_audio:
+            start = start_ms * target_sr // 1000
+            end = end_ms * target_sr // 1000
+            write_wav(seg_path, samples[start:end], target_sr)
+
+        output_json.append({
+            "segment": str(seg_path),
+            "text": seg["text"].strip(),
+            "start_ms": start_ms,
+            "end_ms": end_ms
+        })
+
+    return output_json
+
+
+def build_subtitle_index(subs_dir):
+    """
+    一次性扫描字幕目录，建立 video_id → vtt 文件的索引（{video_id}.{lang}.vtt）
+    """
+    index = {}
+    for vtt_file in sorted(subs_dir.glob("*.vtt")):
+        video_id = vtt_file.name.split(".", 1)[0]
+        index.setdefault(video_id, vtt_file)
+    return index
+
+
+def slice_one_video(audio_file, vtt_file, seg_output_dir, target_sr, save_audio, mode="pydub", vtt_options=None):
+    """
+    切分单个视频并写出 segments.json，返回段数（可在子进程中运行）
+    """
+    seg_output_dir.mkdir(parents=True, exist_ok=True)
+
+    metrics = get_metrics()
+    process = process_audio_with_vtt_stream if mode == "stream" else process_audio_with_vtt
+    with metrics.item("slice", seg_output_dir.name):
+        seg_info = process(
+            audio_file,
+            vtt_file,
+            seg_output_dir,
+            target_sr,
+            save_audio,
+            vtt_options
+        )
+        metrics.count("segments", len(seg_info))
+        if save_audio:
+            metrics.count("audio_seconds_written", sum(seg["end_ms"] - seg["start_ms"] for seg in seg_info) / 1000)
+
+    # 写 JSON（和 wav/ 并列）
+    with open(seg_output_dir / "segments.json", "w", encoding="utf-8") as f:
+        json.dump(seg_info, f, ensure_ascii=False, indent=2)
+
+    return len(seg_info)
+
+
+def main(config_path, mode=None):
     with open(config_path, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
 
+    mode = mode or config.get("slice_mode", "pydub")
+
     channel = config.get("channel")
     target_sr = config.get("slice_sample_rate", 16000)
     save_audio = config.get("slice_save_audio", True)  # 新增字段
+    vtt_options = {
+        "mode": config.get("slice_vtt_mode", "plain"),
+        "max_gap_ms": config.get("slice_merge_max_gap_ms", 200),
+        "max_segment_ms": config.get("slice_merge_max_segment_ms", 10000),
+    }
 
     base_dir = Path("./output") / channel
     audio_dir = base_dir / "audio"
@@ -106,38 +344,75 @@ def main(config_path):
 
     segments_dir.mkdir(parents=True, exist_ok=True)
 
-    for audio_file in audio_dir.glob("*.webm"):
+    # 启用状态库时只处理已下载、未切分的视频，否则扫描音频目录
+    state_db = open_state_db(config)
+    if state_db:
+        audio_files = [audio_dir / f"{video_id}.webm" for video_id in state_db.pending_slices(channel)]
+    else:
+        audio_files = audio_dir.glob("*.webm")
+
+    # 字幕索引只建一次
+    vtt_index = build_subtitle_index(subs_dir)
+
+    jobs = []
+    for audio_file in audio_files:
         video_id = audio_file.stem
 
-        vtt_candidates = list(subs_dir.glob(f"{video_id}.*.vtt"))
-        if not vtt_candidates:
+        vtt_file = vtt_index.get(video_id)
+        if not vtt_file:
             print(f"❌ 找不到字幕：{video_id}")
             continue
 
-        vtt_file = vtt_candidates[0]
-        print(f"✅ 正在处理 {video_id} ... (save_audio={save_audio})")
-
-        seg_output_dir = segments_dir / video_id
-        seg_output_dir.mkdir(parents=True, exist_ok=True)
-
-        seg_info = process_audio_with_vtt(
-            audio_file,
-            vtt_file,
-            seg_output_dir,
-            target_sr,
-            save_audio
-        )
-
-        # 写 JSON（和 wav/ 并列）
-        with open(seg_output_dir / "segments.json", "w", encoding="utf-8") as f:
-            json.dump(seg_info, f, ensure_ascii=False, indent=2)
-
-        print(f"🎉 完成：{len(seg_info)} 段，JSON 已保存 -> {seg_output_dir/'segments.json'}")
+        jobs.append((audio_file, vtt_file, segments_dir / video_id, target_sr, save_audio, mode, vtt_options))
+
+    if mode == "stream":
+        # 多进程并行；峰值内存约为 slice_workers × 单个视频解码后的 PCM 大小
+        max_workers = config.get("slice_workers", os.cpu_count() or 1)
+        print(f"✅ 正在并行处理 {len(jobs)} 个视频 (workers={max_workers}, save_audio={save_audio})")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(slice_one_video, *job): job for job in jobs}
+            for fut in as_completed(futures):
+                seg_output_dir = futures[fut][2]
+                video_id = seg_output_dir.name
+                try:
+                    num_segments = fut.result()
+                except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                    print(f"⚠️ 切分失败：{video_id} ({e})")
+                    if state_db:
+                        state_db.mark_sliced(video_id, "failed")
+                    continue
+
+                print(f"🎉 完成：{video_id} {num_segments} 段，JSON 已保存 -> {seg_output_dir/'segments.json'}")
+                if state_db:
+                    state_db.mark_sliced(video_id, "done", num_segments)
+    else:
+        for job in jobs:
+            seg_output_dir = job[2]
+            video_id = seg_output_dir.name
+            print(f"✅ 正在处理 {video_id} ... (save_audio={save_audio})")
+
+            num_segments = slice_one_video(*job)
+
+            print(f"🎉 完成：{num_segments} 段，JSON 已保存 -> {seg_output_dir/'segments.json'}")
+
+            if state_db:
+                state_db.mark_sliced(video_id, "done", num_segments)
+
+    if state_db:
+        state_db.close()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="根据字幕切分音频，输出统一 wav 文件夹 + 起止时间 + 可选保存音频")
     parser.add_argument("--config", type=str, required=True, help="YAML 配置文件路径")
+    parser.add_argument("--mode", type=str, choices=["pydub", "stream"], default=None,
+                        help="切分模式：pydub = 串行 pydub；stream = ffmpeg 管道解码 + 多进程（默认读取配置 slice_mode）")
     args = parser.parse_args()
 
-    main(config_path=args.config)
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    metrics = setup_metrics("slice", path=config.get("metrics_file"), profile=config.get("metrics_profile"))
+    with metrics.stage("slice"):
+        main(config_path=args.config, mode=args.mode)
+    metrics.close(prometheus=config.get("metrics_prometheus"))
@@ -0,0 +1,330 @@
+import json
+import sqlite3
+import time
+import yaml
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+
+
+STATE_DB_NAME = "crawl_state.sqlite"
+
+# 与 filter.py 输出的 video_metadata-filtered.jsonl 字段保持一致
+FILTERED_FIELDS = [
+    "channel_id",
+    "id",
+    "title",
+    "description",
+    "duration",
+    "upload_date",
+    "like_count",
+    "language",
+    "subtitles"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id        TEXT PRIMARY KEY,
+    channel         TEXT NOT NULL,
+    metadata        TEXT,
+    duration        REAL,
+    filter_verdict  TEXT,              -- NULL / pass / reject
+    filter_reason   TEXT,
+    download_status TEXT NOT NULL DEFAULT 'pending',   -- pending / done / failed
+    file_size       INTEGER,
+    slice_status    TEXT NOT NULL DEFAULT 'pending',   -- pending / done / failed
+    num_segments    INTEGER,
+    updated_at      REAL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_filter   ON videos (channel, filter_verdict);
+CREATE INDEX IF NOT EXISTS idx_videos_download ON videos (channel, download_status);
+CREATE INDEX IF NOT EXISTS idx_videos_slice    ON videos (channel, download_status, slice_status);
+"""
+
+
+class CrawlStateDB:
+    """
+    每个 output_dir 一个 SQLite 状态库，记录每个视频在各阶段的状态：
+    元数据 → 过滤结果 → 下载状态 / 文件大小 → 切分状态
+    所有写操作都在事务中提交，Colab 断线不会留下半条记录
+    """
+
+    def __init__(self, output_root, check_same_thread=True):
+        self.path = Path(output_root) / STATE_DB_NAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # check_same_thread=False 供多线程共用（调用方需自行加锁，见 pipeline.py）
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=check_same_thread)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.conn:
+            yield self.conn
+
+    # ========= 📥 Stage 1: 元数据 =========
+    def upsert_metadata(self, channel, records):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO videos (video_id, channel, metadata, duration, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    channel = excluded.channel,
+                    metadata = excluded.metadata,
+                    duration = excluded.duration,
+                    updated_at = excluded.updated_at
+                """,
+                [
+                    (rec["id"], channel, json.dumps(rec, ensure_ascii=False), rec.get("duration"), now)
+                    for rec in records if rec.get("id")
+                ],
+            )
+
+    def iter_metadata(self, channel):
+        for row in self.conn.execute(
+            "SELECT metadata FROM videos WHERE channel = ? AND metadata IS NOT NULL ORDER BY rowid", (channel,)
+        ):
+            yield json.loads(row["metadata"])
+
+    # ========= 🎯 Stage 2: 过滤 =========
+    def set_filter_verdicts(self, verdicts):
+        """
+        verdicts: [(channel, info, reason)]，reason 为 None 表示通过
+        状态库中还没有的视频（例如未先 import 的旧频道）连同元数据一起插入，
+        否则 pending_downloads 查不到这些视频
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO videos (video_id, channel, metadata, duration, filter_verdict, filter_reason, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    metadata = COALESCE(videos.metadata, excluded.metadata),
+                    duration = COALESCE(videos.duration, excluded.duration),
+                    filter_verdict = excluded.filter_verdict,
+                    filter_reason = excluded.filter_reason,
+                    updated_at = excluded.updated_at
+                """,
+                [
+                    (info["id"], channel, json.dumps(info, ensure_ascii=False), info.get("duration"),
+                     "pass" if reason is None else "reject", reason, now)
+                    for channel, info, reason in verdicts if info.get("id")
+                ],
+            )
+
+    # ========= 🎧 Stage 3: 下载 =========
+    def pending_downloads(self, channel):
+        return [
+            json.loads(row["metadata"])
+            for row in self.conn.execute(
+                """
+                SELECT metadata FROM videos
+                WHERE channel = ? AND filter_verdict = 'pass' AND download_status != 'done'
+                ORDER BY rowid
+                """,
+                (channel,),
+            )
+        ]
+
+    def has_filter_verdicts(self, channel):
+        row = self.conn.execute(
+            "SELECT 1 FROM videos WHERE channel = ? AND filter_verdict IS NOT NULL LIMIT 1", (channel,)
+        ).fetchone()
+        return row is not None
+
+    def downloaded_ids(self, channel):
+        return {
+            row["video_id"]
+            for row in self.conn.execute(
+                "SELECT video_id FROM videos WHERE channel = ? AND download_status = 'done'", (channel,)
+            )
+        }
+
+    def mark_downloaded(self, channel, video_id, status="done", file_size=None):
+        with self.transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO videos (video_id, channel, download_status, file_size, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    download_status = excluded.download_status,
+                    file_size = COALESCE(excluded.file_size, file_size),
+                    updated_at = excluded.updated_at
+                """,
+                (video_id, channel, status, file_size, time.time()),
+            )
+
+    # ========= ✂️ Stage 4: 切分 =========
+    def pending_slices(self, channel):
+        return [
+            row["video_id"]
+            for row in self.conn.execute(
+                """
+                SELECT video_id FROM videos
+                WHERE channel = ? AND download_status = 'done' AND slice_status != 'done'
+                ORDER BY rowid
+                """,
+                (channel,),
+            )
+        ]
+
+    def mark_sliced(self, video_id, status="done", num_segments=None):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE videos SET slice_status = ?, num_segments = ?, updated_at = ? WHERE video_id = ?",
+                (status, num_segments, time.time(), video_id),
+            )
+
+    # ========= 📊 汇总 =========
+    def status(self):
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                """
+                SELECT channel,
+                       COUNT(*) AS videos,
+                       SUM(filter_verdict = 'pass') AS passed,
+                       SUM(download_status = 'done') AS downloaded,
+                       SUM(slice_status = 'done') AS sliced,
+                       COALESCE(SUM(CASE WHEN download_status = 'done' THEN duration END), 0) AS downloaded_seconds,
+                       COALESCE(SUM(file_size), 0) AS bytes
+                FROM videos GROUP BY channel ORDER BY channel
+                """
+            )
+        ]
+
+
+def open_state_db(config):
+    """
+    配置中 `state_db: true` 时返回 CrawlStateDB，否则返回 None
+    """
+    if not config.get("state_db", False):
+        return None
+    return CrawlStateDB(config.get("output_dir", "./output"))
+
+
+def import_channel(db, channel_dir, channel):
+    """
+    将现有的 JSONL / TXT 文件导入状态库：
+      info/video_metadata.jsonl           → 元数据
+      info/video_metadata-filtered.jsonl  → 过滤结果（不在其中的视频记为 reject）
+      downloaded.txt                      → 下载状态 + 文件大小
+      segments/<video_id>/segments.json   → 切分状态
+    """
+    info_dir = channel_dir / "info"
+
+    records = []
+    metadata_file = info_dir / "video_metadata.jsonl"
+    if metadata_file.exists():
+        with open(metadata_file, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    db.upsert_metadata(channel, records)
+
+    filtered_file = info_dir / "video_metadata-filtered.jsonl"
+    if filtered_file.exists():
+        passed = set()
+        with open(filtered_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    passed.add(json.loads(line)["id"])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        db.set_filter_verdicts(
+            [(channel, rec, None if rec["id"] in passed else "not in filtered file") for rec in records if rec.get("id")]
+        )
+
+    downloaded_file = channel_dir / "downloaded.txt"
+    num_downloaded = 0
+    if downloaded_file.exists():
+        with open(downloaded_file, encoding="utf-8") as f:
+            for video_id in (line.strip() for line in f):
+                if not video_id:
+                    continue
+                audio_file = channel_dir / "audio" / f"{video_id}.webm"
+                file_size = audio_file.stat().st_size if audio_file.exists() else None
+                db.mark_downloaded(channel, video_id, "done", file_size)
+                num_downloaded += 1
+
+    num_sliced = 0
+    for seg_json in (channel_dir / "segments").glob("*/segments.json"):
+        with open(seg_json, encoding="utf-8") as f:
+            db.mark_sliced(seg_json.parent.name, "done", len(json.load(f)))
+        num_sliced += 1
+
+    print(f"✅ 导入 {channel}: 元数据 {len(records)} 条，已下载 {num_downloaded}，已切分 {num_sliced}")
+
+
+def export_channel(db, channel_dir, channel):
+    """
+    从状态库导出为现有格式（video_metadata.jsonl / video_metadata-filtered.jsonl / downloaded.txt）
+    """
+    info_dir = channel_dir / "info"
+    info_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = db.conn
+    rows = conn.execute(
+        "SELECT metadata, filter_verdict FROM videos WHERE channel = ? AND metadata IS NOT NULL ORDER BY rowid",
+        (channel,),
+    ).fetchall()
+
+    with open(info_dir / "video_metadata.jsonl", "w", encoding="utf-8") as f_all, \
+         open(info_dir / "video_metadata-filtered.jsonl", "w", encoding="utf-8") as f_pass:
+        for row in rows:
+            f_all.write(row["metadata"] + "\n")
+            if row["filter_verdict"] == "pass":
+                info = json.loads(row["metadata"])
+                filtered_info = {field: info.get(field) for field in FILTERED_FIELDS}
+                f_pass.write(json.dumps(filtered_info, ensure_ascii=False) + "\n")
+
+    with open(channel_dir / "downloaded.txt", "w", encoding="utf-8") as f:
+        for row in conn.execute(
+            "SELECT video_id FROM videos WHERE channel = ? AND download_status = 'done' ORDER BY rowid", (channel,)
+        ):
+            f.write(f"{row['video_id']}\n")
+
+    print(f"✅ 导出 {channel}: {len(rows)} 条元数据 -> {channel_dir}")
+
+
+# ========= 🚀 入口 =========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬虫状态库：导入 / 导出 / 查看进度")
+    parser.add_argument("command", choices=["import", "export", "status"], help="要执行的操作")
+    parser.add_argument("--config", type=str, required=True, help="YAML 配置文件路径")
+    parser.add_argument("--channel", type=str, nargs="*", default=None,
+                        help="要处理的频道（默认使用配置中的 channel）")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    base_output_dir = Path(config.get("output_dir", "./output"))
+    channels = args.channel or [config.get("channel")]
+
+    with CrawlStateDB(base_output_dir) as db:
+        if args.command == "import":
+            for channel in channels:
+                import_channel(db, base_output_dir / channel, channel)
+        elif args.command == "export":
+            for channel in channels:
+                export_channel(db, base_output_dir / channel, channel)
+        else:
+            for row in db.status():
+                print(f"📺 {row['channel']}: 视频 {row['videos']}，通过过滤 {row['passed'] or 0}，"
+                      f"已下载 {row['downloaded'] or 0} ({row['downloaded_seconds'] / 3600:.2f} 小时, "
+                      f"{row['bytes'] / 1e9:.2f} GB)，已切分 {row['sliced'] or 0}")
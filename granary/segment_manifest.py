@@ -0,0 +1,172 @@
+"""
+Timestamp-preserving sentence segmentation of Granary (FasterWhisperInference) output.
+
+split_manifest.py splits transcripts on punctuation but loses all timing, so
+the clips had to be force-aligned again with GigaSpeech2. This script instead
+reads a Granary manifest that still has Whisper's `segments` (e.g.
+manifest_06.json; keep `segments` and set `word_timestamps: True` under
+`inference` for word-level times) and splits on sentence punctuation while
+carrying word start/end times:
+
+  - words come from `segments[].words` when present; otherwise each segment's
+    span is shared out over its words by character length
+  - a sentence ends at a word ending in . ! ? (closing quotes allowed)
+  - sentences longer than --max-duration are cut at the comma / pause closest
+    to their middle, recursively
+  - sentences shorter than --min-duration are merged into a neighbour when the
+    pause between them is short enough, otherwise dropped
+
+Output is one line per sentence, ready for slice_granary.py:
+    {"audio_filepath": ..., "offset": 12.34, "duration": 6.2, "text": ..., "segment_id": 7}
+
+Example usage:
+python segment_manifest.py \
+    --manifest /scratch/users/ntu/daniel02/Granary/id/work/granary_test/output/id/manifest_06.json \
+    --out /scratch/users/ntu/daniel02/Granary/id/work/granary_test/output/id/sentences.json
+python slice_granary.py --manifest .../sentences.json --out-dir ... --mode decode-once
+"""
+
+import argparse
+import json
+import re
+from pathlib import Path
+
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]”’]*$")
+CLAUSE_END = re.compile(r"[,;:]+[\"')\]”’]*$")
+
+
+def entry_words(entry, relative):
+    """Flatten an entry's Whisper segments into [(start, end, word)] with absolute times."""
+    base = float(entry.get("offset") or 0.0) if relative else 0.0
+    words = []
+    for seg in entry.get("segments") or []:
+        if seg.get("words"):
+            for w in seg["words"]:
+                text = (w.get("word") or "").strip()
+                if text:
+                    words.append((base + float(w["start"]), base + float(w["end"]), text))
+            continue
+        tokens = (seg.get("text") or "").split()
+        if not tokens:
+            continue
+        start, end = float(seg["start"]), float(seg["end"])
+        total = sum(len(t) for t in tokens)
+        t = start
+        for token in tokens:
+            step = (end - start) * len(token) / total
+            words.append((base + t, base + t + step, token))
+            t += step
+    return words
+
+
+def split_sentences(words):
+    sentences, current = [], []
+    for w in words:
+        current.append(w)
+        if SENTENCE_END.search(w[2]):
+            sentences.append(current)
+            current = []
+    if current:
+        sentences.append(current)
+    return sentences
+
+
+def span(words):
+    return words[-1][1] - words[0][0]
+
+
+def split_long(words, max_duration):
+    """Cut at the word boundary that scores best: clause punctuation, long pause, near the middle."""
+    if span(words) <= max_duration or len(words) < 2:
+        return [words]
+    middle = words[0][0] + span(words) / 2
+    best, best_score = None, None
+    for i in range(1, len(words)):
+        gap = words[i][0] - words[i - 1][1]
+        score = abs(words[i][0] - middle) - 2.0 * gap - (1.0 if CLAUSE_END.search(words[i - 1][2]) else 0.0)
+        if best_score is None or score < best_score:
+            best, best_score = i, score
+    return split_long(words[:best], max_duration) + split_long(words[best:], max_duration)
+
+
+def merge_short(sentences, min_duration, max_duration, max_gap):
+    """Merge sentences below min_duration into the nearer neighbour (if it fits), else drop them."""
+    out = []
+    i = 0
+    while i < len(sentences):
+        s = sentences[i]
+        if span(s) >= min_duration:
+            out.append(s)
+            i += 1
+            continue
+        gap_prev = s[0][0] - out[-1][-1][1] if out else None
+        gap_next = sentences[i + 1][0][0] - s[-1][1] if i + 1 < len(sentences) else None
+        can_prev = gap_prev is not None and gap_prev <= max_gap and s[-1][1] - out[-1][0][0] <= max_duration
+        can_next = gap_next is not None and gap_next <= max_gap and sentences[i + 1][-1][1] - s[0][0] <= max_duration
+        if can_next and (not can_prev or gap_next < gap_prev):
+            sentences[i + 1] = s + sentences[i + 1]
+        elif can_prev:
+            out[-1] = out[-1] + s
+        i += 1
+    return [s for s in out if span(s) >= min_duration]
+
+
+def segment_entry(entry, args):
+    words = entry_words(entry, args.timestamps == "relative" and "offset" in entry)
+    sentences = []
+    for s in split_sentences(words):
+        sentences += split_long(s, args.max_duration)
+    sentences = merge_short(sentences, args.min_duration, args.max_duration, args.max_merge_gap)
+
+    rows = []
+    for k, s in enumerate(sentences):
+        prev_end = sentences[k - 1][-1][1] if k else 0.0
+        next_start = sentences[k + 1][0][0] if k + 1 < len(sentences) else None
+        start = max(s[0][0] - args.pad, (prev_end + s[0][0]) / 2 if k else 0.0)
+        end = s[-1][1] + args.pad
+        if next_start is not None:
+            end = min(end, (s[-1][1] + next_start) / 2)
+        rows.append({"start": start, "end": end, "text": " ".join(w[2] for w in s)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split Granary transcripts into timed sentences for slice_granary.py.")
+    parser.add_argument("--manifest", required=True, help="Granary manifest with Whisper `segments` (and `words`)")
+    parser.add_argument("--out", required=True, help="Output JSONL with offset / duration / text")
+    parser.add_argument("--min-duration", type=float, default=1.0, help="Shortest sentence to keep (s)")
+    parser.add_argument("--max-duration", type=float, default=20.0, help="Longer sentences are split (s)")
+    parser.add_argument("--max-merge-gap", type=float, default=1.0, help="Only merge short sentences across pauses up to this (s)")
+    parser.add_argument("--pad", type=float, default=0.1, help="Seconds added on each side, never past the neighbouring midpoint")
+    parser.add_argument("--timestamps", choices=["relative", "absolute"], default="relative",
+                        help="relative: segment times count from the entry's offset (slice_by_offset); absolute: from file start")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    next_id = {}
+    n_entries = n_sentences = 0
+    seconds = 0.0
+    with open(args.manifest, "r", encoding="utf-8") as f, open(out, "w", encoding="utf-8") as g:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            n_entries += 1
+            src = entry["audio_filepath"]
+            for row in segment_entry(entry, args):
+                seg_id = next_id.get(src, 0)
+                next_id[src] = seg_id + 1
+                ex = {"audio_filepath": src, "offset": round(row["start"], 3),
+                      "duration": round(row["end"] - row["start"], 3), "text": row["text"], "segment_id": seg_id}
+                if "source_lang" in entry:
+                    ex["source_lang"] = entry["source_lang"]
+                g.write(json.dumps(ex, ensure_ascii=False) + "\n")
+                n_sentences += 1
+                seconds += ex["duration"]
+
+    print(f"{n_entries} entries -> {n_sentences} sentences ({seconds / 3600:.2f} h) in {out}")
+
+
+if __name__ == "__main__":
+    main()
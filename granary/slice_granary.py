@@ -1,38 +1,116 @@
 #!/usr/bin/env python3
-import json, subprocess
+import json, subprocess, wave
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import argparse
+import os
+import sys
 
-def main():
-    ap = argparse.ArgumentParser(description="Cut clips from a Granary JSONL.")
-    ap.add_argument("--manifest", required=True)
-    ap.add_argument("--out-dir", required=True)
-    args = ap.parse_args()
+import numpy as np
 
-    manifest = Path(args.manifest)
-    out_dir = Path(args.out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+from metrics import get_metrics, setup as setup_metrics  # noqa: E402
 
+SR = 16000
+
+def clip_path(out_dir, src, ex):
+    off = float(ex["offset"]); dur = float(ex["duration"])
+    seg = ex.get("segment_id", 0)
+    return out_dir / f"{src.stem}_seg{seg}_o{int(off*1000)}ms_d{int(dur*1000)}ms.wav"
+
+def write_sidecar(out, ex):
+    # sidecar text if present
+    txt = (ex.get("text") or "").strip()
+    if txt:
+        (out.with_suffix(".txt")).write_text(txt + "\n", encoding="utf-8")
+
+def cut_with_ffmpeg(manifest, out_dir):
+    """One ffmpeg process per manifest line."""
     with open(manifest, "r", encoding="utf-8") as f:
         for line in f:
-            if not line.strip(): 
+            if not line.strip():
                 continue
             ex = json.loads(line)
             src = Path(ex["audio_filepath"]).resolve()
             off = float(ex["offset"]); dur = float(ex["duration"])
-            seg = ex.get("segment_id", 0)
-            stem = src.stem
-            out = out_dir / f"{stem}_seg{seg}_o{int(off*1000)}ms_d{int(dur*1000)}ms.wav"
+            out = clip_path(out_dir, src, ex)
             if out.exists():
                 continue
-            subprocess.run([
-                "ffmpeg","-hide_banner","-loglevel","error","-y",
-                "-ss", f"{off:.6f}", "-t", f"{dur:.6f}",
-                "-i", str(src), "-ar","16000","-ac","1", str(out)
-            ], check=True)
-            # sidecar text if present
-            txt = (ex.get("text") or "").strip()
-            if txt:
-                (out.with_suffix(".txt")).write_text(txt + "\n", encoding="utf-8")
+            metrics = get_metrics()
+            with metrics.item("cut", out.name):
+                subprocess.run([
+                    "ffmpeg","-hide_banner","-loglevel","error","-y",
+                    "-ss", f"{off:.6f}", "-t", f"{dur:.6f}",
+                    "-i", str(src), "-ar","16000","-ac","1", str(out)
+                ], check=True)
+                write_sidecar(out, ex)
+                metrics.count("segments"); metrics.count("audio_seconds_written", dur)
+
+def cut_source(src, entries, out_dir):
+    """Decode one source once to 16 kHz mono and cut all of its segments from memory."""
+    todo = [(clip_path(out_dir, src, ex), ex) for ex in entries]
+    todo = [(out, ex) for out, ex in todo if not out.exists()]
+    if not todo:
+        return 0
+    metrics = get_metrics()
+    with metrics.item("cut", src.name):
+        pcm = subprocess.run([
+            "ffmpeg","-nostdin","-hide_banner","-loglevel","error",
+            "-i", str(src), "-f","s16le","-ar",str(SR),"-ac","1","-"
+        ], stdout=subprocess.PIPE, check=True).stdout
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        metrics.count("audio_seconds_decoded", len(samples) / SR)
+        for out, ex in sorted(todo, key=lambda t: float(t[1]["offset"])):
+            start = int(round(float(ex["offset"]) * SR))
+            end = start + int(round(float(ex["duration"]) * SR))
+            tmp = out.with_name(out.name + ".tmp")
+            with wave.open(str(tmp), "wb") as w:
+                w.setnchannels(1); w.setsampwidth(2); w.setframerate(SR)
+                w.writeframes(memoryview(samples[start:end]))
+            tmp.replace(out)
+            write_sidecar(out, ex)
+            metrics.count("audio_seconds_written", len(samples[start:end]) / SR)
+        metrics.count("segments", len(todo))
+    return len(todo)
+
+def cut_decode_once(manifest, out_dir, workers):
+    """Group manifest lines by source and process sources in parallel."""
+    by_src = defaultdict(list)
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            ex = json.loads(line)
+            by_src[Path(ex["audio_filepath"]).resolve()].append(ex)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(cut_source, src, entries, out_dir): src for src, entries in by_src.items()}
+        for fut, src in futures.items():
+            print(f"{src.name}: {fut.result()} clips")
+
+def main():
+    ap = argparse.ArgumentParser(description="Cut clips from a Granary JSONL.")
+    ap.add_argument("--manifest", required=True)
+    ap.add_argument("--out-dir", required=True)
+    ap.add_argument("--mode", choices=["ffmpeg", "decode-once"], default="ffmpeg",
+                    help="ffmpeg: one process per segment; decode-once: decode each source once and cut in memory")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--metrics", default=None, help="Append timing/throughput records to this JSONL file")
+    ap.add_argument("--prometheus", default=None, help="Also write run totals to this Prometheus textfile")
+    ap.add_argument("--profile", default=None, help="Comma-separated stages to run under cProfile (or 'all')")
+    args = ap.parse_args()
+
+    manifest = Path(args.manifest)
+    out_dir = Path(args.out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+
+    metrics = setup_metrics("slice_granary", path=args.metrics, profile=args.profile)
+    with metrics.stage(args.mode):
+        if args.mode == "decode-once":
+            cut_decode_once(manifest, out_dir, args.workers)
+        else:
+            cut_with_ffmpeg(manifest, out_dir)
+    metrics.close(prometheus=args.prometheus)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
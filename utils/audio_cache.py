@@ -0,0 +1,242 @@
+"""
+Decode-once audio cache shared by the GigaSpeech2, Granary and crawler pipelines.
+
+Every source file (.webm from the crawler) is decoded exactly once to a
+canonical 16 kHz mono int16 file, either FLAC (lossless, ~half the size) or
+WAV (plain int16 PCM that can be read without a decoder). Cached files are
+keyed by content hash, with the video ID kept as the file stem:
+    CACHE_DIR/<channel>/<sha1[:16]>/<video_id>.flac
+so a re-downloaded video with different bytes gets a fresh decode, while an
+unchanged (or merely touched / moved) file is never decoded again. Sources
+are decoded in parallel and each output is written to a temporary file and
+renamed, so an interrupted run never leaves a partial file behind and
+re-running only processes new or changed sources. Sources may be deleted
+once cached; their decodes are kept until --prune.
+
+Downstream consumers point at the cached decode instead of the .webm:
+    --manifest-granary FILE   {"source_audio_filepath": ...} lines (same format as granary/input_manifest.sh)
+    --manifest-nemo FILE      {"audio_filepath": ..., "duration": ...} lines
+    --list FILE               one cached path per line (sox / shell loops)
+    --link-dir DIR            DIR/<channel>/<video_id>.flac symlinks, for scripts that take a directory
+From Python use AudioCache(cache_dir).lookup(source_path_or_video_id) and
+load_pcm(path).
+
+Output in --cache-dir:
+    <channel>/<hash>/<video_id>.<flac|wav>     cached decodes (stem = video ID, as for the .webm)
+    index.json                                 source path -> {video_id, channel, size, mtime, sha1, file, duration}
+
+Example usage:
+python audio_cache.py --base /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono \
+    --cache-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/audio_cache \
+    --manifest-granary /scratch/users/ntu/daniel02/Granary/input_manifest.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_durations import channel_of, find_audio_files
+
+SAMPLE_RATE = 16000
+FORMATS = ("flac", "wav")
+
+
+def content_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def flac_duration(path):
+    """Total samples / sample rate from the FLAC STREAMINFO block (written by ffmpeg on close)."""
+    with open(path, "rb") as f:
+        header = f.read(8 + 34)
+    if header[:4] != b"fLaC":
+        return None
+    info = header[8:]
+    sample_rate = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    total_samples = ((info[13] & 0x0F) << 32) | int.from_bytes(info[14:18], "big")
+    return total_samples / sample_rate if sample_rate and total_samples else None
+
+
+def wav_duration(path):
+    with wave.open(str(path), "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+
+def cache_one(src, cache_dir, rel_dir, video_id, fmt):
+    """Hash, then decode src unless a file with the same content hash is already cached."""
+    sha1 = content_hash(src)
+    rel = Path(rel_dir) / sha1[:16] / f"{video_id}.{fmt}"
+    out = Path(cache_dir) / rel
+    if not out.exists():
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_name(out.name + ".tmp")
+        codec = ["-c:a", "flac", "-f", "flac"] if fmt == "flac" else ["-c:a", "pcm_s16le", "-f", "wav"]
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-i", str(src), "-map_metadata", "-1", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-sample_fmt", "s16", *codec, str(tmp)
+        ], check=True)
+        os.replace(tmp, out)
+    duration = flac_duration(out) if fmt == "flac" else wav_duration(out)
+    return sha1, str(rel), duration
+
+
+def load_pcm(path):
+    """Samples of a cached file as int16 at 16 kHz (WAV is read directly, FLAC through ffmpeg)."""
+    path = Path(path)
+    if path.suffix == ".wav":
+        with wave.open(str(path), "rb") as w:
+            return np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    proc = subprocess.run([
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", str(path), "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"
+    ], stdout=subprocess.PIPE, check=True)
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+class AudioCache:
+    """Read-only view of a cache directory for downstream scripts."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        index_file = self.cache_dir / "index.json"
+        self.index = json.loads(index_file.read_text(encoding="utf-8")) if index_file.exists() else {}
+        self.by_video_id = {entry["video_id"]: src for src, entry in self.index.items()}
+
+    def lookup(self, source):
+        """
+        Cached file for a source path or video ID, or None when it is not cached
+        or the source has changed since it was decoded.
+        """
+        src = self.by_video_id.get(str(source)) or str(Path(source).resolve())
+        entry = self.index.get(src)
+        if entry is None:
+            return None
+        if os.path.exists(src):  # the source may have been deleted after caching
+            st = os.stat(src)
+            if st.st_size != entry["size"] or st.st_mtime != entry["mtime"]:
+                return None
+        path = self.cache_dir / entry["file"]
+        return path if path.exists() else None
+
+    def entries(self):
+        """(source, cached path, entry) for every cached file, sorted by source."""
+        for src in sorted(self.index):
+            entry = self.index[src]
+            yield src, self.cache_dir / entry["file"], entry
+
+
+def write_lines(path, lines):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+    os.replace(tmp, path)
+
+
+def write_manifests(cache, granary=None, nemo=None, list_file=None, link_dir=None):
+    entries = list(cache.entries())
+    if granary:
+        write_lines(granary, (json.dumps({"source_audio_filepath": str(p)}, ensure_ascii=False) for _, p, _ in entries))
+    if nemo:
+        write_lines(nemo, (json.dumps({"audio_filepath": str(p), "duration": e["duration"]}, ensure_ascii=False)
+                           for _, p, e in entries))
+    if list_file:
+        write_lines(list_file, (str(p) for _, p, _ in entries))
+    if link_dir:
+        for _, p, e in entries:
+            link = Path(link_dir) / e["channel"] / f"{e['video_id']}{p.suffix}"
+            link.parent.mkdir(parents=True, exist_ok=True)
+            if link.is_symlink() or link.exists():
+                if link.resolve() == p.resolve():
+                    continue
+                link.unlink()
+            link.symlink_to(p.resolve())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode every source once into a shared 16 kHz mono audio cache.")
+    parser.add_argument("--base", required=True, help="Root directory with one sub-directory per channel")
+    parser.add_argument("--cache-dir", required=True, help="Where cached decodes and index.json are kept")
+    parser.add_argument("--ext", default="webm", help="Source audio file extension to scan")
+    parser.add_argument("--format", choices=FORMATS, default="flac", help="Cached file format (both are 16 kHz mono int16)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    parser.add_argument("--prune", action="store_true", help="Forget (and delete) decodes whose source file is gone")
+    parser.add_argument("--manifest-granary", default=None, help="Write {\"source_audio_filepath\"} input manifest")
+    parser.add_argument("--manifest-nemo", default=None, help="Write {\"audio_filepath\", \"duration\"} manifest")
+    parser.add_argument("--list", default=None, help="Write one cached path per line")
+    parser.add_argument("--link-dir", default=None, help="Create <channel>/<video_id> symlinks to the cached files")
+    args = parser.parse_args()
+
+    base = Path(args.base).resolve()
+    cache_dir = Path(args.cache_dir).resolve()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index_file = cache_dir / "index.json"
+    index = json.loads(index_file.read_text(encoding="utf-8")) if index_file.exists() else {}
+
+    # === Decode new / changed sources ===
+    todo = []
+    for path in find_audio_files(base, args.ext):
+        st = path.stat()
+        key = str(path)
+        entry = index.get(key)
+        if (entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime
+                and entry["file"].endswith(f".{args.format}")
+                and (cache_dir / entry["file"]).exists()):
+            continue
+        index[key] = {"video_id": path.stem, "channel": channel_of(path, base),
+                      "size": st.st_size, "mtime": st.st_mtime}
+        todo.append(key)
+    print(f"Caching {len(todo)} new/changed files ({len(index)} sources)")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            key: pool.submit(cache_one, key, cache_dir, index[key]["channel"], index[key]["video_id"], args.format)
+            for key in todo
+        }
+        for key, fut in futures.items():
+            try:
+                sha1, rel, duration = fut.result()
+            except subprocess.CalledProcessError as e:
+                print(f"Failed: {key} ({e})")
+                index.pop(key)
+                continue
+            index[key].update(sha1=sha1, file=rel, duration=duration)
+
+    # Sources deleted after caching stay usable unless --prune; decodes of old content are always removed
+    if args.prune:
+        index = {k: v for k, v in index.items() if Path(k).exists()}
+    referenced = {v["file"] for v in index.values()}
+    for fmt in FORMATS:
+        for cached in cache_dir.glob(f"*/*/*.{fmt}"):
+            if str(cached.relative_to(cache_dir)) not in referenced:
+                cached.unlink()
+                if not any(cached.parent.iterdir()):
+                    cached.parent.rmdir()
+
+    tmp = index_file.with_name("index.json.tmp")
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    os.replace(tmp, index_file)
+
+    hours = sum(v["duration"] or 0 for v in index.values()) / 3600
+    print(f"Cache holds {len(index)} sources ({hours:.2f} h) in {cache_dir}")
+
+    write_manifests(AudioCache(cache_dir), granary=args.manifest_granary, nemo=args.manifest_nemo,
+                    list_file=args.list, link_dir=args.link_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Audio duration catalogue for crawled .webm files.
+
+Durations are read straight from the Matroska/EBML Segment Info header
+(Duration x TimestampScale), falling back to ffprobe only when the header
+has no Duration element or the file is not Matroska. Results are cached
+in a JSON file keyed by (path, size, mtime), so repeated status reports
+only touch new or modified files. Files whose duration cannot be read are
+reported separately and not cached, so they are probed again next time.
+
+Channels are taken from the first directory under BASE, so both
+    BASE/<channel>/audio/*.webm
+    BASE/<channel>/audio/batch_*/*.webm
+are grouped per channel.
+
+Example usage:
+python audio_durations.py --base /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono
+"""
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+EBML_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+INFO_ID = 0x1549A966
+CLUSTER_ID = 0x1F43B675
+TIMESTAMP_SCALE_ID = 0x2AD7B1
+DURATION_ID = 0x4489
+UNKNOWN_SIZE = -1
+
+
+def _read_vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    b = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not (b & mask):
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise ValueError("invalid EBML variable-length integer")
+
+    value = b if keep_marker else b & (mask - 1)
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        raise EOFError
+    all_ones = value == mask - 1
+    for byte in rest:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return UNKNOWN_SIZE
+    return value
+
+
+def _read_element_header(f):
+    element_id = _read_vint(f, keep_marker=True)
+    size = _read_vint(f, keep_marker=False)
+    return element_id, size
+
+
+def matroska_duration(path):
+    """Return the duration in seconds from the Segment Info header, or None if absent."""
+    with open(path, "rb") as f:
+        element_id, size = _read_element_header(f)
+        if element_id != EBML_ID:
+            return None
+        f.seek(size, os.SEEK_CUR)
+
+        element_id, _ = _read_element_header(f)
+        if element_id != SEGMENT_ID:
+            return None
+
+        # Walk top-level Segment children until Info (stop at the first Cluster)
+        while True:
+            try:
+                element_id, size = _read_element_header(f)
+            except EOFError:
+                return None
+            if element_id == CLUSTER_ID or size == UNKNOWN_SIZE:
+                return None
+            if element_id != INFO_ID:
+                f.seek(size, os.SEEK_CUR)
+                continue
+
+            info_end = f.tell() + size
+            timestamp_scale = 1_000_000
+            duration = None
+            while f.tell() < info_end:
+                child_id, child_size = _read_element_header(f)
+                payload = f.read(child_size)
+                if child_id == TIMESTAMP_SCALE_ID:
+                    timestamp_scale = int.from_bytes(payload, "big")
+                elif child_id == DURATION_ID:
+                    duration = struct.unpack(">f" if child_size == 4 else ">d", payload)[0]
+            if duration is None:
+                return None
+            return duration * timestamp_scale / 1e9
+
+
+def ffprobe_duration(path):
+    """Fallback: ask ffprobe for the container duration (None if it fails)."""
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+        ).stdout.strip()
+        return float(out)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        return None
+
+
+def probe_duration(path):
+    try:
+        duration = matroska_duration(path)
+    except (OSError, ValueError, EOFError, struct.error):
+        duration = None
+    if duration is None:
+        duration = ffprobe_duration(path)
+    return duration
+
+
+class DurationCatalogue:
+    """
+    Persistent {path: (size, mtime, seconds)} cache.
+
+    Usage:
+        cat = DurationCatalogue(cache_path)
+        durations = cat.scan(files, workers=16)   # {Path: seconds}, unreadable files left out
+        cat.failed                                # [Path] that could not be probed in the last scan
+        cat.save()
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.entries = {}
+        self.failed = []
+        self._lock = threading.Lock()
+        if self.cache_path and self.cache_path.exists():
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, path):
+        path = Path(path)
+        st = path.stat()
+        key = str(path.resolve())
+        cached = self.entries.get(key)
+        if cached and cached["size"] == st.st_size and cached["mtime"] == st.st_mtime:
+            return cached["duration"]
+
+        duration = probe_duration(path)
+        with self._lock:
+            if duration is None:
+                self.entries.pop(key, None)
+            else:
+                self.entries[key] = {"size": st.st_size, "mtime": st.st_mtime, "duration": duration}
+        return duration
+
+    def scan(self, paths, workers=8):
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self.get, paths))
+        self.failed = [p for p, d in zip(paths, results) if d is None]
+        return {p: d for p, d in zip(paths, results) if d is not None}
+
+    def save(self):
+        if not self.cache_path:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.cache_path)
+
+
+def find_audio_files(base, ext="webm"):
+    return sorted(p for p in Path(base).rglob(f"*.{ext}") if p.is_file())
+
+
+def channel_of(path, base):
+    rel = Path(path).relative_to(base)
+    return rel.parts[0] if len(rel.parts) > 1 else Path(base).name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-channel and total audio hours with a cached duration catalogue.")
+    parser.add_argument("--base", required=True, help="Root directory, e.g. raw_audio/mono (one sub-directory per channel)")
+    parser.add_argument("--ext", default="webm", help="Audio file extension to scan")
+    parser.add_argument("--cache", default=None, help="Duration cache JSON (default: <base>/.duration_cache.json)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of probe threads")
+    args = parser.parse_args()
+
+    base = Path(args.base).resolve()
+    if not base.exists():
+        raise FileNotFoundError(f"Base directory not found: {base}")
+
+    catalogue = DurationCatalogue(args.cache or base / ".duration_cache.json")
+    durations = catalogue.scan(find_audio_files(base, args.ext), workers=args.workers)
+    catalogue.save()
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for path, seconds in durations.items():
+        stats = totals[channel_of(path, base)]
+        stats[0] += 1
+        stats[1] += seconds
+
+    print(f"Summary of all channels in {base}")
+    print("-" * 52)
+    for channel, (count, seconds) in sorted(totals.items()):
+        print(f"Channel : {channel}")
+        print(f"  Files : {count}")
+        print(f"  Hours : {seconds / 3600:.2f}")
+    print("-" * 52)
+    print("GRAND TOTAL")
+    print(f"  Files : {sum(c for c, _ in totals.values())}")
+    print(f"  Hours : {sum(s for _, s in totals.values()) / 3600:.2f}")
+    if catalogue.failed:
+        print("-" * 52)
+        print(f"UNREADABLE ({len(catalogue.failed)} files, not counted)")
+        for path in catalogue.failed:
+            print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
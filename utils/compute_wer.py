@@ -1,46 +1,174 @@
-import json 
-from pathlib import Path 
-import jiwer
+"""
+Measure data loss at the force alignment stage as WER between the Whisper
+transcripts (corpus/*.txt) and the aligned segments (output_force_align/
+<id>_manifest.jsonl), for every channel and batch under WORK_ROOT:
+
+    WORK_ROOT/<mode>/<channel>/[batch_*/]corpus
+    WORK_ROOT/<mode>/<channel>/[batch_*/]output_force_align
+
+Text is lower-cased, punctuation is removed and whitespace collapsed before
+scoring (as with the previous jiwer transform). Edit operations are
+computed per pair across a process pool with a row-vectorised NumPy
+Levenshtein kernel, and overall WER is aggregated from summed substitution,
+deletion, insertion and reference word counts.
+
+Writes <channel>/metrics/wer_report.txt per channel and a combined TSV.
+
+Example usage:
+python compute_wer.py --work-root /scratch/users/ntu/daniel02/GigaSpeech2/id/work
+"""
+
+import argparse
+import json
+import os
+import sys
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
 
-CORPUS_DIR = Path("/scratch/users/ntu/daniel02/GigaSpeech2/id/work/podcastbahasaindonesiabers5467/corpus")
-ALIGN_DIR = Path("/scratch/users/ntu/daniel02/GigaSpeech2/id/work/podcastbahasaindonesiabers5467/output_force_align")
-REPORT_PATH = Path("/scratch/users/ntu/daniel02/GigaSpeech2/id/work/podcastbahasaindonesiabers5467/metrics/wer_report.txt")
-REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
-
-wers = []
-refs_all, hyps_all = [], []
-
-tr = jiwer.Compose([
-    jiwer.ToLowerCase(),
-    jiwer.RemovePunctuation(),
-    jiwer.RemoveMultipleSpaces(),
-    jiwer.Strip(),
-	jiwer.ReduceToListOfListOfWords()
-])
-
-for txt_file in CORPUS_DIR.glob("*.txt"):
-	audio_id = txt_file.stem
-	manifest = ALIGN_DIR/f"{audio_id}_manifest.jsonl"
-	if not manifest.exists():
-		continue
-	reference = txt_file.read_text(encoding="utf-8").replace("\n", " ").strip()
-	with manifest.open("r", encoding="utf-8") as f:
-		hypothesis = " ".join(json.loads(line)["text"] for line in f)
-		
-	if reference:
-		wers.append(jiwer.wer(reference, hypothesis, reference_transform=tr, hypothesis_transform=tr))
-		refs_all.append(reference)
-		hyps_all.append(hypothesis)
-
-overall = jiwer.wer(" ".join(refs_all), " ".join(hyps_all), reference_transform=tr, hypothesis_transform=tr)
-average = np.mean(wers) if wers else float("nan")
-
-ref_transformed = tr(refs_all)
-num_words = sum(len(words) for words in ref_transformed)
-
-with REPORT_PATH.open("w", encoding="utf-8") as w:
-	w.write(f"Pairs evaluated: {len(wers)}\n")
-	w.write(f"Number of Words: {num_words}\n")
-	w.write(f"Overall WER: {overall:.4%}\n")
-	w.write(f"Average WER: {average:.4%}")
\ No newline at end of file
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from metrics import setup as setup_metrics  # noqa: E402
+
+# Each operation adds 1 error; substitutions also add 1 to the low bits, so a
+# single int64 key tracks (errors, substitutions) through the DP.
+ERR = 1 << 32
+
+
+def normalise(text):
+    text = "".join(ch for ch in text.lower() if not unicodedata.category(ch).startswith("P"))
+    return text.split()
+
+
+def edit_ops(ref, hyp):
+    """Return (substitutions, deletions, insertions) for two word lists."""
+    n, m = len(ref), len(hyp)
+    if n == 0 or m == 0:
+        return 0, n, m
+
+    vocab = {}
+    ref_ids = np.array([vocab.setdefault(w, len(vocab)) for w in ref], dtype=np.int64)
+    hyp_ids = np.array([vocab.setdefault(w, len(vocab)) for w in hyp], dtype=np.int64)
+
+    cols = np.arange(m + 1, dtype=np.int64) * ERR
+    row = cols.copy()                                   # first row: all insertions
+    for i in range(n):
+        sub_cost = np.where(hyp_ids == ref_ids[i], 0, ERR + 1)
+        best = np.empty(m + 1, dtype=np.int64)
+        best[0] = row[0] + ERR                          # deletion
+        best[1:] = np.minimum(row[1:] + ERR, row[:-1] + sub_cost)
+        # insertions along the row: best[j] = min_k<=j (best[k] + (j-k)*ERR)
+        row = np.minimum.accumulate(best - cols) + cols
+
+    errors, subs = divmod(int(row[-1]), ERR)
+    dels = (errors - subs + n - m) // 2
+    ins = errors - subs - dels
+    return subs, dels, ins
+
+
+def score_pair(txt_file, manifest):
+    reference = Path(txt_file).read_text(encoding="utf-8").replace("\n", " ").strip()
+    if not reference:
+        return None
+    with open(manifest, "r", encoding="utf-8") as f:
+        hypothesis = " ".join(json.loads(line)["text"] for line in f if line.strip())
+
+    ref, hyp = normalise(reference), normalise(hypothesis)
+    if not ref:  # e.g. a transcript of only punctuation
+        return None
+    subs, dels, ins = edit_ops(ref, hyp)
+    return subs, dels, ins, len(ref)
+
+
+def find_pairs(work_root):
+    """Yield (channel, batch, txt_file, manifest) for every corpus/alignment pair."""
+    for corpus in sorted(work_root.glob("**/corpus")):
+        align_dir = corpus.parent / "output_force_align"
+        if not align_dir.is_dir():
+            continue
+        rel = corpus.parent.relative_to(work_root).parts
+        channel = "/".join(rel[:2])
+        batch = rel[2] if len(rel) > 2 else "-"
+        for txt_file in sorted(corpus.glob("*.txt")):
+            manifest = align_dir / f"{txt_file.stem}_manifest.jsonl"
+            if manifest.exists():
+                yield channel, batch, txt_file, manifest
+
+
+def wer(stats):
+    return (stats["S"] + stats["D"] + stats["I"]) / stats["N"] if stats["N"] else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Corpus-wide WER between Whisper transcripts and force-aligned segments.")
+    parser.add_argument("--work-root", required=True, help="Root of the work dir (<mode>/<channel>/[batch_*/])")
+    parser.add_argument("--report", default=None, help="Combined TSV report (default: <work-root>/wer_report.tsv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    parser.add_argument("--metrics", default=None, help="Append timing/throughput records to this JSONL file")
+    parser.add_argument("--prometheus", default=None, help="Also write run totals to this Prometheus textfile")
+    parser.add_argument("--profile", default=None, help="Comma-separated stages to run under cProfile (or 'all')")
+    args = parser.parse_args()
+    metrics = setup_metrics("compute_wer", path=args.metrics, profile=args.profile)
+
+    work_root = Path(args.work_root).resolve()
+    with metrics.stage("find") as record:
+        pairs = list(find_pairs(work_root))
+        record["pairs"] = len(pairs)
+    print(f"Found {len(pairs)} corpus/alignment pairs")
+
+    with metrics.stage("score") as record, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(score_pair, [p[2] for p in pairs], [p[3] for p in pairs], chunksize=8))
+        record["words"] = sum(r[3] for r in results if r is not None)
+    skipped = sum(r is None for r in results)
+    if skipped:
+        print(f"Skipped {skipped} pairs with an empty reference after normalisation")
+
+    def empty():
+        return {"S": 0, "D": 0, "I": 0, "N": 0, "pairs": 0, "wers": []}
+
+    by_batch = defaultdict(empty)
+    by_channel = defaultdict(empty)
+    for (channel, batch, _, _), result in zip(pairs, results):
+        if result is None:
+            continue
+        subs, dels, ins, num_words = result
+        for stats in (by_batch[(channel, batch)], by_channel[channel]):
+            stats["S"] += subs
+            stats["D"] += dels
+            stats["I"] += ins
+            stats["N"] += num_words
+            stats["pairs"] += 1
+            stats["wers"].append((subs + dels + ins) / num_words)
+
+    report_path = Path(args.report) if args.report else work_root / "wer_report.tsv"
+    with open(report_path, "w", encoding="utf-8") as w:
+        w.write("channel\tbatch\tpairs\twords\tsub\tdel\tins\toverall_wer\taverage_wer\n")
+        for (channel, batch), stats in sorted(by_batch.items()):
+            w.write(f"{channel}\t{batch}\t{stats['pairs']}\t{stats['N']}\t{stats['S']}\t{stats['D']}\t{stats['I']}"
+                    f"\t{wer(stats):.4f}\t{np.mean(stats['wers']):.4f}\n")
+        for channel, stats in sorted(by_channel.items()):
+            w.write(f"{channel}\tALL\t{stats['pairs']}\t{stats['N']}\t{stats['S']}\t{stats['D']}\t{stats['I']}"
+                    f"\t{wer(stats):.4f}\t{np.mean(stats['wers']):.4f}\n")
+
+    for channel, stats in sorted(by_channel.items()):
+        channel_report = work_root / channel / "metrics" / "wer_report.txt"
+        channel_report.parent.mkdir(parents=True, exist_ok=True)
+        with channel_report.open("w", encoding="utf-8") as w:
+            w.write(f"Pairs evaluated: {stats['pairs']}\n")
+            w.write(f"Number of Words: {stats['N']}\n")
+            w.write(f"Substitutions / Deletions / Insertions: {stats['S']} / {stats['D']} / {stats['I']}\n")
+            w.write(f"Overall WER: {wer(stats):.4%}\n")
+            w.write(f"Average WER: {np.mean(stats['wers']):.4%}\n")
+            for (ch, batch), batch_stats in sorted(by_batch.items()):
+                if ch == channel and batch != "-":
+                    w.write(f"  {batch}: {wer(batch_stats):.4%} ({batch_stats['pairs']} pairs, {batch_stats['N']} words)\n")
+        print(f"{channel}: {wer(stats):.2%} over {stats['N']} words ({stats['pairs']} pairs)")
+
+    print(f"Report: {report_path}")
+    metrics.close(prometheus=args.prometheus)
+
+
+if __name__ == "__main__":
+    main()
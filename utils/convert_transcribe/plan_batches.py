@@ -0,0 +1,161 @@
+"""
+Duration-balanced batch planner for the PBS array jobs.
+
+Replaces the fixed 50-files-per-folder split of batching.sh. Files in
+IN_DIR are packed either into K batches with the longest-processing-time
+first (LPT) heuristic, or into batches capped at a target number of audio
+hours (first-fit decreasing). The result is written as the usual
+
+    IN_DIR/batch_NNN/<video>.webm
+
+layout that conv_asr.pbs / align.pbs / filter.pbs resolve from
+PBS_ARRAY_INDEX, plus a batches.tsv manifest (batch, seconds, path).
+
+Example usage:
+python plan_batches.py --in-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono/Idntimes/audio --num-batches 20
+python plan_batches.py --in-dir ... --max-hours 6 --mode symlink --rtf 0.15
+"""
+
+import argparse
+import heapq
+import os
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from audio_durations import DurationCatalogue  # noqa: E402
+
+SUBFOLDER_PREFIX = "batch_"
+
+
+def pack_lpt(durations, num_batches):
+    """Assign each file to the currently lightest of K batches, longest files first."""
+    heap = [(0.0, i) for i in range(num_batches)]
+    batches = [[] for _ in range(num_batches)]
+    for path, seconds in sorted(durations.items(), key=lambda kv: kv[1], reverse=True):
+        load, i = heapq.heappop(heap)
+        batches[i].append(path)
+        heapq.heappush(heap, (load + seconds, i))
+    return [b for b in batches if b]
+
+
+def pack_capped(durations, max_seconds):
+    """First-fit decreasing into batches of at most max_seconds (longer files get their own batch)."""
+    batches, loads = [], []
+    for path, seconds in sorted(durations.items(), key=lambda kv: kv[1], reverse=True):
+        for i, load in enumerate(loads):
+            if load + seconds <= max_seconds:
+                batches[i].append(path)
+                loads[i] += seconds
+                break
+        else:
+            batches.append([path])
+            loads.append(seconds)
+    return batches
+
+
+def batch_number(name):
+    suffix = name[len(SUBFOLDER_PREFIX):]
+    return int(suffix) if name.startswith(SUBFOLDER_PREFIX) and suffix.isdigit() else None
+
+
+def load_planned(in_dir):
+    """(file names already assigned to a batch, batch numbers in use) from batches.tsv and batch_NNN links."""
+    names, used = set(), set()
+    manifest = in_dir / "batches.tsv"
+    if manifest.exists():
+        with open(manifest, "r", encoding="utf-8") as m:
+            for line in m:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 3 and batch_number(parts[0]) is not None:
+                    used.add(batch_number(parts[0]))
+                    names.add(parts[2])
+    for batch_dir in in_dir.glob(f"{SUBFOLDER_PREFIX}*"):
+        if batch_dir.is_dir() and batch_number(batch_dir.name) is not None:
+            used.add(batch_number(batch_dir.name))
+            names.update(p.name for p in batch_dir.iterdir() if p.is_symlink())
+    return names, used
+
+
+def next_batch_index(used):
+    return max(used, default=0) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack audio files into duration-balanced batch_NNN folders.")
+    parser.add_argument("--in-dir", required=True, help="Directory with the un-batched *.webm files")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--num-batches", type=int, help="Number of batches K (LPT packing)")
+    group.add_argument("--max-hours", type=float, help="Cap of audio hours per batch")
+    parser.add_argument("--mode", choices=["move", "symlink", "manifest"], default="move",
+                        help="move files (like batching.sh), symlink them, or only write batches.tsv")
+    parser.add_argument("--start-index", type=int, default=None,
+                        help="First batch number (default: next unused batch_NNN)")
+    parser.add_argument("--rtf", type=float, default=None,
+                        help="Processing seconds per audio second, to predict the walltime of the longest batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Duration probe threads")
+    args = parser.parse_args()
+    if args.num_batches is not None and args.num_batches < 1:
+        parser.error("--num-batches must be at least 1")
+    if args.max_hours is not None and args.max_hours <= 0:
+        parser.error("--max-hours must be positive")
+
+    in_dir = Path(args.in_dir).resolve()
+    if not in_dir.exists():
+        raise FileNotFoundError(f"Input directory not found: {in_dir}")
+
+    # files planned by an earlier --mode symlink / manifest run stay in IN_DIR; do not batch them twice
+    planned, used = load_planned(in_dir)
+    files = sorted(p for p in in_dir.glob("*.webm") if p.is_file() and p.name not in planned)
+    if not files:
+        print(f"No un-batched .webm files in {in_dir} ({len(planned)} already planned)")
+        return
+
+    catalogue = DurationCatalogue(in_dir / ".duration_cache.json")
+    durations = catalogue.scan(files, workers=args.workers)
+    catalogue.save()
+    for path in catalogue.failed:
+        print(f"Skipped (duration unreadable): {path.name}")
+    if not durations:
+        return
+
+    if args.num_batches:
+        batches = pack_lpt(durations, args.num_batches)
+    else:
+        batches = pack_capped(durations, args.max_hours * 3600)
+
+    start = args.start_index or next_batch_index(used)
+    manifest = in_dir / "batches.tsv"
+    loads = []
+    with open(manifest, "a", encoding="utf-8") as m:
+        for offset, batch in enumerate(batches):
+            name = f"{SUBFOLDER_PREFIX}{start + offset:03d}"
+            seconds = sum(durations[p] for p in batch)
+            loads.append(seconds)
+            batch_dir = in_dir / name
+            if args.mode != "manifest":
+                batch_dir.mkdir(exist_ok=True)
+            for path in batch:
+                if args.mode == "move":
+                    shutil.move(str(path), str(batch_dir / path.name))
+                elif args.mode == "symlink":
+                    link = batch_dir / path.name
+                    if not link.exists():
+                        link.symlink_to(path)
+                m.write(f"{name}\t{durations[path]:.3f}\t{path.name}\n")
+            print(f"{name}: {len(batch):4d} files, {seconds / 3600:6.2f} h")
+
+    end = start + len(batches) - 1
+    total = sum(loads)
+    makespan = max(loads)
+    print(f"Packed {len(durations)} files ({total / 3600:.2f} h) into {len(batches)} batches")
+    print(f"Makespan: {makespan / 3600:.2f} audio hours (mean {total / len(batches) / 3600:.2f} h)")
+    if args.rtf:
+        print(f"Predicted walltime of longest batch: {makespan * args.rtf / 3600:.2f} h")
+    print(f"Submit with: qsub -J {start}-{end} ...")
+    print(f"Manifest: {manifest}")
+
+
+if __name__ == "__main__":
+    main()
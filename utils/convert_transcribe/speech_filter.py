@@ -0,0 +1,266 @@
+"""
+CPU speech-activity prefilter, run before batching so GPU ASR time is not
+spent on videos that are mostly music, jingles or silence.
+
+Each file is decoded once to 16 kHz mono and split into 20 ms frames. A
+frame counts as speech when
+  - its energy is well above the file's noise floor (and an absolute floor),
+  - its spectrum in the speech band is not flat (rules out noise / hiss), and
+  - the surrounding second shows syllable-rate energy modulation
+    (sustained music and drones are too stationary).
+Frame decisions are smoothed into speech regions (short gaps bridged,
+short blips dropped), all vectorised with NumPy.
+
+Results go to IN_DIR/speech_activity.jsonl, one line per file:
+    {"file": "<video>.webm", "size": ..., "mtime": ..., "duration": 1804.2,
+     "speech_seconds": 1502.7, "speech_ratio": 0.833, "regions": [[3.12, 41.9], ...], "action": "keep"}
+Files already in the report (same size and mtime) are not decoded again.
+
+Files below --min-speech-ratio are handled by --mode:
+    move   move them to IN_DIR/low_speech/ (default; plan_batches.py no longer sees them)
+    list   leave them in place; only list them
+IN_DIR/low_speech.txt always lists the files excluded by the latest run.
+--trim additionally cuts long non-speech stretches (intros, music breaks,
+outros) out of the kept files: the speech spans are stream-copied to
+<video>_speechNNN.webm and recorded in chunks_manifest.jsonl, as split_audio.py
+does, and the original is moved to IN_DIR/untrimmed/. split_audio.py still
+chunks long speech spans (into <video>_speechNNN_partNNN.webm, with
+"source": "<video>_speechNNN"), so an offset is mapped back to the video by
+following "source" through chunks_manifest.jsonl.
+
+Example usage:
+python speech_filter.py --in-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono/Idntimes/audio
+python speech_filter.py --in-dir ... --min-speech-ratio 0.4 --trim --max-gap 20 --mode list
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from split_audio import PART_PATTERN, SAMPLE_RATE, decode_pcm
+
+FRAME = 320                     # 20 ms
+FRAME_SECONDS = FRAME / SAMPLE_RATE
+BAND = (300, 4000)              # Hz, where speech energy and formants live
+NOISE_PERCENTILE = 10
+REPORT_NAME = "speech_activity.jsonl"
+SPEECH_PATTERN = re.compile(r"_speech\d{3}$")
+
+
+def frame_features(samples, block_frames=65536):
+    """Per-frame log energy (dBFS) and spectral flatness in BAND, computed in blocks."""
+    n_frames = len(samples) // FRAME
+    frames = samples[:n_frames * FRAME].reshape(n_frames, FRAME)
+    freqs = np.fft.rfftfreq(FRAME, 1 / SAMPLE_RATE)
+    band = (freqs >= BAND[0]) & (freqs <= BAND[1])
+    window = np.hanning(FRAME).astype(np.float32)
+
+    energy_db = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    for i in range(0, n_frames, block_frames):
+        block = frames[i:i + block_frames].astype(np.float32) / 32768.0
+        energy_db[i:i + block_frames] = 10 * np.log10(np.mean(block * block, axis=1) + 1e-10)
+        power = np.abs(np.fft.rfft(block * window, axis=1))[:, band] ** 2 + 1e-12
+        flatness[i:i + block_frames] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy_db, flatness
+
+
+def moving_average(x, width):
+    if width <= 1:
+        return x
+    kernel = np.ones(width, dtype=np.float32) / width
+    return np.convolve(x, kernel, mode="same")
+
+
+def speech_frames(energy_db, flatness, margin_db, floor_db, max_flatness, min_modulation_db):
+    """Boolean speech mask per frame."""
+    noise_floor = np.percentile(energy_db, NOISE_PERCENTILE) if len(energy_db) else 0.0
+    loud = energy_db > max(noise_floor + margin_db, floor_db)
+    tonal = moving_average(flatness, 5) < max_flatness
+
+    # syllable-rate modulation: std of energy over ~1 s windows
+    width = int(1.0 / FRAME_SECONDS)
+    mean = moving_average(energy_db, width)
+    std = np.sqrt(np.maximum(moving_average(energy_db * energy_db, width) - mean * mean, 0.0))
+    modulated = std > min_modulation_db
+    return loud & tonal & modulated
+
+
+def mask_to_regions(mask, min_gap, min_speech):
+    """Speech regions (start, end) in seconds: bridge gaps < min_gap, drop regions < min_speech."""
+    if not mask.any():
+        return []
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    starts, ends = edges[0::2] * FRAME_SECONDS, edges[1::2] * FRAME_SECONDS
+
+    regions = [[starts[0], ends[0]]]
+    for s, e in zip(starts[1:], ends[1:]):
+        if s - regions[-1][1] < min_gap:
+            regions[-1][1] = e
+        else:
+            regions.append([s, e])
+    return [[round(s, 2), round(e, 2)] for s, e in regions if e - s >= min_speech]
+
+
+def analyse_file(in_file, params):
+    samples = decode_pcm(in_file)
+    duration = len(samples) / SAMPLE_RATE
+    if len(samples) < FRAME:  # empty or undecodable file: no speech
+        return {"duration": round(duration, 2), "speech_seconds": 0.0, "speech_ratio": 0.0, "regions": []}
+    energy_db, flatness = frame_features(samples)
+    mask = speech_frames(energy_db, flatness, params["margin_db"], params["floor_db"],
+                         params["max_flatness"], params["min_modulation_db"])
+    regions = mask_to_regions(mask, params["min_gap"], params["min_speech"])
+    speech_seconds = sum(e - s for s, e in regions)
+    return {
+        "duration": round(duration, 2),
+        "speech_seconds": round(speech_seconds, 2),
+        "speech_ratio": round(speech_seconds / duration, 3) if duration else 0.0,
+        "regions": regions,
+    }
+
+
+def trim_spans(regions, duration, max_gap, pad):
+    """Spans to keep: speech regions padded by `pad`, merged across gaps shorter than max_gap."""
+    spans = []
+    for s, e in regions:
+        s, e = max(s - pad, 0.0), min(e + pad, duration)
+        if spans and s - spans[-1][1] < max_gap:
+            spans[-1][1] = e
+        else:
+            spans.append([s, e])
+    return spans
+
+
+def cut_spans(in_file, spans):
+    rows = []
+    for i, (start, end) in enumerate(spans):
+        chunk = in_file.with_name(f"{in_file.stem}_speech{i:03d}{in_file.suffix}")
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-ss", f"{start:.3f}", "-to", f"{end:.3f}", "-i", str(in_file),
+            "-map", "0", "-c", "copy", str(chunk)
+        ], check=True)
+        rows.append({"chunk": chunk.name, "source": in_file.stem,
+                     "offset": round(start, 3), "duration": round(end - start, 3)})
+    return rows
+
+
+def load_report(report):
+    entries = {}
+    if report.exists():
+        with open(report, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                entries[entry["file"]] = entry
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop or trim music/silence-heavy audio before ASR (CPU only).")
+    parser.add_argument("--in-dir", required=True, help="Directory containing the un-batched *.webm files")
+    parser.add_argument("--min-speech-ratio", type=float, default=0.3, help="Files below this speech ratio are excluded")
+    parser.add_argument("--mode", choices=["move", "list"], default="move",
+                        help="move = move excluded files to low_speech/; list = only write low_speech.txt")
+    parser.add_argument("--trim", action="store_true", help="Cut long non-speech stretches out of the kept files")
+    parser.add_argument("--max-gap", type=float, default=30, help="With --trim, non-speech longer than this is cut (s)")
+    parser.add_argument("--pad", type=float, default=1.0, help="With --trim, seconds kept around each speech region")
+    parser.add_argument("--margin-db", type=float, default=15, help="Speech must be this far above the noise floor")
+    parser.add_argument("--floor-db", type=float, default=-50, help="Absolute minimum speech energy (dBFS)")
+    parser.add_argument("--max-flatness", type=float, default=0.4, help="Spectral flatness above this is noise")
+    parser.add_argument("--min-modulation-db", type=float, default=3.0,
+                        help="Energy std over 1 s below this is stationary (music / drone)")
+    parser.add_argument("--min-gap", type=float, default=0.5, help="Bridge pauses shorter than this (s)")
+    parser.add_argument("--min-speech", type=float, default=0.5, help="Drop speech regions shorter than this (s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    in_dir = Path(args.in_dir).resolve()
+    if not in_dir.exists():
+        raise FileNotFoundError(f"Input directory not found: {in_dir}")
+    params = {k: getattr(args, k) for k in ("margin_db", "floor_db", "max_flatness", "min_modulation_db",
+                                            "min_gap", "min_speech")}
+
+    report = in_dir / REPORT_NAME
+    done = load_report(report)
+    files = sorted(p for p in in_dir.glob("*.webm")
+                   if not PART_PATTERN.search(p.stem) and not SPEECH_PATTERN.search(p.stem))
+    todo = []
+    for f in files:
+        st = f.stat()
+        entry = done.get(f.name)
+        if not (entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime):
+            todo.append(f)
+    print(f"Found {len(files)} files in {in_dir}, analysing {len(todo)}")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(analyse_file, f, params): f for f in todo}
+        for fut in as_completed(futures):
+            f = futures[fut]
+            try:
+                results[f] = fut.result()
+            except subprocess.CalledProcessError as e:
+                print(f"Failed: {f.name} ({e})")
+    for f in files:
+        if f not in results and f.name in done:
+            results[f] = done[f.name]
+
+    low_dir = in_dir / "low_speech"
+    untrimmed_dir = in_dir / "untrimmed"
+    excluded, trimmed = [], []
+    removed_seconds = 0.0
+    chunk_rows = []
+    with open(report, "a", encoding="utf-8") as rep:
+        for f in files:
+            res = results.get(f)
+            if res is None:
+                continue
+            action = "keep"
+            if res["speech_ratio"] < args.min_speech_ratio:
+                action = "exclude"
+                excluded.append(f)
+                removed_seconds += res["duration"]
+            elif args.trim:
+                spans = trim_spans(res["regions"], res["duration"], args.max_gap, args.pad)
+                kept = sum(e - s for s, e in spans)
+                if spans and res["duration"] - kept >= args.max_gap:
+                    action = "trim"
+                    chunk_rows += cut_spans(f, spans)
+                    untrimmed_dir.mkdir(exist_ok=True)
+                    shutil.move(str(f), untrimmed_dir / f.name)
+                    trimmed.append(f)
+                    removed_seconds += res["duration"] - kept
+
+            if f in todo or action == "trim":
+                st = (untrimmed_dir / f.name).stat() if action == "trim" else f.stat()
+                rep.write(json.dumps(dict(res, file=f.name, size=st.st_size, mtime=st.st_mtime, action=action),
+                                     ensure_ascii=False) + "\n")
+
+    if chunk_rows:
+        with open(in_dir / "chunks_manifest.jsonl", "a", encoding="utf-8") as m:
+            for row in chunk_rows:
+                m.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    with open(in_dir / "low_speech.txt", "w", encoding="utf-8") as lst:
+        for f in excluded:
+            lst.write(str(f) + "\n")
+    if excluded and args.mode == "move":
+        low_dir.mkdir(exist_ok=True)
+        for f in excluded:
+            shutil.move(str(f), low_dir / f.name)
+
+    print(f"Excluded {len(excluded)} files, trimmed {len(trimmed)}; "
+          f"{removed_seconds / 3600:.2f} h of non-speech audio removed before ASR")
+    print(f"Speech report: {report}")
+
+
+if __name__ == "__main__":
+    main()
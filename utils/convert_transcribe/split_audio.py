@@ -0,0 +1,168 @@
+"""
+Silence-aware long-audio chunker (replaces split_webm.sh).
+
+Instead of cutting every SEGMENT_SECONDS blindly, each file is decoded once
+to 16 kHz mono, a frame-level RMS energy curve is computed with NumPy, and
+every cut is moved to the quietest point within +/- WINDOW seconds of the
+target. Files are processed in parallel.
+
+Chunks keep the split_webm.sh naming:
+    <video>_part000.webm, <video>_part001.webm, ...
+and every chunk is recorded in IN_DIR/chunks_manifest.jsonl:
+    {"chunk": "<video>_part001.webm", "source": "<video>", "offset": 598.42, "duration": 604.1}
+so timestamps of aligned segments can be remapped to the source video.
+With the default --format webm the chunks are stream-copied, so ffmpeg
+starts each one at the audio packet containing the cut: a chunk can begin
+up to one packet (20 ms for Opus) before its recorded offset. Use
+--format wav where sample-exact offsets matter. Files that
+decode to no audio are reported and left in place.
+
+Example usage:
+python split_audio.py --in-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono/Idntimes/audio
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.02
+PART_PATTERN = re.compile(r"_part\d{3}$")
+
+
+def decode_pcm(path, sample_rate=SAMPLE_RATE):
+    proc = subprocess.run([
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", str(path), "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"
+    ], stdout=subprocess.PIPE, check=True)
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+def frame_rms(samples, frame_len, block_frames=65536):
+    """RMS per non-overlapping frame (vectorised, in blocks to bound the float32 copy)."""
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.empty(n_frames, dtype=np.float32)
+    for i in range(0, n_frames, block_frames):
+        block = frames[i:i + block_frames].astype(np.float32)
+        rms[i:i + block_frames] = np.sqrt(np.mean(block * block, axis=1))
+    return rms
+
+
+def find_cut_points(rms, frame_seconds, segment_seconds, window_seconds, smooth_frames=10):
+    """
+    Return cut times (seconds) near every multiple of segment_seconds,
+    each at the lowest-energy frame inside the search window.
+    """
+    if len(rms) == 0:
+        return []
+    if smooth_frames > 1:
+        kernel = np.ones(smooth_frames, dtype=np.float32) / smooth_frames
+        rms = np.convolve(rms, kernel, mode="same")
+
+    total = len(rms) * frame_seconds
+    cuts = []
+    last = 0.0
+    target = segment_seconds
+    while target < total - window_seconds:
+        lo = int(max(target - window_seconds, last + window_seconds) / frame_seconds)
+        hi = int(min(target + window_seconds, total) / frame_seconds)
+        if hi <= lo:
+            break
+        cut = (lo + int(np.argmin(rms[lo:hi]))) * frame_seconds
+        cuts.append(cut)
+        last = cut
+        target = cut + segment_seconds
+    return cuts
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(memoryview(samples))
+
+
+def split_file(in_file, segment_seconds, window_seconds, out_format, keep_source):
+    """Split one file at low-energy points; returns the manifest rows."""
+    in_file = Path(in_file)
+    samples = decode_pcm(in_file)
+    if len(samples) == 0:
+        raise ValueError("no audio decoded")
+    total = len(samples) / SAMPLE_RATE
+    rms = frame_rms(samples, int(SAMPLE_RATE * FRAME_SECONDS))
+    bounds = [0.0] + find_cut_points(rms, FRAME_SECONDS, segment_seconds, window_seconds) + [total]
+
+    rows = []
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        chunk = in_file.with_name(f"{in_file.stem}_part{i:03d}.{out_format}")
+        if out_format == "wav":
+            write_wav(chunk, samples[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)])
+        else:
+            subprocess.run([
+                "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                "-ss", f"{start:.3f}", "-to", f"{end:.3f}", "-i", str(in_file),
+                "-map", "0", "-c", "copy", str(chunk)
+            ], check=True)
+        rows.append({
+            "chunk": chunk.name,
+            "source": in_file.stem,
+            "offset": round(start, 3),
+            "duration": round(end - start, 3),
+        })
+
+    if not keep_source:
+        in_file.unlink()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split long audio at low-energy points near a target chunk length.")
+    parser.add_argument("--in-dir", required=True, help="Directory containing *.webm files")
+    parser.add_argument("--segment-seconds", type=float, default=600, help="Target chunk length (default 10 min)")
+    parser.add_argument("--window-seconds", type=float, default=30, help="Search +/- this many seconds around each target")
+    parser.add_argument("--format", choices=["webm", "wav"], default="webm",
+                        help="webm = stream copy like split_webm.sh (offsets packet-aligned); "
+                             "wav = 16 kHz mono from the decoded buffer (sample-exact offsets)")
+    parser.add_argument("--keep-source", action="store_true", help="Do not delete the original file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    in_dir = Path(args.in_dir).resolve()
+    if not in_dir.exists():
+        raise FileNotFoundError(f"Input directory not found: {in_dir}")
+
+    files = sorted(p for p in in_dir.glob("*.webm") if not PART_PATTERN.search(p.stem))
+    print(f"Found {len(files)} files in {in_dir}")
+
+    manifest = in_dir / "chunks_manifest.jsonl"
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, \
+            open(manifest, "a", encoding="utf-8") as m:
+        futures = {
+            pool.submit(split_file, f, args.segment_seconds, args.window_seconds, args.format, args.keep_source): f
+            for f in files
+        }
+        for fut in as_completed(futures):
+            try:
+                rows = fut.result()
+            except (subprocess.CalledProcessError, ValueError) as e:
+                print(f"Failed: {futures[fut].name} ({e})")
+                continue
+            for row in rows:
+                m.write(json.dumps(row, ensure_ascii=False) + "\n")
+            m.flush()
+            print(f"{futures[fut].name}: {len(rows)} chunks")
+
+    print(f"Chunk manifest: {manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Cross-channel duplicate audio detection (run before batching).
+
+Every file is decoded once to 16 kHz mono and reduced to a compact
+spectral fingerprint: one 32-bit sub-fingerprint per 16 ms hop, whose
+bits are the signs of the time/frequency differences of energies in 33
+log-spaced bands (Haitsma & Kalker style). Sub-fingerprints survive
+re-encoding, so exact lookups find candidate matches and the bit error
+rate over aligned windows confirms them, including partial overlaps
+(a clip re-uploaded inside a compilation, syndicated news segments).
+
+Fingerprints are cached per file, keyed by (path, size, mtime), so later
+runs only fingerprint new files and only query new files against the index.
+
+Output in --index-dir:
+    fingerprints/<hash>.npy     cached fingerprints
+    index.json                  path -> {size, mtime, channel, duration, fingerprint}
+    duplicates.jsonl            one line per matched pair
+    duplicates_to_skip.txt      files covered (>= --dup-coverage) by another file
+
+Example usage:
+python dedup_audio.py --base /scratch/users/ntu/daniel02/GigaSpeech2/id/raw_audio/mono \
+    --index-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/dedup
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_durations import channel_of, find_audio_files
+
+SR = 16000
+N_FFT = 2048
+HOP = 256                       # 16 ms per sub-fingerprint (dense overlap tolerates misaligned frames)
+FRAME_SECONDS = HOP / SR
+BAND_EDGES = np.geomspace(300, 2000, 34)
+WINDOW = 128                    # frames per verification window (~2 s)
+MAX_BUCKET = 64                 # ignore sub-fingerprints shared by too many frames (silence, jingles)
+
+
+def decode_pcm(path):
+    pcm = subprocess.run([
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", str(path), "-f", "s16le", "-ac", "1", "-ar", str(SR), "-"
+    ], stdout=subprocess.PIPE, check=True).stdout
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def fingerprint(samples, block_frames=4096):
+    """Return one uint32 sub-fingerprint per frame."""
+    n_frames = max((len(samples) - N_FFT) // HOP + 1, 0)
+    if n_frames < 2:
+        return np.zeros(0, dtype=np.uint32)
+
+    freqs = np.fft.rfftfreq(N_FFT, 1 / SR)
+    band_of_bin = np.digitize(freqs, BAND_EDGES) - 1
+    in_band = (band_of_bin >= 0) & (band_of_bin < 33)
+    window = np.hanning(N_FFT).astype(np.float32)
+
+    energies = np.empty((n_frames, 33), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP]
+    for i in range(0, n_frames, block_frames):
+        block = frames[i:i + block_frames].astype(np.float32) * window
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        band_energy = np.zeros((len(block), 33), dtype=np.float32)
+        np.add.at(band_energy.T, band_of_bin[in_band], power[:, in_band].T)
+        energies[i:i + len(block)] = band_energy
+
+    diff = energies[:, :-1] - energies[:, 1:]               # across bands
+    bits = (diff[1:] - diff[:-1]) > 0                        # across time
+    return np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel()
+
+
+def fingerprint_file(path, out_file):
+    samples = decode_pcm(path)
+    fp = fingerprint(samples)
+    np.save(out_file, fp)
+    return len(samples) / SR
+
+
+def bit_errors(a, b):
+    return np.unpackbits(np.bitwise_xor(a, b).view(np.uint8).reshape(-1, 4), axis=1).sum(axis=1)
+
+
+class FingerprintIndex:
+    """All cached fingerprints concatenated and sorted by sub-fingerprint value."""
+
+    def __init__(self, fps):
+        self.fps = fps
+        values, owners, frames = [], [], []
+        for i, fp in enumerate(fps):
+            values.append(fp)
+            owners.append(np.full(len(fp), i, dtype=np.int32))
+            frames.append(np.arange(len(fp), dtype=np.int32))
+        values = np.concatenate(values) if values else np.zeros(0, dtype=np.uint32)
+        order = np.argsort(values, kind="stable")
+        self.values = values[order]
+        self.owners = np.concatenate(owners)[order] if owners else np.zeros(0, dtype=np.int32)
+        self.frames = np.concatenate(frames)[order] if frames else np.zeros(0, dtype=np.int32)
+
+    def candidates(self, qi, min_hits):
+        """Return [(other, offset_frames)] whose aligned exact hits with query qi reach min_hits."""
+        q = self.fps[qi]
+        left = np.searchsorted(self.values, q, side="left")
+        right = np.searchsorted(self.values, q, side="right")
+        counts = right - left
+        keep = (counts > 0) & (counts <= MAX_BUCKET)
+        left, counts, q_frames = left[keep], counts[keep], np.flatnonzero(keep)
+        if counts.sum() == 0:
+            return []
+
+        starts = np.repeat(left, counts)
+        idx = starts + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        owners = self.owners[idx]
+        offsets = self.frames[idx] - np.repeat(q_frames, counts)
+        other = owners != qi
+        key = owners[other].astype(np.int64) * (1 << 32) + (offsets[other].astype(np.int64) + (1 << 31))
+        keys, hits = np.unique(key, return_counts=True)
+
+        best = {}
+        for k, h in zip(keys[hits >= min_hits], hits[hits >= min_hits]):
+            owner, offset = int(k >> 32), int((k & 0xFFFFFFFF) - (1 << 31))
+            if h > best.get(owner, (0, 0))[0]:
+                best[owner] = (h, offset)
+        return [(owner, offset) for owner, (_, offset) in best.items()]
+
+    def verify(self, qi, other, offset, max_ber):
+        """Matched windows of query qi against other shifted by offset: (matched frames, mean BER)."""
+        a, b = self.fps[qi], self.fps[other]
+        start = max(0, -offset)
+        end = min(len(a), len(b) - offset)
+        n = (end - start) // WINDOW * WINDOW
+        if n <= 0:
+            return 0, 1.0
+        errors = bit_errors(a[start:start + n], b[start + offset:start + offset + n])
+        ber = errors.reshape(-1, WINDOW).mean(axis=1) / 32
+        matched = ber < max_ber
+        return int(matched.sum()) * WINDOW, float(ber[matched].mean()) if matched.any() else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag exact, near and partial duplicate audio across channels.")
+    parser.add_argument("--base", required=True, help="Root directory with one sub-directory per channel")
+    parser.add_argument("--index-dir", required=True, help="Where fingerprints and reports are kept")
+    parser.add_argument("--ext", default="webm", help="Audio file extension to scan")
+    parser.add_argument("--min-overlap", type=float, default=30, help="Minimum matched seconds to report a pair")
+    parser.add_argument("--dup-coverage", type=float, default=0.9,
+                        help="Fraction of a file covered by another file to mark it as a duplicate to skip")
+    parser.add_argument("--max-ber", type=float, default=0.35, help="Max bit error rate of a matched window")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    base = Path(args.base).resolve()
+    index_dir = Path(args.index_dir).resolve()
+    fp_dir = index_dir / "fingerprints"
+    fp_dir.mkdir(parents=True, exist_ok=True)
+    index_file = index_dir / "index.json"
+    index = json.loads(index_file.read_text(encoding="utf-8")) if index_file.exists() else {}
+
+    # === Fingerprint new / changed files ===
+    todo = []
+    for path in find_audio_files(base, args.ext):
+        st = path.stat()
+        key = str(path)
+        entry = index.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            continue
+        fp_file = fp_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+        index[key] = {"size": st.st_size, "mtime": st.st_mtime, "channel": channel_of(path, base),
+                      "fingerprint": fp_file.name, "duration": None}
+        todo.append(key)
+    print(f"Fingerprinting {len(todo)} new/changed files ({len(index)} indexed)")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {key: pool.submit(fingerprint_file, key, fp_dir / index[key]["fingerprint"]) for key in todo}
+        for key, fut in futures.items():
+            try:
+                index[key]["duration"] = fut.result()
+            except Exception as e:  # one bad file must not lose the fingerprints of the rest
+                print(f"Failed: {key} ({e})")
+                index.pop(key)
+
+    index = {k: v for k, v in index.items() if Path(k).exists()}
+    tmp = index_file.with_name("index.json.tmp")
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    os.replace(tmp, index_file)
+
+    # === Query new files against everything ===
+    paths = sorted(index)
+    position = {p: i for i, p in enumerate(paths)}
+    fps = [np.load(fp_dir / index[p]["fingerprint"]) for p in paths]
+    fp_index = FingerprintIndex(fps)
+    min_frames = int(args.min_overlap / FRAME_SECONDS)
+
+    new = set(todo)
+    reported = set()
+    num_pairs = 0
+    skip_file = index_dir / "duplicates_to_skip.txt"
+    skipped = set(skip_file.read_text(encoding="utf-8").split("\n")) if skip_file.exists() else set()
+
+    with open(index_dir / "duplicates.jsonl", "a", encoding="utf-8") as dup, \
+            open(skip_file, "a", encoding="utf-8") as skip:
+
+        def mark_skip(path):
+            if path not in skipped:
+                skipped.add(path)
+                skip.write(path + "\n")
+
+        for key in todo:
+            if key not in position:
+                continue
+            qi = position[key]
+            for other, offset in fp_index.candidates(qi, min_hits=max(min_frames // 50, 5)):
+                pair = tuple(sorted((qi, other)))
+                if pair in reported:
+                    continue
+                matched, ber = fp_index.verify(qi, other, offset, args.max_ber)
+                if matched < min_frames:
+                    continue
+                reported.add(pair)
+                num_pairs += 1
+
+                overlap = matched * FRAME_SECONDS
+                coverage_q = matched / max(len(fps[qi]), 1)
+                coverage_o = matched / max(len(fps[other]), 1)
+                kind = "partial"
+                if min(coverage_q, coverage_o) >= args.dup_coverage:
+                    kind = "exact" if ber < 0.05 else "near"
+                dup.write(json.dumps({
+                    "file": key, "channel": index[key]["channel"],
+                    "match": paths[other], "match_channel": index[paths[other]]["channel"],
+                    "offset": round(offset * FRAME_SECONDS, 2), "overlap": round(overlap, 1),
+                    "coverage": round(coverage_q, 3), "match_coverage": round(coverage_o, 3),
+                    "ber": round(ber, 3), "kind": kind,
+                }, ensure_ascii=False) + "\n")
+
+                # skip the file that is (almost) entirely contained in the other one; for mutual
+                # duplicates keep the file indexed in an earlier run, else the first path
+                if min(coverage_q, coverage_o) >= args.dup_coverage:
+                    mark_skip(key if paths[other] not in new else max(key, paths[other]))
+                elif coverage_q >= args.dup_coverage:
+                    mark_skip(key)
+                elif coverage_o >= args.dup_coverage:
+                    mark_skip(paths[other])
+
+    print(f"Found {num_pairs} duplicate pairs; reports in {index_dir}")
+
+
+if __name__ == "__main__":
+    main()
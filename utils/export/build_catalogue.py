@@ -0,0 +1,204 @@
+"""
+Build a compact columnar catalogue of every filtered GigaSpeech2 segment.
+
+Scans
+    <country>/work/<mode>/<channel>/batch_*/output_filter/filtered_*_manifest.jsonl
+under one or more work roots and stores one row per segment in
+OUT_DIR/catalogue.npz (plain NumPy arrays, loaded in well under a second):
+
+    manifest    int32    index into the `manifests` table
+    line_pos    int64    byte offset of the segment's line in its manifest
+    video       int32    index into the `videos` table (source audio_filepath)
+    channel     int32    index into the `channels` table
+    mode        int8     index into the `modes` table (mono / cs)
+    country     int8     index into the `countries` table (id / ph / ...; the accent for English data)
+    offset      float64  audio_start_sec
+    duration    float32  seconds
+    text_len    int32    characters in the transcript
+    has_digit   bool     transcript contains a digit (not yet normalised)
+
+The country is the name of the directory above each work root
+(/scratch/.../GigaSpeech2/<country>/work). OUT_DIR/catalogue_index.json
+records the size and mtime of every ingested manifest, so later runs only
+re-parse new or changed manifests and drop the rows of removed ones. Use
+--full to rebuild. sample_catalogue.py draws hour budgets from the catalogue
+without reading the manifests again.
+
+Usage:
+    python build_catalogue.py --work-root /scratch/users/ntu/daniel02/GigaSpeech2/id/work \
+                                          /scratch/users/ntu/daniel02/GigaSpeech2/ph/work \
+                              --out-dir /scratch/users/ntu/daniel02/GigaSpeech2/catalogue
+"""
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+CATALOGUE_NAME = "catalogue.npz"
+INDEX_NAME = "catalogue_index.json"
+TABLES = ("manifests", "videos", "channels", "modes", "countries")
+CODED = {"manifest": "manifests", "video": "videos", "channel": "channels", "mode": "modes", "country": "countries"}
+DTYPES = {
+    "manifest": np.int32, "line_pos": np.int64, "video": np.int32, "channel": np.int32, "mode": np.int8,
+    "country": np.int8, "offset": np.float64, "duration": np.float32, "text_len": np.int32, "has_digit": bool,
+}
+DIGIT = re.compile(r"\d")
+
+
+def parse_manifest(manifest, work_root):
+    """Column lists for one manifest; string columns hold plain values, coded later."""
+    # e.g. <work_root>/mono/Idntimes/batch_022/output_filter/filtered_...jsonl
+    parts = Path(manifest).relative_to(work_root).parts
+    if len(parts) < 3:
+        raise RuntimeError(f"Cannot resolve <mode>/<channel> from manifest path: {manifest}")
+    cols = {"line_pos": [], "video": [], "offset": [], "duration": [], "text_len": [], "has_digit": []}
+    pos = 0
+    with open(manifest, "rb") as f:
+        for line in f:
+            if line.strip():
+                ex = json.loads(line)
+                text = ex["text"].strip()
+                cols["line_pos"].append(pos)
+                cols["video"].append(ex["audio_filepath"])
+                cols["offset"].append(float(ex["audio_start_sec"]))
+                cols["duration"].append(float(ex["duration"]))
+                cols["text_len"].append(len(text))
+                cols["has_digit"].append(bool(DIGIT.search(text)))
+            pos += len(line)
+    return {"manifest": manifest, "mode": parts[0], "channel": parts[1], "country": Path(work_root).parent.name,
+            "cols": cols}
+
+
+def empty_catalogue():
+    cat = {name: np.empty(0, dtype=dtype) for name, dtype in DTYPES.items()}
+    cat.update({table: np.empty(0, dtype=str) for table in TABLES})
+    return cat
+
+
+def load_catalogue(out_dir):
+    """All columns and string tables of OUT_DIR/catalogue.npz as a dict of arrays."""
+    path = Path(out_dir) / CATALOGUE_NAME
+    if not path.exists():
+        return empty_catalogue()
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def save_catalogue(out_dir, cat):
+    path = Path(out_dir) / CATALOGUE_NAME
+    tmp = path.with_name(CATALOGUE_NAME + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **cat)
+    os.replace(tmp, path)
+
+
+def load_index(out_dir):
+    index_file = Path(out_dir) / INDEX_NAME
+    if index_file.exists():
+        with open(index_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_index(out_dir, index):
+    index_file = Path(out_dir) / INDEX_NAME
+    tmp = index_file.with_name(INDEX_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_file)
+
+
+def append_parsed(cat, parsed):
+    """Append parsed manifests to the catalogue, extending the string tables as needed."""
+    codes = {table: {v: i for i, v in enumerate(cat[table].tolist())} for table in TABLES}
+    tables = {table: cat[table].tolist() for table in TABLES}
+
+    def code(table, value):
+        if value not in codes[table]:
+            codes[table][value] = len(tables[table])
+            tables[table].append(value)
+        return codes[table][value]
+
+    new = {name: [cat[name]] for name in DTYPES}
+    for p in parsed:
+        cols = p["cols"]
+        n = len(cols["offset"])
+        for name in ("manifest", "channel", "mode", "country"):
+            new[name].append(np.full(n, code(CODED[name], p[name]), dtype=DTYPES[name]))
+        new["video"].append(np.array([code("videos", v) for v in cols["video"]], dtype=np.int32))
+        for name in ("line_pos", "offset", "duration", "text_len", "has_digit"):
+            new[name].append(np.asarray(cols[name], dtype=DTYPES[name]))
+
+    out = {name: np.concatenate(arrays).astype(DTYPES[name], copy=False) for name, arrays in new.items()}
+    out.update({table: np.array(values, dtype=str) for table, values in tables.items()})
+    return out
+
+
+def drop_manifests(cat, manifests):
+    """Remove the rows of the given manifests and compact every string table."""
+    if manifests and len(cat["manifests"]):
+        gone = np.isin(cat["manifests"], list(manifests))
+        keep = ~gone[cat["manifest"]]
+        cat = {name: (arr[keep] if name in DTYPES else arr) for name, arr in cat.items()}
+    for name, table in CODED.items():
+        used, inverse = np.unique(cat[name], return_inverse=True)
+        cat[table] = cat[table][used]
+        cat[name] = inverse.astype(DTYPES[name])
+    return cat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index all filtered manifests into a columnar segment catalogue.")
+    parser.add_argument("--work-root", required=True, nargs="+",
+                        help="<country>/work dirs containing <mode>/<channel>/batch_*/output_filter")
+    parser.add_argument("--out-dir", required=True, help="Where catalogue.npz and catalogue_index.json are kept")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    parser.add_argument("--full", action="store_true", help="Ignore the existing catalogue and re-index everything")
+    args = parser.parse_args()
+
+    out_dir = Path(args.out_dir).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = {} if args.full else load_index(out_dir)
+    cat = empty_catalogue() if args.full else load_catalogue(out_dir)
+
+    manifests = {}
+    for root in args.work_root:
+        work_root = Path(root).resolve()
+        for manifest in work_root.glob("**/output_filter/filtered_*_manifest.jsonl"):
+            st = manifest.stat()
+            manifests[str(manifest)] = {"size": st.st_size, "mtime": st.st_mtime, "work_root": str(work_root)}
+
+    changed = [
+        m for m, stat in manifests.items()
+        if m not in index or index[m]["size"] != stat["size"] or index[m]["mtime"] != stat["mtime"]
+    ]
+    removed = [m for m in index if m not in manifests]
+    print(f"Found {len(manifests)} manifests: {len(changed)} new/changed, {len(removed)} removed")
+    if not changed and not removed and (out_dir / CATALOGUE_NAME).exists():
+        return
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        parsed = list(pool.map(parse_manifest, changed, [manifests[m]["work_root"] for m in changed],
+                               chunksize=max(1, len(changed) // (args.workers * 4))))
+
+    cat = append_parsed(drop_manifests(cat, set(changed + removed)), parsed)
+    save_catalogue(out_dir, cat)
+
+    for m in removed:
+        index.pop(m, None)
+    for m in changed:
+        index[m] = {"size": manifests[m]["size"], "mtime": manifests[m]["mtime"]}
+    save_index(out_dir, index)
+
+    hours = float(cat["duration"].sum(dtype=np.float64)) / 3600
+    print(f"Catalogue: {len(cat['offset'])} segments, {len(cat['videos'])} videos, "
+          f"{len(cat['channels'])} channels, {hours:.2f} h in {out_dir / CATALOGUE_NAME}")
+
+
+if __name__ == "__main__":
+    main()
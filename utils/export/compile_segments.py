@@ -11,38 +11,48 @@ Each line is formatted as:
     <basename>-<start>-<end>    <text>
 
 Batches are handled automatically; segments from the same video
-are merged into one TXT file.
+are merged into one TXT file and sorted by start time. Manifests are
+parsed across a process pool, and every output file is written once
+(buffered, via temp file + rename), so re-running never duplicates lines.
+
+A completion index (OUT_ROOT/.export_index.json) records the size and
+mtime of every exported manifest; later runs only re-export the videos
+touched by new or changed manifests. Use --full to rebuild everything.
 
 Usage:
-    Set WORK_ROOT and OUT_ROOT, then run:
-        python extract_txt_segments.py
+    python compile_segments.py --work-root /scratch/users/ntu/daniel02/GigaSpeech2/id/work \
+                               --out-root /scratch/users/ntu/daniel02/GigaSpeech2/id/txt_segments
 """
 
-import os, json, glob
+import argparse
+import json
+import os
+import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-# Root of your work dir
-WORK_ROOT = "/scratch/users/ntu/daniel02/GigaSpeech2/id/work"
-OUT_ROOT = "/scratch/users/ntu/daniel02/GigaSpeech2/id/txt_segments"
-
-for manifest in glob.glob(f"{WORK_ROOT}/**/output_filter/filtered_*_manifest.jsonl", recursive=True):
-    # Extract channel name (e.g. mono/Idntimes)
-    parts = Path(manifest).parts
-    # parts looks like [..., "work", "mono", "Idntimes", "batch_022", "output_filter", "filtered_...jsonl"]
-    try:
-        idx = parts.index("work")
-        mode, channel = parts[idx+1], parts[idx+2]
-    except ValueError:
-        raise RuntimeError(f"'work' not found in manifest path: {manifest}")
-    
-    out_dir = Path(OUT_ROOT) / mode / channel
-    out_dir.mkdir(parents=True, exist_ok=True)
-    
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from metrics import setup as setup_metrics  # noqa: E402
+
+INDEX_NAME = ".export_index.json"
+
+
+def parse_manifest(manifest, work_root):
+    """Return {relative output path: [(start, line), ...]} for one manifest."""
+    # Channel from the path, e.g. <work_root>/mono/Idntimes/batch_022/output_filter/filtered_...jsonl
+    parts = Path(manifest).relative_to(work_root).parts
+    if len(parts) < 3:
+        raise RuntimeError(f"Cannot resolve <mode>/<channel> from manifest path: {manifest}")
+    mode, channel = parts[0], parts[1]
+
+    lines = defaultdict(list)
     with open(manifest, "r", encoding="utf-8") as f:
         for line in f:
+            if not line.strip():
+                continue
             ex = json.loads(line)
-            
+
             basename = Path(ex["audio_filepath"]).stem
             start = float(ex["audio_start_sec"])
             end = start + float(ex["duration"])
@@ -50,9 +60,111 @@ for manifest in glob.glob(f"{WORK_ROOT}/**/output_filter/filtered_*_manifest.jso
 
             # build utterance ID
             uttid = f"{basename}-{start:.3f}-{end:.3f}"
-            out_line = "{}\t{}\n".format(uttid, text.strip())
+            lines[f"{mode}/{channel}/{basename}.txt"].append((start, "{}\t{}\n".format(uttid, text)))
+    return dict(lines)
+
+
+def write_sorted(out_file, entries):
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    entries.sort(key=lambda e: e[0])
+    with open(tmp, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.writelines(line for _, line in entries)
+    os.replace(tmp, out_file)
+
+
+def load_index(out_root):
+    index_file = out_root / INDEX_NAME
+    if index_file.exists():
+        with open(index_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_index(out_root, index):
+    index_file = out_root / INDEX_NAME
+    tmp = index_file.with_name(INDEX_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export per-video TXT transcripts from filtered manifests.")
+    parser.add_argument("--work-root", required=True, help="Root of the work dir (<mode>/<channel>/batch_*/output_filter)")
+    parser.add_argument("--out-root", required=True, help="Output root for <mode>/<channel>/<video>.txt")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    parser.add_argument("--full", action="store_true", help="Ignore the completion index and re-export everything")
+    parser.add_argument("--metrics", default=None, help="Append timing/throughput records to this JSONL file")
+    parser.add_argument("--prometheus", default=None, help="Also write run totals to this Prometheus textfile")
+    parser.add_argument("--profile", default=None, help="Comma-separated stages to run under cProfile (or 'all')")
+    args = parser.parse_args()
+    metrics = setup_metrics("compile_segments", path=args.metrics, profile=args.profile)
+
+    work_root = Path(args.work_root).resolve()
+    out_root = Path(args.out_root).resolve()
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    index = {} if args.full else load_index(out_root)
+
+    manifests = {}
+    for manifest in work_root.glob("**/output_filter/filtered_*_manifest.jsonl"):
+        st = manifest.stat()
+        manifests[str(manifest)] = {"size": st.st_size, "mtime": st.st_mtime}
+
+    changed = [
+        m for m, stat in manifests.items()
+        if m not in index or index[m]["size"] != stat["size"] or index[m]["mtime"] != stat["mtime"]
+    ]
+    removed = [m for m in index if m not in manifests]
+    print(f"Found {len(manifests)} manifests: {len(changed)} new/changed, {len(removed)} removed")
+    if not changed and not removed:
+        metrics.close(prometheus=args.prometheus)
+        return
+
+    with metrics.stage("parse") as record, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        parsed = dict(zip(changed, pool.map(parse_manifest, changed, [work_root] * len(changed))))
+
+        # Output files to rebuild: previously and newly produced by changed/removed manifests
+        affected = set()
+        for m in changed + removed:
+            affected.update(index.get(m, {}).get("outputs", []))
+        for m in changed:
+            affected.update(parsed[m])
+
+        # Unchanged manifests that also feed those files must be re-read
+        extra = [
+            m for m, entry in index.items()
+            if m in manifests and m not in parsed and affected.intersection(entry.get("outputs", []))
+        ]
+        parsed.update(zip(extra, pool.map(parse_manifest, extra, [work_root] * len(extra))))
+        record["manifests"] = len(parsed)
+
+    grouped = defaultdict(list)
+    for lines in parsed.values():
+        for out_rel, entries in lines.items():
+            if out_rel in affected:
+                grouped[out_rel].extend(entries)
+
+    with metrics.stage("write"):
+        for out_rel in affected:
+            out_file = out_root / out_rel
+            if grouped.get(out_rel):
+                write_sorted(out_file, grouped[out_rel])
+                metrics.count("files")
+                metrics.count("segments", len(grouped[out_rel]))
+            elif out_file.exists():
+                out_file.unlink()
+
+    for m in removed:
+        index.pop(m, None)
+    for m, lines in parsed.items():
+        index[m] = dict(manifests[m], outputs=sorted(lines))
+    save_index(out_root, index)
+
+    print(f"Wrote {len(grouped)} transcript files to {out_root}")
+    metrics.close(prometheus=args.prometheus)
+
 
-            # append to the per-video file
-            out_file = out_dir / f"{basename}.txt"
-            with open(out_file, "a", encoding="utf-8") as outf:
-                outf.write(out_line)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Pack segment audio + transcripts into fixed-size tar shards.
+
+Reads filtered manifests (GigaSpeech2 `audio_start_sec` or Granary `offset`),
+decodes every source recording once to 16 kHz mono, and streams each
+segment straight into a tar shard as <key>.wav + <key>.txt, without writing
+intermediate WAV files to scratch. A new shard is started once the current
+one reaches --shard-size-mb.
+
+Output in OUT_DIR:
+    audio_<n>.tar                 shards (WebDataset-style: members grouped by key)
+    audio_<n>.index.jsonl         {"name", "offset", "size", "duration"} per member,
+                                  offset = byte offset of the member data in the tar
+    tarred_audio_manifest.json    NeMo tarred-dataset manifest
+                                  {"audio_filepath", "duration", "text", "shard_id", ...}
+
+Usage:
+    python export_shards.py --work-root /scratch/users/ntu/daniel02/GigaSpeech2/id/work \
+                            --out-dir /scratch/users/ntu/daniel02/GigaSpeech2/id/shards --shard-size-mb 1024
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import tarfile
+import wave
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+SR = 16000
+
+
+def segment_start(ex):
+    return float(ex["audio_start_sec"] if "audio_start_sec" in ex else ex.get("offset", 0.0))
+
+
+def load_segments(manifests):
+    """Group manifest lines by source audio file."""
+    by_src = defaultdict(list)
+    for manifest in manifests:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    ex = json.loads(line)
+                    by_src[ex["audio_filepath"]].append(ex)
+    return by_src
+
+
+def wav_bytes(samples):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes(memoryview(samples))
+    return buf.getvalue()
+
+
+def encode_source(src, entries):
+    """Decode one source once and return [(key, wav bytes, text, duration, example)] in time order."""
+    pcm = subprocess.run([
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", src, "-f", "s16le", "-ar", str(SR), "-ac", "1", "-"
+    ], stdout=subprocess.PIPE, check=True).stdout
+    samples = np.frombuffer(pcm, dtype=np.int16)
+
+    basename = Path(src).stem
+    out = []
+    for ex in sorted(entries, key=segment_start):
+        start = segment_start(ex)
+        duration = float(ex["duration"])
+        # no dots in the key: WebDataset splits member names at the first dot
+        key = f"{basename}_{int(round(start * 1000)):09d}_{int(round((start + duration) * 1000)):09d}"
+        clip = samples[int(round(start * SR)):int(round((start + duration) * SR))]
+        out.append((key, wav_bytes(clip), ex.get("text", "").strip(), duration, ex))
+    return out
+
+
+class ShardWriter:
+    def __init__(self, out_dir, shard_size):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.shard_id = -1
+        self.tar = None
+        self.index = None
+        self.manifest = open(out_dir / "tarred_audio_manifest.json", "w", encoding="utf-8")
+        self._next_shard()
+
+    def _next_shard(self):
+        self._close_shard()
+        self.shard_id += 1
+        self.tar = tarfile.open(self.out_dir / f"audio_{self.shard_id}.tar", "w")
+        self.index = open(self.out_dir / f"audio_{self.shard_id}.index.jsonl", "w", encoding="utf-8")
+
+    def _close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.index.close()
+
+    def _add_member(self, name, data, duration):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        header = info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+        offset = self.tar.offset + len(header)
+        self.tar.addfile(info, io.BytesIO(data))
+        self.index.write(json.dumps({"name": name, "offset": offset, "size": len(data), "duration": duration}) + "\n")
+
+    def add(self, key, wav, text, duration, ex):
+        if self.tar.offset >= self.shard_size:
+            self._next_shard()
+        self._add_member(f"{key}.wav", wav, duration)
+        self._add_member(f"{key}.txt", (text + "\n").encode("utf-8"), duration)
+        entry = {k: v for k, v in ex.items() if k not in ("audio_filepath", "audio_start_sec", "offset")}
+        entry.update({"audio_filepath": f"{key}.wav", "duration": duration, "text": text, "shard_id": self.shard_id})
+        self.manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._close_shard()
+        self.manifest.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream segments from filtered manifests into tar shards.")
+    parser.add_argument("--work-root", help="Search <work-root>/**/output_filter/filtered_*_manifest.jsonl")
+    parser.add_argument("--manifest", nargs="*", default=[], help="Explicit manifest files (e.g. Granary output)")
+    parser.add_argument("--out-dir", required=True)
+    parser.add_argument("--shard-size-mb", type=float, default=1024, help="Target size of each tar shard")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Parallel decode processes")
+    args = parser.parse_args()
+
+    manifests = [Path(m) for m in args.manifest]
+    if args.work_root:
+        manifests += sorted(Path(args.work_root).glob("**/output_filter/filtered_*_manifest.jsonl"))
+    if not manifests:
+        raise ValueError("No manifests given: use --work-root and/or --manifest")
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    by_src = load_segments(manifests)
+    print(f"Found {sum(len(v) for v in by_src.values())} segments from {len(by_src)} sources in {len(manifests)} manifests")
+
+    writer = ShardWriter(out_dir, int(args.shard_size_mb * 1024 * 1024))
+    num_segments = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # keep at most 2 x workers decoded sources in flight to bound memory
+        sources = iter(by_src.items())
+        pending = deque()
+        for src, entries in sources:
+            pending.append(pool.submit(encode_source, src, entries))
+            if len(pending) >= 2 * args.workers:
+                break
+        while pending:
+            for item in pending.popleft().result():
+                writer.add(*item)
+                num_segments += 1
+            for src, entries in sources:
+                pending.append(pool.submit(encode_source, src, entries))
+                break
+    writer.close()
+
+    print(f"Wrote {num_segments} segments into {writer.shard_id + 1} shards in {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Pack adjacent segments of the same video into utterances near a target duration.
+
+Cue- and alignment-level segments are often only 1-3 s long, which wastes
+padding and per-sample overhead in training data loaders. This script merges
+consecutive segments of the same source audio while
+    - the pause between them is at most --max-gap seconds,
+    - the packed utterance stays within --max-duration, and
+    - the utterance is still shorter than --target-duration,
+concatenating their transcripts. A second pass folds utterances still
+shorter than --target-duration (typically the tail after a full one) into
+the previous utterance when the pause and --max-duration allow it. Both
+passes are linear in the number of segments; videos are packed in parallel
+across a process pool. Segments longer than --max-duration are passed
+through unchanged.
+
+Input manifests (JSONL; segments of one video may be spread over several
+batches / manifests):
+    GigaSpeech2 filtered:  {"audio_filepath", "audio_start_sec", "duration", "text"}
+    Granary / NeMo:        {"audio_filepath", "offset", "duration", "text", ...}
+
+Output:
+    --out-manifest   packed utterances with the same keys as the input (start key kept),
+                     plus "segment_id" = utterance index within its video
+    --out-mapping    {"id": "<video>-<start>-<end>", "sources": ["<video>-<start>-<end>", ...]}
+                     IDs use the compile_segments.py <basename>-<start>-<end> convention
+
+Usage:
+    python pack_segments.py \
+        --manifest "/scratch/users/ntu/daniel02/GigaSpeech2/id/work/mono/*/batch_*/output_filter/filtered_*_manifest.jsonl" \
+        --out-manifest /scratch/users/ntu/daniel02/GigaSpeech2/id/packed/manifest.jsonl \
+        --out-mapping /scratch/users/ntu/daniel02/GigaSpeech2/id/packed/mapping.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+START_KEYS = ("audio_start_sec", "offset")
+
+
+def start_key(ex):
+    for key in START_KEYS:
+        if key in ex:
+            return key
+    raise KeyError(f"Segment has none of {START_KEYS}: {ex}")
+
+
+def utt_id(audio_filepath, start, end):
+    return f"{Path(audio_filepath).stem}-{start:.3f}-{end:.3f}"
+
+
+def pack_video(segments, target, max_duration, max_gap):
+    """Greedy packing of one video's segments (sorted by start); returns lists of segments."""
+    groups = []   # [segments, start, end]
+    for seg in segments:
+        start = seg["_start"]
+        end = start + float(seg["duration"])
+        if groups:
+            group = groups[-1]
+            span = max(group[2], end) - group[1]
+            if start - group[2] <= max_gap and span <= max_duration and group[2] - group[1] < target:
+                group[0].append(seg)
+                group[2] = max(group[2], end)
+                continue
+        groups.append([[seg], start, end])
+
+    # fold short utterances (e.g. a 2 s tail after a 12 s one) into the previous one
+    packed = []
+    for group in groups:
+        if packed:
+            prev = packed[-1]
+            if (group[2] - group[1] < target and group[1] - prev[2] <= max_gap
+                    and max(prev[2], group[2]) - prev[1] <= max_duration):
+                prev[0].extend(group[0])
+                prev[2] = max(prev[2], group[2])
+                continue
+        packed.append(group)
+    return [group[0] for group in packed]
+
+
+def pack_job(job):
+    """Worker task: pack one video and build its output rows and mapping."""
+    audio_filepath, segments, target, max_duration, max_gap = job
+    segments.sort(key=lambda s: s["_start"])
+    rows, mapping = [], []
+    for i, group in enumerate(pack_video(segments, target, max_duration, max_gap)):
+        first = group[0]
+        key = start_key(first)
+        start = first["_start"]
+        end = max(s["_start"] + float(s["duration"]) for s in group)
+
+        row = {k: v for k, v in first.items() if not k.startswith("_")}
+        row[key] = round(start, 3)
+        row["duration"] = round(end - start, 3)
+        row["text"] = " ".join(s["text"].strip() for s in group if s["text"].strip())
+        row["segment_id"] = i
+        rows.append(row)
+        mapping.append({
+            "id": utt_id(audio_filepath, start, end),
+            "sources": [utt_id(audio_filepath, s["_start"], s["_start"] + float(s["duration"])) for s in group],
+        })
+    return rows, mapping
+
+
+def write_jsonl(path, rows):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge adjacent same-video segments into utterances near a target duration.")
+    parser.add_argument("--manifest", required=True, nargs="+", help="Input JSONL manifests or glob patterns")
+    parser.add_argument("--out-manifest", required=True, help="Packed manifest (JSONL)")
+    parser.add_argument("--out-mapping", required=True, help="Packed ID -> original segment IDs (JSONL)")
+    parser.add_argument("--target-duration", type=float, default=10.0, help="Stop adding segments once this is reached (s)")
+    parser.add_argument("--max-duration", type=float, default=20.0, help="Never pack beyond this (s)")
+    parser.add_argument("--max-gap", type=float, default=1.0, help="Only merge across pauses up to this (s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    manifests = sorted({p for pattern in args.manifest for p in glob.glob(pattern)})
+    if not manifests:
+        raise FileNotFoundError(f"No manifests match {args.manifest}")
+
+    by_video = defaultdict(list)
+    n_in = 0
+    seconds_in = 0.0
+    for manifest in manifests:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                ex = json.loads(line)
+                ex["_start"] = float(ex[start_key(ex)])
+                by_video[ex["audio_filepath"]].append(ex)
+                n_in += 1
+                seconds_in += float(ex["duration"])
+    print(f"Read {n_in} segments of {len(by_video)} videos from {len(manifests)} manifests")
+
+    jobs = [(audio, segs, args.target_duration, args.max_duration, args.max_gap) for audio, segs in sorted(by_video.items())]
+    rows, mapping = [], []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for video_rows, video_mapping in pool.map(pack_job, jobs, chunksize=max(1, len(jobs) // (args.workers * 4))):
+            rows += video_rows
+            mapping += video_mapping
+
+    write_jsonl(args.out_manifest, rows)
+    write_jsonl(args.out_mapping, mapping)
+
+    seconds_out = sum(r["duration"] for r in rows)
+    print(f"Packed into {len(rows)} utterances: mean {seconds_in / max(n_in, 1):.1f} s -> "
+          f"{seconds_out / max(len(rows), 1):.1f} s ({seconds_out / 3600:.2f} h incl. merged pauses)")
+    print(f"Manifest: {args.out_manifest}\nMapping:  {args.out_mapping}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Draw a stratified N-hour subset of segments from a build_catalogue.py catalogue.
+
+Only catalogue.npz is read to choose the segments; the transcripts of the
+chosen ones are then fetched by seeking straight to their lines in the
+filtered manifests, so sampling a new subset takes about a second instead
+of a full scan of scratch.
+
+Strata are any combination of
+    channel    one stratum per channel
+    mode       mono / cs
+    country    id / ph / ... (the accent for English data)
+    duration   --duration-buckets, e.g. 0-2 s, 2-5 s, 5-10 s, ...
+The budget is shared out across strata proportionally to their size
+(--allocation proportional) or equally (--allocation equal; strata that are
+too small give all they have and the rest is spread over the others).
+Within a stratum segments are drawn in random order (--seed) and the last
+gap is filled with the largest remaining segments that still fit; what a
+stratum cannot fill is carried over to the stratum with the next shorter
+segments, so the total lands within a fraction of a second of --hours.
+
+Output (JSONL, same keys as the filtered manifests plus the strata columns):
+    {"audio_filepath", "audio_start_sec", "duration", "text", "channel", "mode", "country"}
+Pass earlier outputs to --exclude to draw disjoint subsets (e.g. eval, then train).
+
+Usage:
+    python sample_catalogue.py --catalogue-dir /scratch/users/ntu/daniel02/GigaSpeech2/catalogue \
+                               --hours 10 --stratify channel,duration --out eval_10h.jsonl
+    python sample_catalogue.py --catalogue-dir ... --hours 100 --stratify country --allocation equal \
+                               --exclude eval_10h.jsonl --out train_100h.jsonl
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from build_catalogue import CODED, load_catalogue, load_index
+
+STRATA = ("channel", "mode", "country", "duration")
+
+
+def row_keys(video, offset):
+    """One int64 per segment: video code and start time in milliseconds."""
+    return (video.astype(np.int64) << 32) | np.rint(offset * 1000).astype(np.int64)
+
+
+def excluded_mask(cat, paths):
+    video_codes = {v: i for i, v in enumerate(cat["videos"].tolist())}
+    keys = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    ex = json.loads(line)
+                    code = video_codes.get(ex["audio_filepath"])
+                    if code is not None:
+                        keys.append((code << 32) | int(round(float(ex["audio_start_sec"]) * 1000)))
+    return np.isin(row_keys(cat["video"], cat["offset"]), np.array(keys, dtype=np.int64))
+
+
+def allocate(budget, sizes, allocation):
+    """Seconds to take from each stratum; never more than a stratum holds."""
+    if allocation == "proportional":
+        return np.minimum(sizes, budget * sizes / max(sizes.sum(), 1e-9))
+    quotas = np.zeros_like(sizes)
+    open_ = sizes > 0
+    remaining = budget
+    while remaining > 1e-6 and open_.any():
+        share = remaining / open_.sum()
+        take = np.where(open_, np.minimum(sizes - quotas, share), 0.0)
+        quotas += take
+        remaining -= take.sum()
+        open_ &= quotas < sizes - 1e-6
+    return quotas
+
+
+def draw(durations, quota, rng):
+    """Indices (into durations) of a random subset summing to at most quota, filled as tightly as possible."""
+    order = rng.permutation(len(durations))
+    cum = np.cumsum(durations[order], dtype=np.float64)
+    n = int(np.searchsorted(cum, quota, side="right"))
+    chosen = list(order[:n])
+    remaining = quota - (cum[n - 1] if n else 0.0)
+    rest = order[n:]
+    while len(rest):
+        fits = np.flatnonzero(durations[rest] <= remaining)
+        if not len(fits):
+            break
+        # largest segment that still fits closes the gap fastest
+        best = fits[np.argmax(durations[rest[fits]])]
+        chosen.append(rest[best])
+        remaining -= durations[rest[best]]
+        rest = np.delete(rest, best)
+    return np.array(chosen, dtype=np.int64)
+
+
+def fetch_rows(cat, selected, catalogue_dir):
+    """Read the selected manifest lines by byte offset; fails if a manifest changed since indexing."""
+    index = load_index(catalogue_dir)
+    rows = {}
+    for m in np.unique(cat["manifest"][selected]):
+        manifest = str(cat["manifests"][m])
+        st = os.stat(manifest)
+        entry = index.get(manifest)
+        if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime:
+            raise RuntimeError(f"{manifest} changed since the catalogue was built; rerun build_catalogue.py")
+        idx = selected[cat["manifest"][selected] == m]
+        with open(manifest, "rb") as f:
+            for i in idx[np.argsort(cat["line_pos"][idx])]:
+                f.seek(int(cat["line_pos"][i]))
+                rows[int(i)] = json.loads(f.readline())
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample an exact hour budget from the segment catalogue, stratified.")
+    parser.add_argument("--catalogue-dir", required=True, help="Output dir of build_catalogue.py")
+    parser.add_argument("--hours", type=float, required=True, help="Total audio to sample (h)")
+    parser.add_argument("--out", required=True, help="Sampled manifest (JSONL)")
+    parser.add_argument("--stratify", default="channel", help=f"Comma-separated subset of {','.join(STRATA)}")
+    parser.add_argument("--allocation", choices=["proportional", "equal"], default="proportional",
+                        help="Share the budget by stratum size or equally")
+    parser.add_argument("--duration-buckets", default="0,2,5,10,20,30", help="Bucket edges (s) for --stratify duration")
+    parser.add_argument("--channels", default=None, help="Comma-separated channels to sample from (default: all)")
+    parser.add_argument("--modes", default=None, help="Comma-separated modes to sample from (default: all)")
+    parser.add_argument("--countries", default=None, help="Comma-separated countries to sample from (default: all)")
+    parser.add_argument("--min-duration", type=float, default=0.0, help="Skip segments shorter than this (s)")
+    parser.add_argument("--max-duration", type=float, default=float("inf"), help="Skip segments longer than this (s)")
+    parser.add_argument("--no-digits", action="store_true", help="Skip transcripts containing digits")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Earlier sample manifests whose segments are skipped")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    strata = [s.strip() for s in args.stratify.split(",") if s.strip()]
+    unknown = set(strata) - set(STRATA)
+    if unknown:
+        raise ValueError(f"Unknown strata {sorted(unknown)}; choose from {STRATA}")
+
+    cat = load_catalogue(args.catalogue_dir)
+    if not len(cat["offset"]):
+        raise FileNotFoundError(f"Empty or missing catalogue in {args.catalogue_dir}; run build_catalogue.py first")
+
+    # === Candidate rows ===
+    mask = (cat["duration"] >= args.min_duration) & (cat["duration"] <= args.max_duration)
+    for column, values in (("channel", args.channels), ("mode", args.modes), ("country", args.countries)):
+        if values:
+            wanted = np.flatnonzero(np.isin(cat[CODED[column]], values.split(",")))
+            mask &= np.isin(cat[column], wanted)
+    if args.no_digits:
+        mask &= ~cat["has_digit"]
+    if args.exclude:
+        mask &= ~excluded_mask(cat, args.exclude)
+    candidates = np.flatnonzero(mask)
+
+    edges = np.array([float(e) for e in args.duration_buckets.split(",")])
+    bucket = np.clip(np.digitize(cat["duration"], edges) - 1, 0, len(edges) - 1)
+    columns = {"channel": cat["channel"], "mode": cat["mode"], "country": cat["country"], "duration": bucket}
+    if strata:
+        keys = np.stack([columns[s][candidates].astype(np.int64) for s in strata], axis=1)
+        _, stratum = np.unique(keys, axis=0, return_inverse=True)
+        stratum = stratum.reshape(-1)
+    else:
+        stratum = np.zeros(len(candidates), dtype=np.int64)
+    n_strata = int(stratum.max()) + 1 if len(stratum) else 0
+
+    durations = cat["duration"][candidates].astype(np.float64)
+    sizes = np.bincount(stratum, weights=durations, minlength=n_strata)
+    budget = args.hours * 3600
+    if budget > sizes.sum():
+        print(f"Only {sizes.sum() / 3600:.2f} h match the filters; taking all of it")
+    quotas = allocate(budget, sizes, args.allocation)
+
+    # === Draw ===
+    rng = np.random.default_rng(args.seed)
+    selected, report = [], []
+    # strata of long segments first: whatever they cannot fill is carried over to shorter ones
+    mean_duration = sizes / np.maximum(np.bincount(stratum, minlength=n_strata), 1)
+    carry = 0.0
+    for s in np.argsort(-mean_duration, kind="stable"):
+        members = np.flatnonzero(stratum == s)
+        quota = min(quotas[s] + carry, sizes[s])
+        picked = members[draw(durations[members], quota, rng)]
+        carry = quota - durations[picked].sum()
+        selected.append(candidates[picked])
+        first = candidates[members[0]]
+        label = []
+        for name in strata:
+            if name == "duration":
+                hi = edges[bucket[first] + 1] if bucket[first] + 1 < len(edges) else float("inf")
+                label.append(f"{edges[bucket[first]]:g}-{hi:g}s")
+            else:
+                label.append(str(cat[CODED[name]][cat[name][first]]))
+        report.append(("/".join(label) or "all", len(picked), durations[picked].sum(), sizes[s]))
+    selected = np.sort(np.concatenate(selected)) if selected else np.empty(0, dtype=np.int64)
+
+    # === Write ===
+    rows = fetch_rows(cat, selected, args.catalogue_dir)
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for i in selected:
+            ex = rows[int(i)]
+            f.write(json.dumps({
+                "audio_filepath": ex["audio_filepath"], "audio_start_sec": ex["audio_start_sec"],
+                "duration": ex["duration"], "text": ex["text"],
+                "channel": str(cat["channels"][cat["channel"][i]]), "mode": str(cat["modes"][cat["mode"][i]]),
+                "country": str(cat["countries"][cat["country"][i]]),
+            }, ensure_ascii=False) + "\n")
+    os.replace(tmp, out)
+
+    for label, n, seconds, available in sorted(report):
+        print(f"{label:<40} {n:>7} segments {seconds / 3600:8.3f} h  (of {available / 3600:.2f} h)")
+    total = cat["duration"][selected].sum(dtype=np.float64)
+    print(f"Sampled {len(selected)} segments, {total / 3600:.3f} h (target {args.hours:g} h) -> {out}")
+
+
+if __name__ == "__main__":
+    main()
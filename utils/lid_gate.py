@@ -0,0 +1,182 @@
+"""
+Language-ID gate between transcription (conv_asr.pbs) and forced alignment (align.pbs).
+
+Language filtering otherwise happens only in filter.pbs, after every
+Whisper transcript has been force-aligned on a GPU. This gate scores each
+corpus/*.txt with fastText (lid.176.bin, loaded once per worker process):
+every line is predicted in one bulk call, and the file's target share is the
+character-weighted probability mass of the target languages. Files below
+--min-target-ratio are taken out of corpus/ before alignment.
+
+Layout (as written by conv_asr.pbs):
+    WORK_ROOT/<mode>/<channel>/batch_NNN/corpus/<video>.txt + <video>.wav
+
+Per batch:
+    --mode move   move every file of a rejected video to batch_NNN/corpus_lid_rejected/ (default)
+    --mode list   report only: leave corpus/ untouched and write batch_NNN/lid_rejected.txt
+                  (align.pbs aligns the whole corpus/, so nothing is skipped in this mode)
+    batch_NNN/lid_report.json   kept / rejected files, detected languages, audio hours saved
+
+Example usage:
+python lid_gate.py --work-root /scratch/users/ntu/daniel02/GigaSpeech2/id/work/mono/Idntimes \
+    --lid-model /scratch/users/ntu/daniel02/GigaSpeech2/models/lid.176.bin --langs id,ms
+python lid_gate.py --work-root ... --langs en --mode list --min-target-ratio 0.6
+"""
+
+import argparse
+import json
+import os
+import shutil
+import wave
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fasttext
+
+LABEL_PREFIX = "__label__"
+REJECTED_DIR = "corpus_lid_rejected"
+
+_model = None
+
+
+def init_worker(model_path):
+    global _model
+    fasttext.FastText.eprint = lambda *args, **kwargs: None  # silence the load_model deprecation warning
+    _model = fasttext.load_model(model_path)
+
+
+def score_file(txt_file, langs, top_k):
+    """(target share, top language, number of lines) for one transcript."""
+    lines = [line.strip() for line in Path(txt_file).read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not lines:
+        return None, None, 0
+
+    labels, probs = _model.predict(lines, k=top_k)
+    target_mass = 0.0
+    lang_mass = Counter()
+    total_chars = 0
+    for line, line_labels, line_probs in zip(lines, labels, probs):
+        weight = len(line)
+        total_chars += weight
+        for label, prob in zip(line_labels, line_probs):
+            lang = label[len(LABEL_PREFIX):]
+            lang_mass[lang] += weight * float(prob)
+            if lang in langs:
+                target_mass += weight * float(prob)
+    return target_mass / total_chars, lang_mass.most_common(1)[0][0], len(lines)
+
+
+def score_files(txt_files, langs, top_k):
+    """Worker task: score a chunk of transcripts with the already-loaded model."""
+    return [(str(f),) + score_file(f, langs, top_k) for f in txt_files]
+
+
+def audio_seconds(corpus, stem):
+    wav = corpus / f"{stem}.wav"
+    if not wav.exists():
+        return 0.0
+    with wave.open(str(wav), "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+
+def gate_batch(corpus, scores, args):
+    """Apply the decision to one corpus dir and write its report; returns (kept, rejected, seconds saved)."""
+    batch_dir = corpus.parent
+    kept, rejected = [], []
+    for txt_file, ratio, top_lang, n_lines in sorted(scores):
+        stem = Path(txt_file).stem
+        row = {"file": Path(txt_file).name, "top_lang": top_lang, "target_ratio": None if ratio is None else round(ratio, 3),
+               "lines": n_lines}
+        if ratio is not None and ratio < args.min_target_ratio:
+            row["audio_seconds"] = round(audio_seconds(corpus, stem), 2)
+            rejected.append(row)
+        else:
+            kept.append(row)
+
+    if args.mode == "move" and rejected:
+        out_dir = batch_dir / REJECTED_DIR
+        out_dir.mkdir(exist_ok=True)
+        for row in rejected:
+            for f in corpus.glob(f"{Path(row['file']).stem}.*"):
+                shutil.move(str(f), out_dir / f.name)
+    elif args.mode == "list":
+        with open(batch_dir / "lid_rejected.txt", "w", encoding="utf-8") as f:
+            for row in rejected:
+                f.write(str(corpus / row["file"]) + "\n")
+
+    # videos moved out by an earlier run are not rescored; keep them in the report
+    report_file = batch_dir / "lid_report.json"
+    if args.mode == "move" and report_file.exists():
+        previous = json.loads(report_file.read_text(encoding="utf-8"))
+        current = {row["file"] for row in rejected}
+        rejected += [row for row in previous.get("rejected_files", [])
+                     if row["file"] not in current and (batch_dir / REJECTED_DIR / row["file"]).exists()]
+
+    saved = sum(row["audio_seconds"] for row in rejected)
+    report = {
+        "corpus": str(corpus),
+        "langs": sorted(args.langs),
+        "min_target_ratio": args.min_target_ratio,
+        "mode": args.mode,
+        "kept": len(kept),
+        "rejected": len(rejected),
+        "audio_hours_saved": round(saved / 3600, 3),
+        "rejected_files": rejected,
+        "kept_files": kept,
+    }
+    tmp = batch_dir / "lid_report.json.tmp"
+    tmp.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, report_file)
+    return len(kept), len(rejected), saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop non-target-language transcripts before forced alignment.")
+    parser.add_argument("--work-root", required=True, help="Channel work dir (batch_*/corpus) or any parent of it")
+    parser.add_argument("--lid-model", required=True, help="Path to fastText lid.176.bin")
+    parser.add_argument("--langs", required=True, help="Comma-separated target languages, e.g. id,ms or en")
+    parser.add_argument("--min-target-ratio", type=float, default=0.5,
+                        help="Minimum character-weighted share of target-language text to keep a file")
+    parser.add_argument("--top-k", type=int, default=3, help="Languages per line taken into account")
+    parser.add_argument("--mode", choices=["move", "list"], default="move",
+                        help="move = move rejected videos out of corpus/ so align.pbs skips them; "
+                             "list = report only, write lid_rejected.txt (align.pbs still aligns them)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Transcripts per worker task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+    args.langs = {lang.strip() for lang in args.langs.split(",") if lang.strip()}
+
+    work_root = Path(args.work_root).resolve()
+    corpora = sorted(work_root.glob("**/corpus"))
+    if not corpora:
+        raise FileNotFoundError(f"No corpus directories under {work_root}")
+
+    jobs = []
+    for corpus in corpora:
+        txt_files = sorted(corpus.glob("*.txt"))
+        for i in range(0, len(txt_files), args.chunk_size):
+            jobs.append((corpus, txt_files[i:i + args.chunk_size]))
+    print(f"Scoring {sum(len(files) for _, files in jobs)} transcripts in {len(corpora)} corpus dirs")
+
+    scores = {corpus: [] for corpus in corpora}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.lid_model,)) as pool:
+        futures = [(corpus, pool.submit(score_files, files, args.langs, args.top_k)) for corpus, files in jobs]
+        for corpus, fut in futures:
+            scores[corpus].extend(fut.result())
+
+    total_kept = total_rejected = 0
+    total_saved = 0.0
+    for corpus in corpora:
+        kept, rejected, saved = gate_batch(corpus, scores[corpus], args)
+        total_kept += kept
+        total_rejected += rejected
+        total_saved += saved
+        print(f"{corpus.parent.relative_to(work_root.parent)}: kept {kept}, rejected {rejected} "
+              f"({saved / 3600:.2f} h of alignment saved)")
+
+    print(f"Total: kept {total_kept}, rejected {total_rejected}, {total_saved / 3600:.2f} audio hours saved")
+
+
+if __name__ == "__main__":
+    main()
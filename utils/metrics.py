@@ -0,0 +1,220 @@
+"""
+Lightweight run metrics shared by the crawler, Granary and export scripts.
+
+Records are appended as JSON lines to a metrics file:
+    {"type": "stage", "stage": "download", "seconds": 812.4, ...}        whole stage
+    {"type": "item",  "stage": "slice", "id": "<video>", "seconds": 3.1,
+     "audio_seconds_decoded": 1804.2, "segments": 412, ...}               one video / source / file
+    {"type": "summary", "wall_seconds": ..., "audio_hours_per_wall_hour": ..., ...}
+
+Counters are added with metrics.count(name, value) inside a stage() or item()
+block, so deep helpers (decoders, writers) can report without passing state
+around. Standard counters: bytes_downloaded, audio_seconds_decoded,
+audio_seconds_written, segments; any other numeric field is totalled as
+well (videos, pairs, words, ...). close() aggregates every record of the run,
+including those written by pool worker processes, derives throughput and
+optionally writes a Prometheus textfile (node_exporter textfile collector).
+
+Disabled unless a metrics file is given (setup(path=...) or METRICS_FILE);
+when enabled the cost is two perf_counter() calls and one buffered line per
+stage/item. Settings are passed to pool workers through the environment.
+
+Profiling: profile="download,decode" (or METRICS_PROFILE, or "all") wraps
+those stage() blocks in cProfile and dumps <metrics file>.<stage>.<pid>.prof.
+
+Example usage:
+    from metrics import get_metrics, setup
+
+    metrics = setup("slice_granary", path="metrics.jsonl")
+    with metrics.stage("cut"):
+        with get_metrics().item("cut", src.name):
+            get_metrics().count("segments", n)
+    metrics.close(prometheus="slice_granary.prom")
+"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+ENV_FILE = "METRICS_FILE"
+ENV_RUN = "METRICS_RUN_ID"
+ENV_SCRIPT = "METRICS_SCRIPT"
+ENV_PROFILE = "METRICS_PROFILE"
+
+COUNTERS = ("bytes_downloaded", "audio_seconds_decoded", "audio_seconds_written", "segments")
+RESERVED = {"seconds", "pid", "ts"}
+
+
+class Metrics:
+    def __init__(self, path=None, run_id=None, script=None, profile=""):
+        self.path = str(path) if path else None
+        self.enabled = self.path is not None
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.script = script
+        self.profile = {p.strip() for p in (profile or "").split(",") if p.strip()}
+        self.pid = os.getpid()
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profilers = {}
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1) if self.enabled else None
+
+    def _write(self, record):
+        record.update(run=self.run_id, script=self.script, pid=os.getpid(), ts=round(time.time(), 3))
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def count(self, name, value=1):
+        """Add value to counter `name` of the innermost open stage/item in this thread."""
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1][name] = stack[-1].get(name, 0) + value
+        else:
+            self._write({"type": "count", name: value})
+
+    @contextmanager
+    def _record(self, kind, fields, profile_name=None):
+        if not self.enabled:
+            yield fields
+            return
+        profiler = None
+        wanted = profile_name and (profile_name in self.profile or "all" in self.profile)
+        if wanted and not getattr(self._local, "profiling", False):  # one profiler per thread
+            profiler = self._profilers.setdefault(profile_name, cProfile.Profile())
+            profiler.enable()
+            self._local.profiling = True
+        stack = self._stack()
+        stack.append(fields)
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+                profiler.dump_stats(f"{self.path}.{profile_name}.{os.getpid()}.prof")
+            self._write(dict(fields, type=kind, seconds=round(seconds, 4)))
+
+    def stage(self, name, **fields):
+        """Time a whole stage; counters added inside land on this record."""
+        return self._record("stage", dict(fields, stage=name), profile_name=name)
+
+    def item(self, stage, item_id, **fields):
+        """Time one unit of work (video, source file, manifest) within a stage."""
+        return self._record("item", dict(fields, stage=stage, id=str(item_id)))
+
+    def summarise(self):
+        """Aggregate every record of this run (all processes) into totals and throughput."""
+        wall = time.time() - self.start
+        totals = defaultdict(float)
+        stages = defaultdict(float)
+        items = defaultdict(int)
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec.get("run") != self.run_id:
+                    continue
+                if rec["type"] == "summary":
+                    continue
+                for name, value in rec.items():
+                    if name not in RESERVED and isinstance(value, (int, float)) and not isinstance(value, bool):
+                        totals[name] += value
+                if rec["type"] == "stage":
+                    stages[rec["stage"]] += rec["seconds"]
+                elif rec["type"] == "item":
+                    items[rec["stage"]] += 1
+
+        audio_seconds = max(totals["audio_seconds_decoded"], totals["audio_seconds_written"])
+        return {
+            "type": "summary",
+            "wall_seconds": round(wall, 3),
+            **{name: round(totals[name], 3) for name in COUNTERS},
+            "counters": {k: round(v, 3) for k, v in totals.items() if k not in COUNTERS},
+            "stage_seconds": {k: round(v, 3) for k, v in stages.items()},
+            "items": dict(items),
+            "audio_hours_per_wall_hour": round(audio_seconds / wall, 3) if wall else 0.0,
+            "segments_per_second": round(totals["segments"] / wall, 3) if wall else 0.0,
+            "download_mb_per_second": round(totals["bytes_downloaded"] / 1e6 / wall, 3) if wall else 0.0,
+        }
+
+    def close(self, prometheus=None):
+        """Write the summary record (and Prometheus textfile); returns the summary or None if disabled."""
+        if not self.enabled:
+            return None
+        self._file.flush()
+        summary = self.summarise()
+        self._write(dict(summary))
+        self._file.close()
+        if prometheus:
+            write_prometheus(prometheus, self.script, summary)
+        print(f"Metrics: {json.dumps({k: v for k, v in summary.items() if k != 'type'})}")
+        return summary
+
+
+def write_prometheus(path, script, summary):
+    label = f'script="{script}"'
+    lines = [f"asr_run_wall_seconds{{{label}}} {summary['wall_seconds']}"]
+    for name in COUNTERS:
+        lines.append(f"asr_{name}_total{{{label}}} {summary[name]}")
+    for name in ("audio_hours_per_wall_hour", "segments_per_second", "download_mb_per_second"):
+        lines.append(f"asr_{name}{{{label}}} {summary[name]}")
+    for name, value in summary["counters"].items():
+        lines.append(f"asr_{name}_total{{{label}}} {value}")
+    for stage, seconds in summary["stage_seconds"].items():
+        lines.append(f'asr_stage_seconds{{{label},stage="{stage}"}} {seconds}')
+    for stage, n in summary["items"].items():
+        lines.append(f'asr_items_total{{{label},stage="{stage}"}} {n}')
+    lines.append(f"asr_run_last_completed_timestamp{{{label}}} {int(time.time())}")
+
+    # textfile collector reads *.prom: write-then-rename so it never sees a partial file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+_current = None
+
+
+def setup(script, path=None, profile=None):
+    """
+    Configure metrics for this run in the main process. Pool workers (fork or
+    spawn) pick up the same file and run id through the environment.
+    """
+    global _current
+    path = path or os.environ.get(ENV_FILE)
+    profile = profile if profile is not None else os.environ.get(ENV_PROFILE, "")
+    run_id = uuid.uuid4().hex[:12]
+    if path:
+        os.environ.update({ENV_FILE: str(path), ENV_RUN: run_id, ENV_SCRIPT: script, ENV_PROFILE: profile})
+    _current = Metrics(path, run_id=run_id, script=script, profile=profile)
+    return _current
+
+
+def get_metrics():
+    """The process-wide Metrics; created from the environment in pool workers, disabled if unset."""
+    global _current
+    if _current is None or _current.pid != os.getpid():
+        _current = Metrics(
+            os.environ.get(ENV_FILE),
+            run_id=os.environ.get(ENV_RUN),
+            script=os.environ.get(ENV_SCRIPT),
+            profile=os.environ.get(ENV_PROFILE, ""),
+        )
+    return _current
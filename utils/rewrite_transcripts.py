@@ -0,0 +1,104 @@
+"""
+Single-pass transcript rewrite pipeline for corpus .txt files.
+
+Applies an ordered chain of rules to every .txt file with one read and at
+most one write per file (temp file + rename), across a process pool, and
+reports how many lines each rule took in and gave out. It replaces running
+granary/split_manifest.py and utils/normalise_digits.py one after another.
+
+Rules (applied in the order given to --rules):
+    split_punctuation   split text into one sentence per line on . ! ?  (split_manifest.py)
+    remove_digit_lines  drop lines containing any digit                  (normalise_digits.py)
+
+New rules are plain functions list[str] -> list[str] registered in RULES.
+
+Example usage:
+python rewrite_transcripts.py --corpus-dir /scratch/users/ntu/daniel02/Granary/gsp2_prep/clips \
+    --rules split_punctuation,remove_digit_lines
+"""
+
+import argparse
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Split on punctuation marks followed by whitespace or end of line
+SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
+NUM_PATTERN = re.compile(r"\d")
+
+
+def split_punctuation(lines):
+    text = "\n".join(lines).strip()
+    sentences = [s.strip() for s in SPLIT_PATTERN.split(text) if s.strip()]
+    if not sentences:
+        return lines
+    # a "sentence" may still span several original lines; keep them as separate lines
+    return "\n".join(sentences).split("\n")
+
+
+def remove_digit_lines(lines):
+    return [line for line in lines if not NUM_PATTERN.search(line)]
+
+
+RULES = {
+    "split_punctuation": split_punctuation,
+    "remove_digit_lines": remove_digit_lines,
+}
+
+
+def rewrite_file(txt_file, rule_names):
+    """Apply the rule chain to one file; returns per-rule (lines in, lines out) counts."""
+    txt_file = Path(txt_file)
+    original = txt_file.read_text(encoding="utf-8")
+    lines = original.splitlines()
+
+    counts = Counter()
+    if original.strip():
+        for name in rule_names:
+            counts[f"{name}.in"] += len(lines)
+            lines = RULES[name](lines)
+            counts[f"{name}.out"] += len(lines)
+
+    new_text = "\n".join(lines) + "\n"
+    if original.strip() and new_text != original:
+        tmp = txt_file.with_name(txt_file.name + ".tmp")
+        tmp.write_text(new_text, encoding="utf-8")
+        os.replace(tmp, txt_file)
+        counts["files_rewritten"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply an ordered chain of transcript rules in one pass per file.")
+    parser.add_argument("--corpus-dir", required=True, help="Path to corpus directory containing .wav and .txt pairs")
+    parser.add_argument("--rules", default="split_punctuation,remove_digit_lines",
+                        help=f"Comma-separated rules in order; available: {', '.join(RULES)}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel processes")
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus_dir).resolve()
+    if not corpus_dir.exists():
+        raise FileNotFoundError(f"Corpus directory not found: {corpus_dir}")
+
+    rule_names = [r.strip() for r in args.rules.split(",") if r.strip()]
+    unknown = [r for r in rule_names if r not in RULES]
+    if unknown:
+        raise ValueError(f"Unknown rules: {unknown}; available: {list(RULES)}")
+
+    txt_files = [str(p) for p in corpus_dir.glob("*.txt")]
+    print(f"Found {len(txt_files)} text files in {corpus_dir}")
+
+    totals = Counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for counts in pool.map(rewrite_file, txt_files, [rule_names] * len(txt_files), chunksize=256):
+            totals.update(counts)
+
+    for name in rule_names:
+        print(f"{name}: {totals[f'{name}.in']} lines in -> {totals[f'{name}.out']} lines out")
+    print(f"Rewrote {totals['files_rewritten']} of {len(txt_files)} files.")
+
+
+if __name__ == "__main__":
+    main()